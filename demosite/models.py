@@ -1,5 +1,6 @@
 from django.db import models
-from gcharts import GChartsManager
+from django.db.models import Sum
+from gcharts import GChartsManager, Rollup
 
 
 class GeoData(models.Model):
@@ -20,7 +21,9 @@ class OtherData(models.Model):
     A model which contains some other random data
     """
 
-    objects = GChartsManager()
+    # The charts of the demo site are read from the daily sums per name
+    objects = GChartsManager(rollups=[Rollup(("date", "name"), {"number1_sum": Sum("number1"),
+                                                               "number2_sum": Sum("number2")})])
 
     name = models.CharField(max_length=20)
     number1 = models.IntegerField()
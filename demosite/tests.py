@@ -1,16 +1,38 @@
-"""
-This file demonstrates writing tests using the unittest module. These will pass
-when you run "manage.py test".
+from django.test import TransactionTestCase
 
-Replace this with more appropriate tests for your application.
-"""
+from demosite import views
+from gcharts import BatchTimeout
+from gcharts.tests.base import FIXTURES
 
-from django.test import TestCase
 
-
-class SimpleTest(TestCase):
-    def test_basic_addition(self):
+class HomeTest(TransactionTestCase):
+    # The charts are read by the threads of gcharts.batch(), which
+    # only see committed data
+    fixtures = FIXTURES
+    
+    def test_home(self):
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "googlecharts.push(", count=8)
+        self.assertNotContains(response, "could not be loaded")
+    
+    def test_failed_chart(self):
         """
-        Tests that 1 + 1 always equals 2.
+        The charts which succeeded are rendered, and the ones which
+        failed or timed out are replaced by a message.
         """
-        self.assertEqual(1 + 1, 2)
+        def failing_batch(charts, timeout=None):
+            outputs = batch(charts, timeout)
+            outputs["pie_data"] = BatchTimeout("pie_data")
+            outputs["geo_data"] = ValueError("spam")
+            return outputs
+        batch = views.batch
+        views.batch = failing_batch
+        try:
+            response = self.client.get("/")
+        finally:
+            views.batch = batch
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "googlecharts.push(", count=6)
+        self.assertContains(response, "could not be loaded", count=2)
+        self.assertNotContains(response, 'container = "pie_chart"')
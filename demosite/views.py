@@ -5,6 +5,7 @@ from django.shortcuts import render_to_response
 from demosite.models import GeoData, OtherData
 from django.template.context import RequestContext
 from django.db.models.aggregates import Sum
+from gcharts import batch
 
 
 def home(request):
@@ -16,42 +17,62 @@ def home(request):
         # GeoChart demo
         geo_qset = GeoData.objects.order_by("-population").all()[:100]
         geo_data = geo_qset.values("country_name", "population", "fertility_rate") \
-                    .to_json(labels={"country_name": "Country",
-                                     "population": "Population",
-                                     "fertility_rate": "Birth rate"},
-                             formatting={"population": "{0:d} millions",
-                                         "fertility_rate": "{0:.3f}"},
-                             order=("country_name", "population", "fertility_rate"))
+                    .spec("to_json", labels={"country_name": "Country",
+                                             "population": "Population",
+                                             "fertility_rate": "Birth rate"},
+                          formatting={"population": "{0:d} millions",
+                                      "fertility_rate": "{0:.3f}"},
+                          order=("country_name", "population", "fertility_rate"))
         
         # AreaChart
         area_series_age = datetime.today() - relativedelta(months=1)
         area_qset = OtherData.objects.filter(date__gte=area_series_age) \
-                        .values("date").annotate(Sum("number1")) \
-                        .annotate(Sum("number2")).order_by()
-        area_data = area_qset.order_by("-date").to_json(order=("date", "number1__sum",
-                                                               "number2__sum"),
-                                                        labels={"number1__sum": "A number",
-                                                                "number2__sum": "Another number"})
+                        .timeseries("date", "day", aggregates={"number1__sum": Sum("number1"),
+                                                               "number2__sum": Sum("number2")},
+                                    fill=0)
+        area_data = area_qset.order_by("-date__day").spec("to_json", order=("date__day", "number1__sum",
+                                                                            "number2__sum"),
+                                                          labels={"number1__sum": "A number",
+                                                                  "number2__sum": "Another number"})
+        
+        # LineChart, one line per name
+        line_qset = OtherData.objects.filter(date__gte=area_series_age) \
+                        .pivot("date", "name", Sum("number1"))
+        line_data = line_qset.spec("to_json")
         
         # PieChart
         pie_qset = OtherData.objects.values("name").annotate(Sum("number1")).order_by()
-        pie_data = pie_qset.order_by("name").to_json(order=("name", "number1__sum"),
-                             formatting={"number1__sum": "{0:d} Sum total"})
-        
-        # You get the idea....
-        bar_data = line_data = column_data = combo_data = area_data
+        pie_data = pie_qset.order_by("name").spec("to_json", order=("name", "number1__sum"),
+                                                  formatting={"number1__sum": "{0:d} Sum total"})
         
         # Table
         table_series_age = datetime.today() - relativedelta(months=3)
         table_qset = OtherData.objects.filter(date__gte=table_series_age) \
-                .values("date").annotate(num_baked=Sum("number1")) \
-                .annotate(num_eaten=Sum("number2")).order_by("-date")
-        table_data = table_qset.to_json(labels={"date": "Date",
-                                         "num_baked": "Rat cakes baked",
-                                         "num_eaten": "Rat cakes eaten"},
-                                 order=("date", "num_baked", "num_eaten"),
-                                 formatting={"num_baked": "{0:d} Kg",
-                                             "num_eaten": "{0:d} Kg"})
+                .timeseries("date", "week", aggregates={"num_baked": Sum("number1"),
+                                                        "num_eaten": Sum("number2")},
+                            fill=0).order_by("-date__week")
+        table_data = table_qset.spec("to_json", labels={"date__week": "Week",
+                                                        "num_baked": "Rat cakes baked",
+                                                        "num_eaten": "Rat cakes eaten"},
+                                     order=("date__week", "num_baked", "num_eaten"),
+                                     formatting={"num_baked": "{0:d} Kg",
+                                                 "num_eaten": "{0:d} Kg"})
+        
+        # Run the queries concurrently
+        charts = batch({"geo_data": geo_data, "area_data": area_data, "line_data": line_data,
+                        "pie_data": pie_data, "table_data": table_data}, timeout=10)
+        for name, value in charts.items():
+            # Charts which failed or timed out are returned as their
+            # exceptions, which batch() has logged. Leave those out,
+            # the page shows a message in their place.
+            if isinstance(value, Exception):
+                charts[name] = None
+        geo_data, area_data, line_data, pie_data, table_data = \
+            charts["geo_data"], charts["area_data"], charts["line_data"], charts["pie_data"], \
+            charts["table_data"]
+        
+        # You get the idea....
+        bar_data = column_data = combo_data = area_data
         
     return render_to_response("home.html", locals(),
                               context_instance=RequestContext(request))
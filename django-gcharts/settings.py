@@ -20,6 +20,8 @@ DATABASES = {
         'PASSWORD': '',                  # Not used with sqlite3.
         'HOST': '',                      # Set to empty string for localhost. Not used with sqlite3.
         'PORT': '',                      # Set to empty string for default. Not used with sqlite3.
+        # A file, so the threads of gcharts.batch() can share the test database
+        'TEST_NAME': os.path.join(PROJECT_PATH, "test_demosite.db"),
     }
 }
 
@@ -163,4 +165,5 @@ LOGGING = {
 # django-gcharts settings
 GOOGLECHARTS_API = '1.1'
 GOOGLECHARTS_PACKAGES = ["corechart", "gauge", "geochart", "table", "treemap"]
+GOOGLECHARTS_JSON_BACKEND = "json"
 
@@ -1,4 +1,5 @@
 from django.conf.urls import patterns, include, url
+from demosite.models import OtherData
 
 # Uncomment the next two lines to enable the admin:
 # from django.contrib import admin
@@ -15,5 +16,7 @@ urlpatterns = patterns('',
     # Uncomment the next line to enable the admin:
     # url(r'^admin/', include(admin.site.urls)),
     
-    url(r"^$", "demosite.views.home", name="home")
+    url(r"^$", "demosite.views.home", name="home"),
+    url(r"^datasource/$", "gcharts.views.datasource", {"queryset": OtherData.objects.all()},
+        name="datasource"),
 )
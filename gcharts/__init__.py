@@ -1,21 +1,35 @@
 # -*- coding: utf-8 -*-
 
+import datetime
+import functools
+import inspect
 import logging
+from collections import OrderedDict
 
-from django.db import models
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, models
+from django.db.models import Q, signals
 from django.db.models.query import QuerySet, ValuesQuerySet, ValuesListQuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
 from django.utils import six
+from django.utils.functional import cached_property
+from django.utils.importlib import import_module
 
-
-try:
-    import gviz_api
-except ImportError:
-    from gcharts.contrib import gviz_api
+from gcharts import cache, downsampling, pivot, rollups, timeseries
+from gcharts.batching import BatchTimeout, batch
+from gcharts.contrib import gviz_api
+from gcharts.cursors import chunked, green_switch
+from gcharts.rollups import Rollup
 
 
 class _GChartsConfig(object):
     
     logger = None
+    json_backend = None
+    cache = None
+    pubsub = None
     
     @classmethod
     def get_logger(cls):
@@ -34,35 +48,420 @@ class _GChartsConfig(object):
             cls.logger.addHandler(NullHandler())
 
         return cls.logger
+    
+    @classmethod
+    def get_json_backend(cls):
+        """
+        Instantiate and return the JSON backend configured by
+        GOOGLECHARTS_JSON_BACKEND in settings.py.
+        Falls back to the standard library json module if the
+        library of the configured backend is not installed.
+        """
+        if cls.json_backend is None:
+            name = getattr(settings, "GOOGLECHARTS_JSON_BACKEND", "json")
+            if name not in gviz_api.JSON_BACKENDS:
+                raise ImproperlyConfigured("%s is not a valid JSON backend. Valid backends are %s"
+                                           % (name, ", ".join(sorted(gviz_api.JSON_BACKENDS))))
+            try:
+                cls.json_backend = gviz_api.JSON_BACKENDS[name]()
+            except ImportError:
+                cls.get_logger().warning("JSON backend '%s' is not installed, falling back to 'json'." % name)
+                cls.json_backend = gviz_api.JSONBackend()
+        
+        return cls.json_backend
+    
+    @classmethod
+    def get_chunk_size(cls):
+        """
+        Return the number of rows read from the database at a time
+        when serializing, configured by GOOGLECHARTS_CHUNK_SIZE in
+        settings.py.
+        """
+        return getattr(settings, "GOOGLECHARTS_CHUNK_SIZE", 2000)
+    
+    @classmethod
+    def get_green_switch(cls):
+        """
+        Return a function which lets other green threads run,
+        for the green thread library configured by
+        GOOGLECHARTS_GREEN_THREADS in settings.py, or None.
+        """
+        return green_switch(getattr(settings, "GOOGLECHARTS_GREEN_THREADS", None))
+    
+    @classmethod
+    def get_cache(cls):
+        """
+        Instantiate and return the cache backend configured by
+        GOOGLECHARTS_CACHE in settings.py, which is the name of
+        one of the caches in CACHES.
+        """
+        if cls.cache is None:
+            cls.cache = get_cache(getattr(settings, "GOOGLECHARTS_CACHE", "default"))
+        
+        return cls.cache
+    
+    @classmethod
+    def get_pubsub(cls):
+        """
+        Instantiate and return the publish/subscribe backend for
+        change notifications configured by GOOGLECHARTS_PUBSUB in
+        settings.py, which is the dotted path of its class.
+        """
+        if cls.pubsub is None:
+            path = getattr(settings, "GOOGLECHARTS_PUBSUB", "gcharts.pubsub.LocalPubSub")
+            module, _, name = path.rpartition(".")
+            try:
+                backend = getattr(import_module(module), name)
+            except (ImportError, AttributeError, ValueError):
+                raise ImproperlyConfigured("%s is not a valid publish/subscribe backend" % path)
+            cls.pubsub = backend()
+        
+        return cls.pubsub
 
 # Global logger
 logger = _GChartsConfig.get_logger()
 
+# Javascript data types by model field type
+JAVASCRIPT_TYPES = {}
+for field_types, jstype in (
+        (("CharField", "CommaSeparatedIntegerField", "EmailField",
+          "FilePathField", "IPAddressField", "GenericIPAddressField",
+          "SlugField", "TextField", "URLField"), "string"),
+        (("AutoField", "DecimalField", "FloatField", "IntegerField",
+          "BigIntegerField", "PositiveIntegerField", "ForeignKey",
+          "PositiveSmallIntegerField", "SmallIntegerField"), "number"),
+        (("BooleanField", "NullBooleanField"), "boolean"),
+        (("DateField",), "date"),
+        (("DateTimeField",), "datetime"),
+        (("TimeField",), "timeofday")):
+    JAVASCRIPT_TYPES.update(dict.fromkeys(field_types, jstype))
+
+# Model fields by model, see model_fields()
+_model_fields = {}
+
+# Resolved table descriptions, see GChartsQuerySet.table_description()
+_table_descriptions = {}
+TABLE_DESCRIPTION_CACHE_SIZE = 1000
+
+
+def model_fields(model):
+    """
+    Return a dict mapping the names of the fields of model to
+    (field, javascript type) tuples. The javascript type is
+    None for fields which can't be charted.
+    
+    The dict is built once per model, when the model class
+    is prepared.
+    """
+    fields = _model_fields.get(model)
+    if fields is None:
+        fields = {}
+        for field in model._meta.fields + model._meta.many_to_many:
+            fields[field.name] = (field, JAVASCRIPT_TYPES.get(field.get_internal_type()))
+        _model_fields[model] = fields
+    return fields
+
+
+def _prepare_model_fields(sender, **kwargs):
+    _model_fields.pop(sender, None)
+    model_fields(sender)
+
+signals.class_prepared.connect(_prepare_model_fields)
+
+# Formatted values memoized per class of value, see compile_formatting()
+FORMATTING_CACHE_SIZE = 1000
+
+# Classes of values which are formatted the same whenever they compare equal
+_MEMOIZED_CLASSES = (bool, type(None), datetime.date, six.binary_type, six.text_type) + six.integer_types
+
+
+def compile_formatting(frmt):
+    """
+    Compile the string.format() compatible expression frmt
+    into a function which returns the formatted value of a
+    single value.
+    
+    Formatted values are memoized, so repeated values in a
+    column are only formatted once. The memo holds the
+    FORMATTING_CACHE_SIZE most recently used values of each
+    class in a generation, and drops the oldest generation
+    when a new one is full.
+    """
+    format = frmt.format
+    memos = dict((cls, [{}, {}]) for cls in _MEMOIZED_CLASSES)
+    
+    def formatter(value):
+        memo = memos.get(value.__class__)
+        if memo is None:
+            return format(value)
+        recent = memo[0]
+        formatted = recent.get(value)
+        if formatted is None:
+            formatted = memo[1].get(value)
+            if formatted is None:
+                formatted = format(value)
+            if len(recent) >= FORMATTING_CACHE_SIZE:
+                memo[1] = recent
+                memo[0] = recent = {}
+            recent[value] = formatted
+        return formatted
+    
+    return formatter
+
+
+def invalidate_cache(model):
+    """
+    Invalidate all chart output cached by GChartsQuerySet.cache()
+    which is read from the tables of model.
+    
+    This is done automatically when instances of models with a
+    GChartsManager are saved or deleted, and by the update() and
+    bulk_create() methods of GChartsQuerySet. Call it after
+    changing the tables in any other way, e.g. with raw SQL.
+    """
+    backend = _GChartsConfig.get_cache()
+    for m in [model] + list(model._meta.get_parent_list()):
+        cache.invalidate(backend, m._meta.db_table)
+
+
+def _invalidate_cache(sender, **kwargs):
+    invalidate_cache(sender)
+
+
+def notify_changes(model):
+    """
+    Notify the subscribers to the tables of model that rows were
+    changed, like the charts streamed by gcharts.views.stream.
+    
+    This is done automatically when instances of models with a
+    GChartsManager are saved or deleted, and by the update() and
+    bulk_create() methods of GChartsQuerySet. Call it after
+    changing the tables in any other way, e.g. with raw SQL.
+    """
+    backend = _GChartsConfig.get_pubsub()
+    for m in [model] + list(model._meta.get_parent_list()):
+        backend.publish(m._meta.db_table)
+
+
+def _notify_changes(sender, **kwargs):
+    notify_changes(sender)
+
+
+def _watermark_q(field, watermark, tie_break, past):
+    """
+    Return a Q object selecting the rows past watermark, or the
+    rows up to it if past is False, see GChartsQuerySet.since().
+    Watermarks of fields with a tie break are "value,pk".
+    """
+    pk = None
+    if tie_break and "," in watermark:
+        watermark, pk = watermark.rsplit(",", 1)
+    if pk is None:
+        return Q(**{"%s__%s" % (field, past and "gt" or "lte"): watermark})
+    if past:
+        return Q(**{"%s__gt" % field: watermark}) | Q(**{field: watermark, "pk__gt": pk})
+    return Q(**{"%s__lt" % field: watermark}) | Q(**{field: watermark, "pk__lte": pk})
+
+
+def cached_output(method):
+    """
+    Decorator for the output methods of GChartsQuerySet, which
+    serves their output from the cache if the QuerySet is cached,
+    see GChartsQuerySet.cache().
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._cache_options is None:
+            return method(self, *args, **kwargs)
+        return cache.decompress(self._cached_payload(method, args, kwargs))
+    
+    wrapper.cached_output = method
+    return wrapper
+
+
+class GChartsResult(object):
+    """
+    The data of a QuerySet, loaded into a gviz_api.DataTable,
+    as returned by GChartsQuerySet.to_datatable().
+    
+    Every output format is serialized from the same DataTable
+    the first time it is asked for, and kept for later use, so
+    the same data can be offered in several formats with a single
+    database query.
+    """
+    def __init__(self, data_table, order=None, order_by=()):
+        self.data_table = data_table
+        self.order = order
+        self.order_by = order_by
+        self._outputs = {}
+    
+    def _output(self, key, serialize, *args, **kwargs):
+        if key not in self._outputs:
+            self._outputs[key] = serialize(columns_order=self.order, order_by=self.order_by,
+                                           *args, **kwargs)
+        return self._outputs[key]
+    
+    @cached_property
+    def json(self):
+        return self.data_table.ToJSon(columns_order=self.order, order_by=self.order_by)
+    
+    @cached_property
+    def columnar_json(self):
+        return self.data_table.ToJSonColumnar(columns_order=self.order, order_by=self.order_by)
+    
+    @cached_property
+    def html(self):
+        return self.data_table.ToHtml(columns_order=self.order, order_by=self.order_by)
+    
+    @cached_property
+    def csv(self):
+        return self.data_table.ToCsv(columns_order=self.order, order_by=self.order_by)
+    
+    @cached_property
+    def tsv_excel(self):
+        return self.data_table.ToTsvExcel(columns_order=self.order, order_by=self.order_by)
+    
+    def javascript(self, name, compact=False):
+        """
+        Return the data as javascript code creating a DataTable
+        named name, see GChartsQuerySet.to_javascript().
+        """
+        return self._output(("javascript", name, compact), self.data_table.ToJSCode,
+                            name=name, compact=compact)
+    
+    def json_response(self, req_id=0, handler="google.visualization.Query.setResponse", sig=None):
+        """
+        Return the data as a JSON response to a Google
+        Visualization API query, see
+        GChartsQuerySet.to_json_response().
+        """
+        return gviz_api.DataTable.JSonResponse(self.json, req_id, handler, sig)
+    
+    def response(self, tqx=""):
+        """
+        Return the response to a Google Visualization API query
+        with the tqx request parameter tqx, in the output format
+        it asks for.
+        """
+        tqx_dict = gviz_api.DataTable.ParseTqx(tqx)
+        if tqx_dict["version"] != "0.6":
+            raise gviz_api.DataTableException("Version (%s) passed by request is not supported."
+                                              % tqx_dict["version"])
+        out = tqx_dict["out"]
+        if out == "json":
+            return self.json_response(tqx_dict["reqId"], tqx_dict["responseHandler"], tqx_dict["sig"])
+        elif out == "html":
+            return self.html
+        elif out == "csv":
+            return self.csv
+        elif out == "tsv-excel":
+            return self.tsv_excel
+        raise gviz_api.DataTableException("'out' parameter: '%s' is not supported" % out)
+
 
 class GChartsManager(models.Manager):
+    """
+    Manager returning GChartsQuerySets.
+    
+    kwargs:
+        rollups: Iterable of Rollups, summary tables of the model
+                which charts are read from when they can, see
+                gcharts.rollups.Rollup.
+    """
+    def __init__(self, rollups=()):
+        super(GChartsManager, self).__init__()
+        self.rollups = tuple(rollups)
+    
+    def contribute_to_class(self, model, name):
+        super(GChartsManager, self).contribute_to_class(model, name)
+        signals.post_save.connect(_invalidate_cache, sender=model)
+        signals.post_delete.connect(_invalidate_cache, sender=model)
+        signals.post_save.connect(_notify_changes, sender=model)
+        signals.post_delete.connect(_notify_changes, sender=model)
+        rollups.register(model, self.rollups)
     
     def get_query_set(self):
         return GChartsQuerySet(self.model, using=self._db)
     
-    def to_javascript(self, name, order=None, labels=None, formatting=None, properties=None):
-        return self.get_query_set().to_javascript(name, order, labels, formatting, properties)
+    def trusted(self):
+        return self.get_query_set().trusted()
+    
+    def chunked(self, chunk_size):
+        return self.get_query_set().chunked(chunk_size)
+    
+    def cache(self, timeout=None, key=None):
+        return self.get_query_set().cache(timeout, key)
+    
+    def downsample(self, max_points):
+        return self.get_query_set().downsample(max_points)
+    
+    def timeseries(self, field, interval="day", aggregates=None, fill=None):
+        return self.get_query_set().timeseries(field, interval, aggregates, fill)
+    
+    def pivot(self, index, columns, values, max_columns=100):
+        return self.get_query_set().pivot(index, columns, values, max_columns)
+    
+    def spec(self, method, *args, **kwargs):
+        return self.get_query_set().spec(method, *args, **kwargs)
     
-    def to_html(self, order=None, labels=None, formatting=None, properties=None):
-        return self.get_query_set().to_html(order, labels, formatting, properties)
+    def since(self, field, watermark=None):
+        return self.get_query_set().since(field, watermark)
     
-    def to_csv(self, order=None, labels=None, formatting=None, properties=None, separator=","):
-        return self.get_query_set().to_csv(order, labels, formatting, properties, separator)
+    def to_javascript(self, name, order=None, labels=None, formatting=None, properties=None,
+                      compact=False, order_by=None):
+        return self.get_query_set().to_javascript(name, order, labels, formatting, properties,
+                                                  compact, order_by)
     
-    def to_tsv_excel(self, order=None, labels=None, formatting=None, properties=None):
-        return self.get_query_set().to_tsv_excel(order, labels, formatting, properties)
+    def to_html(self, order=None, labels=None, formatting=None, properties=None, order_by=None):
+        return self.get_query_set().to_html(order, labels, formatting, properties, order_by)
     
-    def to_json(self, order=None, labels=None, formatting=None, properties=None):
-        return self.get_query_set().to_json(order, labels, formatting, properties)
+    def to_csv(self, order=None, labels=None, formatting=None, properties=None, separator=",",
+               order_by=None):
+        return self.get_query_set().to_csv(order, labels, formatting, properties, separator,
+                                           order_by)
+    
+    def to_tsv_excel(self, order=None, labels=None, formatting=None, properties=None, order_by=None):
+        return self.get_query_set().to_tsv_excel(order, labels, formatting, properties, order_by)
+    
+    def to_json(self, order=None, labels=None, formatting=None, properties=None, order_by=None,
+                format="json"):
+        return self.get_query_set().to_json(order, labels, formatting, properties, order_by, format)
     
     def to_json_response(self, order=None, labels=None, formatting=None, properties=None,
-                         req_id=0, handler="google.visualization.Query.setResponse"):
+                         req_id=0, handler="google.visualization.Query.setResponse", order_by=None,
+                         sig=None):
         return self.get_query_set().to_json_response(order, labels, formatting, properties,
-                                                     req_id, handler)
+                                                     req_id, handler, order_by, sig)
+    
+    def to_datatable(self, order=None, labels=None, formatting=None, properties=None, order_by=None):
+        return self.get_query_set().to_datatable(order, labels, formatting, properties, order_by)
+    
+    def to_javascript_stream(self, name, order=None, labels=None, formatting=None, properties=None,
+                             order_by=None):
+        return self.get_query_set().to_javascript_stream(name, order, labels, formatting, properties,
+                                                         order_by)
+    
+    def to_html_stream(self, order=None, labels=None, formatting=None, properties=None, order_by=None):
+        return self.get_query_set().to_html_stream(order, labels, formatting, properties, order_by)
+    
+    def to_csv_stream(self, order=None, labels=None, formatting=None, properties=None, separator=",",
+                      order_by=None):
+        return self.get_query_set().to_csv_stream(order, labels, formatting, properties, separator,
+                                                  order_by)
+    
+    def to_tsv_excel_stream(self, order=None, labels=None, formatting=None, properties=None,
+                            order_by=None):
+        return self.get_query_set().to_tsv_excel_stream(order, labels, formatting, properties,
+                                                        order_by)
+    
+    def to_json_stream(self, order=None, labels=None, formatting=None, properties=None, order_by=None):
+        return self.get_query_set().to_json_stream(order, labels, formatting, properties, order_by)
+    
+    def to_json_response_stream(self, order=None, labels=None, formatting=None, properties=None,
+                                req_id=0, handler="google.visualization.Query.setResponse",
+                                order_by=None):
+        return self.get_query_set().to_json_response_stream(order, labels, formatting, properties,
+                                                            req_id, handler, order_by)
     
 
 class GChartsQuerySet(QuerySet):
@@ -70,8 +469,302 @@ class GChartsQuerySet(QuerySet):
     A QuerySet which returns google charts compatible data
     output
     """
+    # Options of the output, set by the chainable methods below
+    _OPTIONS = ("_trusted", "_chunk_size", "_cache_options", "_max_points", "_timeseries", "_pivot")
+    
     def __init__(self, *args, **kwargs):
         super(GChartsQuerySet, self).__init__(*args, **kwargs)
+        self._trusted = False
+        self._chunk_size = None
+        self._cache_options = None
+        self._max_points = None
+        self._timeseries = None
+        self._pivot = None
+        # Arguments of filter() and exclude(), see _rolled_up()
+        self._filters = ()
+    
+    def _clone(self, klass=None, setup=False, **kwargs):
+        c = super(GChartsQuerySet, self)._clone(klass, setup, **kwargs)
+        for option in self._OPTIONS:
+            setattr(c, option, getattr(self, option))
+        c._filters = self._filters
+        return c
+    
+    def _filter_or_exclude(self, negate, *args, **kwargs):
+        c = super(GChartsQuerySet, self)._filter_or_exclude(negate, *args, **kwargs)
+        c._filters = self._filters + ((negate, args, kwargs),)
+        return c
+    
+    def _rolled_up(self):
+        """
+        Return a QuerySet reading the same data as this QuerySet
+        from the first rollup of the model which has it, or this
+        QuerySet if none of them has.
+        """
+        for rollup in rollups.rollups_for(self.model):
+            routed = rollup.route(self, GChartsQuerySet(rollup.model, using=self.db))
+            if routed is not None:
+                for option in self._OPTIONS:
+                    setattr(routed, option, getattr(self, option))
+                return routed
+        return self
+    
+    def trusted(self):
+        """
+        Return a new QuerySet which skips per cell type validation
+        when serializing.
+        
+        The column types are resolved from the model fields by
+        table_description(), and the database driver already
+        guarantees that the values are of those types, so checking
+        every single cell is wasted work. Extra fields are typed by
+        hand in the labels, and are always validated.
+        """
+        c = self._clone()
+        c._trusted = True
+        return c
+    
+    def chunked(self, chunk_size):
+        """
+        Return a new QuerySet which reads chunk_size rows at a
+        time from the database when serializing, instead of the
+        GOOGLECHARTS_CHUNK_SIZE from settings.py.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer")
+        c = self._clone()
+        c._chunk_size = chunk_size
+        return c
+    
+    def cache(self, timeout=None, key=None):
+        """
+        Return a new QuerySet which caches the output of its
+        output methods in the cache backend configured by
+        GOOGLECHARTS_CACHE in settings.py. The output is stored
+        gzip compressed, see gzipped().
+        
+        The output is cached by the SQL query and the arguments of
+        the output method, and is invalidated when the tables read
+        by the query are changed through a model with a
+        GChartsManager, see invalidate_cache(). The streaming
+        output methods are never cached.
+        
+        kwargs:
+            timeout: Number of seconds to cache the output for.
+                    Defaults to the timeout of the cache backend.
+            key:    Key identifying the query, used instead of the
+                    SQL query, e.g. for queries which filter on the
+                    current time.
+        """
+        c = self._clone()
+        c._cache_options = {"timeout": timeout, "key": key}
+        return c
+    
+    def downsample(self, max_points):
+        """
+        Return a new QuerySet whose output methods return at most
+        max_points rows, for line and area charts of long series.
+        
+        The rows are downsampled with the Largest-Triangle-Three-
+        Buckets algorithm, in a single pass over the rows, keeping
+        the rows which best preserve the shape of the numeric
+        series. The first and the last row are always kept. The
+        x axis is the first column of the output, and the rows
+        are ordered by it unless the QuerySet is already ordered.
+        """
+        if max_points < 3:
+            raise ValueError("max_points must be at least 3")
+        c = self._clone()
+        c._max_points = max_points
+        return c
+    
+    def timeseries(self, field, interval="day", aggregates=None, fill=None):
+        """
+        Return a new QuerySet with one row per interval of the
+        date or datetime field, holding the aggregates of the rows
+        in that interval.
+        
+        The dates are truncated to the start of their interval,
+        and the rows are grouped and aggregated by the database.
+        The truncated dates are in a column named after the field
+        and the interval, e.g. date__week, like the default names
+        of aggregates. Intervals without rows, between the first
+        and the last interval, are filled in while the rows are
+        serialized, so there is a row for every interval. Weeks
+        start on Mondays, and datetimes are truncated in the time
+        zone of the database, i.e. UTC if USE_TZ is True.
+        
+        kwargs:
+            field:  Name of a date or datetime field of the model.
+            interval: "hour", "day", "week", "month" or "year".
+            aggregates: Dictionary mapping {'alias': aggregate}, as
+                    passed to annotate(), e.g. {'eaten': Sum('number2')}.
+            fill:   Value of the aggregates in the intervals filled
+                    in, e.g. 0 for sums and counts. Defaults to None,
+                    which leaves the cells empty.
+        """
+        if interval not in timeseries.INTERVALS:
+            raise ValueError("%s is not a valid interval. Valid intervals are %s"
+                             % (interval, ", ".join(timeseries.INTERVALS)))
+        model_field, field_jstype = model_fields(self.model).get(field, (None, None))
+        if field_jstype not in ("date", "datetime"):
+            raise ValueError("%s is not a date or datetime field" % field)
+        if not aggregates:
+            raise ValueError("aggregates must contain at least one aggregate")
+        connection = connections[self.db]
+        column = "%s.%s" % (connection.ops.quote_name(model_field.model._meta.db_table),
+                            connection.ops.quote_name(model_field.column))
+        alias = "%s__%s" % (field, interval)
+        c = self.extra(select={alias: timeseries.truncate_sql(connection, interval, column)}) \
+                .values(alias).annotate(**aggregates).order_by(alias)
+        c._timeseries = {"field": field, "alias": alias, "interval": interval, "fill": fill}
+        return c
+    
+    def pivot(self, index, columns, values, max_columns=100):
+        """
+        Return a new QuerySet with one row per value of the field
+        index, and one column per distinct value of the field
+        columns, holding the aggregate values of the rows with
+        those values, e.g. one line per name in a LineChart:
+            qset.pivot("date", "name", Sum("number1"))
+        
+        The rows are grouped and aggregated in a single query, and
+        pivoted in a single pass while they are serialized. The
+        distinct values of columns are read by a separate query
+        first, to describe the columns. They are labeled by their
+        values, or by the labels given for them. Cells without
+        rows are empty.
+        
+        kwargs:
+            index:  Name of the field of the rows, and the first
+                    column of the output.
+            columns: Name of the field whose distinct values become
+                    the other columns of the output.
+            values: Aggregate of the cells, e.g. Sum("number1").
+            max_columns: Maximum number of distinct values of
+                    columns. An exception is raised when the data
+                    has more of them.
+        """
+        if self._pivot is not None or self._timeseries is not None:
+            raise ValueError("Pivoted QuerySets and time series can't be pivoted")
+        alias = values.default_alias
+        c = self.values(index, columns).annotate(**{alias: values}).order_by(index)
+        c._pivot = {"index": index, "columns": columns, "alias": alias, "max_columns": max_columns}
+        return c
+    
+    def gzipped(self, method, *args, **kwargs):
+        """
+        Return the output of the output method named method,
+        called with args and kwargs, gzip compressed. The output
+        of a cached QuerySet is returned as it is stored in the
+        cache, without compressing it again, so it can be served
+        as it is with a Content-Encoding: gzip header. Text output
+        is UTF-8 encoded.
+        """
+        output = getattr(type(self), method, None)
+        if getattr(output, "cached_output", None) is None:
+            raise ValueError("%s is not a cacheable output method" % method)
+        if self._cache_options is None:
+            return cache.compress(output(self, *args, **kwargs))[1]
+        return self._cached_payload(output.cached_output, args, kwargs)[1]
+    
+    def _cached_payload(self, method, args, kwargs):
+        """
+        Return the compressed output of method from the cache,
+        calling method and caching its output on a miss.
+        """
+        backend = _GChartsConfig.get_cache()
+        callargs = inspect.getcallargs(method, self, *args, **kwargs)
+        del callargs["self"]
+        query_key = self._cache_options["key"]
+        tables = [self.model._meta.db_table]
+        if query_key is None:
+            query = self.query.clone()
+            try:
+                query_key = query.get_compiler(self.db).as_sql()
+            except EmptyResultSet:
+                query_key = "EmptyResultSet"
+            tables.extend(join.table_name for join in six.itervalues(query.alias_map))
+        entry_key = cache.output_key(backend, [query_key, self._max_points, self._timeseries, self._pivot],
+                                     self.db, method.__name__, callargs, sorted(set(tables)))
+        payload = backend.get(entry_key)
+        if payload is None:
+            payload = cache.compress(method(self, *args, **kwargs))
+            backend.set(entry_key, payload, self._cache_options["timeout"])
+        return payload
+    
+    def spec(self, method, *args, **kwargs):
+        """
+        Does _not_ return a new QuerySet.
+        Return a callable which calls the output method named
+        method with args and kwargs, to pass to gcharts.batch(),
+        e.g. qset.spec("to_json", labels={"name": "Name"})
+        
+        Streaming output methods can't be batched, since they
+        run their query when the output is read.
+        """
+        output = getattr(self, method, None)
+        if not method.startswith("to_") or method.endswith("_stream") or not callable(output):
+            raise ValueError("%s is not an output method which can be batched" % method)
+        return functools.partial(output, *args, **kwargs)
+    
+    def since(self, field, watermark=None):
+        """
+        Does _not_ return a new QuerySet.
+        Return a tuple (qset, watermark) of a QuerySet of the rows
+        past watermark, and the new watermark, which is the greatest
+        value of field in them. Pass the new watermark to the next
+        call to get only the rows added since.
+        
+        Rows with the same value of field are told apart by their
+        primary key, which is part of the watermark, so rows added
+        later with the same value, e.g. the same date, are still
+        returned by the next call. The rows are bounded by the new
+        watermark, so rows added while they are read are left for
+        the next call. Watermarks are returned as strings, dates in
+        ISO 8601 format.
+        
+        kwargs:
+            field:  Name of a field which never decreases as rows
+                    are added, e.g. "pk" or a creation date.
+            watermark: Watermark returned by an earlier call, or
+                    None to get all the rows.
+        """
+        tie_break = field not in ("pk", self.model._meta.pk.name)
+        qset = self
+        if watermark is not None:
+            qset = qset.filter(_watermark_q(field, watermark, tie_break, past=True))
+        # Not aggregate(), which returns nothing for values() QuerySets
+        if tie_break:
+            current = list(qset.order_by("-%s" % field, "-pk").values_list(field, "pk")[:1])
+        else:
+            current = list(qset.order_by("-%s" % field).values_list(field)[:1])
+        if not current:
+            if watermark is not None:
+                qset = qset.filter(_watermark_q(field, watermark, tie_break, past=False))
+            return qset, watermark
+        current = ",".join(value.isoformat() if isinstance(value, (datetime.date, datetime.time))
+                           else six.text_type(value) for value in current[0])
+        return qset.filter(_watermark_q(field, current, tie_break, past=False)), current
+    
+    def update(self, **kwargs):
+        groups = [(rollup, rollup.keys(self)) for rollup in rollups.rollups_for(self.model)
+                  if any(name in kwargs for name in rollup.fields)]
+        rows = super(GChartsQuerySet, self).update(**kwargs)
+        for rollup, keys in groups:
+            rollup.updated(self.db, keys, kwargs)
+        invalidate_cache(self.model)
+        notify_changes(self.model)
+        return rows
+    update.alters_data = True
+    
+    def bulk_create(self, objs, batch_size=None):
+        objs = super(GChartsQuerySet, self).bulk_create(objs, batch_size)
+        for rollup in rollups.rollups_for(self.model):
+            rollup.apply(self.db, [(rollup.values(obj), 1) for obj in objs])
+        invalidate_cache(self.model)
+        notify_changes(self.model)
+        return objs
 
     @staticmethod
     def javascript_field(field):
@@ -79,24 +772,11 @@ class GChartsQuerySet(QuerySet):
         Return the javascript data type for
         field
         """
-        fields = {
-            ("CharField", "CommaSeparatedIntegerField", "EmailField",
-             "FilePathField", "IPAddressField", "GenericIPAddressField",
-             "SlugField", "TextField", "URLField"): "string",
-            ("AutoField", "DecimalField", "FloatField", "IntegerField",
-             "BigIntegerField", "PositiveIntegerField", "ForeignKey",
-             "PositiveSmallIntegerField", "SmallIntegerField"): "number",
-            ("BooleanField", "NullBooleanField"): "boolean",
-            ("DateField"): "date",
-            ("DateTimeField"): "datetime",
-            ("TimeField"): "timeofday",
-        }
-        
-        for k, v in six.iteritems(fields):
-            if field.get_internal_type() in k:
-                return v
-        # Should never hit this
-        raise KeyError("%s is not a valid field" % field)
+        try:
+            return JAVASCRIPT_TYPES[field.get_internal_type()]
+        except KeyError:
+            # Should never hit this
+            raise KeyError("%s is not a valid field" % field)
     
     def formatting(self, fields, formatting):
         """
@@ -106,28 +786,102 @@ class GChartsQuerySet(QuerySet):
         
         http://docs.python.org/library/string.html#string-formatting
         """
-        if not isinstance(formatting, dict):
-            raise Exception("formatting must be a dict")
-        for row in self.values(*fields):
-            for field, frmt in six.iteritems(formatting):
+        return self._format_rows(self.values(*fields), formatting)
+    
+    def _format_rows(self, rows, formatting):
+        """
+        Apply formatting to an iterable of row dicts.
+        """
+        formatters = list(six.iteritems(self._formatters(formatting)))
+        for row in rows:
+            for field, formatter in formatters:
                 val = row[field]
-                frmt_val = frmt.format(val)
-                row.update({field: (val, frmt_val)})
+                row[field] = (val, formatter(val))
             yield row
+    
+    def _formatters(self, formatting):
+        """
+        Return a dict of compiled formatters by field for formatting.
+        """
+        if not isinstance(formatting, dict):
+            raise Exception("formatting must be a dict")
+        return dict((field, compile_formatting(frmt)) for field, frmt in six.iteritems(formatting))
         
     def table_description(self, labels=None):
         """
         Return table description for QuerySet.
+        
+        The description only depends on the model, the selected
+        fields, the aggregates, the extra fields and the labels,
+        so it is resolved once per process for every combination
+        of those, and looked up from a cache after that. The
+        description of a pivoted QuerySet depends on its data, and
+        is resolved every time.
+        """
+        if self._pivot is not None:
+            return self._pivot_table_description(labels)
+        labels = dict(labels or {})
+        
+        aggregates = None
+        if getattr(self, "aggregate_names", None) is not None:
+            aggregates = tuple((alias, self.javascript_field(aggregate_expr.field))
+                               for alias, aggregate_expr in six.iteritems(self.query.aggregates))
+        extra = None
+        if getattr(self, "extra_names", None) is not None:
+            extra = tuple(self.query.extra)
+        try:
+            key = (self.model, tuple(getattr(self, "_fields", ("*",))), aggregates, extra,
+                   self._timeseries is not None,
+                   frozenset((k, tuple(v.items()) if isinstance(v, dict) else v)
+                             for k, v in six.iteritems(labels)))
+            table_description = _table_descriptions.get(key)
+        except TypeError:
+            # unhashable labels, don't cache
+            key = table_description = None
+        
+        if table_description is None:
+            table_description = self._resolve_table_description(labels, aggregates)
+            if key is not None:
+                if len(_table_descriptions) >= TABLE_DESCRIPTION_CACHE_SIZE:
+                    _table_descriptions.clear()
+                _table_descriptions[key] = table_description
+        return OrderedDict(table_description)
+    
+    def _pivot_table_description(self, labels=None):
+        """
+        Return the table description of a pivoted QuerySet, the
+        index followed by the pivoted columns in the order of
+        their values.
+        """
+        labels = dict(labels or {})
+        index, columns, alias = self._pivot["index"], self._pivot["columns"], self._pivot["alias"]
+        max_columns = self._pivot["max_columns"]
+        grouped = self._clone()
+        grouped._pivot = None
+        descr = grouped.table_description(labels)
+        
+        values = list(grouped.order_by(columns).values_list(columns, flat=True).distinct()[:max_columns + 1])
+        if len(values) > max_columns:
+            raise Exception("Can't pivot more than %d distinct values of %s." % (max_columns, columns))
+        table_description = OrderedDict([(index, descr[index])])
+        for value in values:
+            column = pivot.column_id(value)
+            if column in table_description:
+                raise Exception("The pivoted column %s has the same name as the index." % column)
+            table_description[column] = (descr[alias][0], labels.get(column, column))
+        return table_description
+    
+    def _resolve_table_description(self, labels, aggregates):
         """
-        table_description = {}
-        labels = labels or {}
+        Resolve the table description for table_description().
+        labels is consumed.
+        """
+        table_description = OrderedDict()
         
         # resolve aggregates
-        aggregates = getattr(self, "aggregate_names", None)
         if aggregates is not None:
-            for alias, aggregate_expr in six.iteritems(self.query.aggregates):
+            for alias, field_jstype in aggregates:
                 label = labels.pop(alias, alias)
-                field_jstype = self.javascript_field(aggregate_expr.field)
                 table_description.update({alias: (field_jstype, label)})
         
         # resolve extra fields
@@ -136,12 +890,18 @@ class GChartsQuerySet(QuerySet):
         extra = getattr(self, "extra_names", None)
         valid_jstypes = ("string", "number", "boolean", "date", "datetime", "timeofday")
         if extra is not None:
+            if self._timeseries is not None:
+                # the type of the truncated dates of timeseries() is known
+                alias = self._timeseries["alias"]
+                if not isinstance(labels.get(alias), dict):
+                    labels[alias] = {timeseries.javascript_type(self._timeseries["interval"]):
+                                     labels.get(alias, alias)}
             for alias in six.iterkeys(self.query.extra):
                 try:
                     descr = labels.pop(alias)
                     if not (isinstance(descr, dict) and len(descr) == 1):
                         raise Exception("Field description must be a dict and must contain exactly one element.")
-                    field_jstype, label = descr.popitem()
+                    field_jstype, label = list(descr.items())[0]
                     if field_jstype not in valid_jstypes:
                         raise Exception("Invalid javascript type. Valid types are %s." %
                                         ", ".join(valid_jstypes))
@@ -152,8 +912,12 @@ class GChartsQuerySet(QuerySet):
                         "labels={'extra_name': {'javascript type', 'label'}}" % alias
                     )
 
-        # resolve other fields of interest
-        fields = set(getattr(self, "_fields", [f.name for f in self.model._meta.fields]))
+        # resolve other fields of interest, keeping their order
+        # so the same QuerySet always gives the same output
+        fields = []
+        for f_name in getattr(self, "_fields", [f.name for f in self.model._meta.fields]):
+            if f_name not in fields:
+                fields.append(f_name)
         
         # remove fields that has already been
         # put in the table_description
@@ -163,14 +927,16 @@ class GChartsQuerySet(QuerySet):
                     fields.remove(f)
         clean_parsed_fields()
         
+        local_fields = model_fields(self.model)
         for f_name in fields:
             # local fields
-            if f_name in self.model._meta.get_all_field_names():
-                field = self.model._meta.get_field(f_name)
+            if f_name in local_fields:
+                field, field_jstype = local_fields[f_name]
+                if field_jstype is None:
+                    field_jstype = self.javascript_field(field)
                 if field.attname in labels:
                     labels[field.name] = labels.pop(field.attname)
                 label = labels.pop(field.name, field.name)
-                field_jstype = self.javascript_field(field)
                 table_description.update({field.name: (field_jstype, label)})
             else:
                 # lookup fields (with double underscore) left in fields set
@@ -181,9 +947,11 @@ class GChartsQuerySet(QuerySet):
                     field = self.model._meta.get_field(field)
                     relation = getattr(field, "related", None)
                     if relation is not None:
-                        rel_field = relation.parent_model._meta.get_field(rel_field)
+                        rel_field, rel_field_jstype = model_fields(relation.parent_model).get(rel_field) or \
+                            (relation.parent_model._meta.get_field(rel_field), None)
+                        if rel_field_jstype is None:
+                            rel_field_jstype = self.javascript_field(rel_field)
                         label = labels.pop(f_name, f_name)
-                        rel_field_jstype = self.javascript_field(rel_field)
                         table_description.update({f_name: (rel_field_jstype, label)})
         
         clean_parsed_fields()
@@ -192,6 +960,182 @@ class GChartsQuerySet(QuerySet):
                            ", ".join(fields))
         return table_description
         
+    def _data_table(self, table_descr, data=None, properties=None, formatting=None):
+        """
+        Return a gviz_api.DataTable for table_descr.
+        
+        The columns are described in the order of
+        _column_names(), which is the order of the row tuples
+        returned by _table_data(). formatting is compiled
+        into formatters, which the DataTable applies to the cells
+        as they are serialized.
+        """
+        formatters = None
+        if formatting is not None:
+            formatters = self._formatters(formatting)
+            for field in formatters:
+                if field not in table_descr:
+                    raise KeyError(field)
+        trusted = False
+        if self._trusted:
+            extra = self.query.extra or {}
+            trusted = [f for f in table_descr if f not in extra]
+        columns = [(f,) + tuple(table_descr[f]) for f in self._column_names(table_descr)]
+        return gviz_api.DataTable(columns, data, properties, trusted=trusted,
+                                  json_backend=_GChartsConfig.get_json_backend(),
+                                  formatters=formatters)
+    
+    def _sql_ordered(self, order_by=None):
+        """
+        Push order_by into the SQL query.
+        
+        Return a tuple (qset, order_by), where qset is a clone of
+        this QuerySet ordered by the database, and order_by is what
+        is left for the DataTable to sort in Python. That is the
+        case for sliced QuerySets, which can't be reordered, for
+        downsampled QuerySets, which are read in the order of their
+        x axis, for time series and pivoted QuerySets sorted by
+        anything else than their intervals or their index, and for
+        keys which are not columns of the QuerySet.
+        
+        The QuerySet is read from a rollup of the model if one of
+        them has its data, see _rolled_up().
+        """
+        qset = self._rolled_up()
+        if not order_by:
+            return qset, ()
+        sort_keys = gviz_api.DataTable.OrderByParser(order_by)
+        if (qset._timeseries is not None and sort_keys[0][0] != qset._timeseries["alias"] or
+                qset._pivot is not None and [key for key, asc_mult in sort_keys] != [qset._pivot["index"]]):
+            # the rows are read in the order of the intervals or the
+            # index to be filled in or pivoted, sort them after that
+            return qset, order_by
+        columns = qset._output_columns()
+        if any(key not in columns for key, asc_mult in sort_keys):
+            # ordering by anything but the columns would change the
+            # grouping of aggregates, or fail, leave it to the DataTable
+            return qset, order_by
+        if not qset.query.can_filter() or qset._max_points is not None:
+            # downsampled rows are read in the order of the x axis,
+            # and sorted after that
+            return qset, order_by
+        return qset.order_by(*[(asc_mult < 0 and "-" or "") + key
+                               for key, asc_mult in sort_keys]), ()
+    
+    def _output_columns(self):
+        """
+        Return the set of the names of the columns of the output,
+        the same as the ones of the table description.
+        """
+        columns = set(getattr(self, "_fields", None) or [f.name for f in self.model._meta.fields])
+        if getattr(self, "aggregate_names", None) is not None:
+            columns.update(self.query.aggregates)
+        if getattr(self, "extra_names", None) is not None:
+            columns.update(self.query.extra)
+        return columns
+    
+    def _column_names(self, table_descr):
+        """
+        Return the names of the columns of table_descr in the
+        order of the row tuples returned by _table_data().
+        """
+        if self._pivot is not None:
+            return list(table_descr)
+        return sorted(table_descr)
+    
+    def _ordered_by(self, qset, field):
+        """
+        Return a tuple (qset, descending), where qset is ordered
+        by field, and descending is True if it is in descending
+        order. Raise an exception if qset is ordered by anything
+        else, since the rows must be read in the order of field.
+        """
+        ordering = list(qset.query.order_by)
+        if not ordering and qset.query.can_filter():
+            qset = qset.order_by(field)
+            ordering = [field]
+        if not ordering or ordering[0].lstrip("-") != field:
+            raise Exception("The QuerySet must be ordered by %s, to read its rows in a single pass." % field)
+        return qset, ordering[0].startswith("-") == qset.query.standard_ordering
+    
+    def _table_data(self, table_descr, order=None):
+        """
+        Return an iterator over the rows of table_descr, with the
+        gaps between the intervals filled in if timeseries() was
+        called, or pivoted if pivot() was called. The rows are
+        downsampled if downsample() was called, with the intervals
+        or the index, or else the first column of order, as the
+        x axis.
+        
+        The rows are fetched by values_list() as tuples, which the
+        DataTable appends as they are instead of looking up every
+        cell in a dict. They are read from the database in chunks,
+        without filling the QuerySet result cache, so only one
+        chunk at a time is held in memory besides the DataTable.
+        Other green threads get to run between the chunks, if
+        GOOGLECHARTS_GREEN_THREADS is set.
+        """
+        fields = self._column_names(table_descr)
+        series = self._timeseries
+        if self._pivot is not None:
+            qset = self.values_list(self._pivot["index"], self._pivot["columns"], self._pivot["alias"])
+            qset, descending = self._ordered_by(qset, self._pivot["index"])
+            x = 0
+        else:
+            qset = self.values_list(*fields)
+            if series is not None:
+                qset, descending = self._ordered_by(qset, series["alias"])
+                x = fields.index(series["alias"])
+        if self._max_points is not None:
+            if series is None and self._pivot is None:
+                x = fields.index(order[0] if order else fields[0])
+                ordering = list(qset.query.order_by) or \
+                    (qset.query.default_ordering and list(qset.model._meta.ordering) or [])
+                if not ordering or ordering[0].lstrip("-") != fields[x]:
+                    # The points are picked from the rows in the order of x
+                    if not qset.query.can_filter():
+                        raise Exception("Sliced QuerySets must be ordered by %s before they are "
+                                        "downsampled." % fields[x])
+                    qset = qset.order_by(fields[x])
+            ys = [i for i, f in enumerate(fields)
+                  if i != x and table_descr[f][0] == "number" and (not order or f in order)]
+            count = None
+            if series is not None and qset.query.can_filter():
+                # The gaps are filled in before downsampling, so count
+                # the intervals from the first to the last one
+                bounds = [timeseries.bucket_value(row[x], series["interval"])
+                          for row in list(qset[:1]) + list(qset.reverse()[:1])]
+                if len(bounds) == 2 and None not in bounds:
+                    count = timeseries.bucket_count(bounds[0], bounds[1], series["interval"])
+            elif self._pivot is not None:
+                count = qset.values_list(self._pivot["index"]).distinct().count()
+            if count is None:
+                count = qset.count()
+        chunked(qset.query, self._chunk_size or _GChartsConfig.get_chunk_size(),
+                _GChartsConfig.get_green_switch())
+        data = qset.iterator()
+        if self._pivot is not None:
+            data = pivot.pivot_rows(data, dict((f, i) for i, f in enumerate(fields)), len(fields))
+        if series is not None:
+            data = timeseries.fill_gaps(data, x, series["interval"], series["fill"], descending)
+        if self._max_points is not None:
+            data = downsampling.lttb(data, count, self._max_points, x, ys)
+        return data
+    
+    def _stream_table(self, table_descr, formatting=None, properties=None, order_by=(), order=None):
+        """
+        Return a tuple (data_table, data) for the streaming output
+        methods, where data is an iterator over the rows to stream.
+        
+        If the rows must be sorted in Python, they are loaded into
+        data_table up front, and data is None.
+        """
+        data_table = self._data_table(table_descr, properties=properties, formatting=formatting)
+        if order_by:
+            data_table.LoadData(self._table_data(table_descr, order))
+            return data_table, None
+        return data_table, self._table_data(table_descr, order)
+    
     def values(self, *fields):
         return self._clone(klass=GChartsValuesQuerySet, setup=True, _fields=fields)
     
@@ -208,7 +1152,41 @@ class GChartsQuerySet(QuerySet):
     # These methods are just a convenient wrapper to the
     # methods in the gviz_api calls.
     #
-    def to_javascript(self, name, order=None, labels=None, formatting=None, properties=None):
+    def to_datatable(self, order=None, labels=None, formatting=None, properties=None, order_by=None):
+        """
+        Does _not_ return a new QuerySet.
+        Return QuerySet data as a GChartsResult, which serializes
+        it to any of the output formats on demand.
+        
+        The query is run and the DataTable is built only once,
+        however many output formats are asked for, e.g:
+            result = qset.to_datatable(labels={"name": "Name"})
+            result.json, result.csv, result.html
+        
+        kwargs:
+            order:  Iterable with field names in which the
+                    columns should be ordered. If columns order
+                    are specified, any field not specified will be
+                    discarded.
+            labels: Dictionary mapping {'field': 'label'}
+                    where field is the name of the field in model,
+                    and label is the desired label on the chart.
+            formatting: string.format() compatible expression.
+            properties: Dictionary with custom properties.
+            order_by: Column(s) to sort the rows by, as accepted by
+                    gviz_api, e.g. "field", ("field", "desc") or a
+                    list of such tuples. Sorting is done by the
+                    database, unless the QuerySet is sliced.
+        """
+        qset, order_by = self._sql_ordered(order_by)
+        table_descr = qset.table_description(labels)
+        data = qset._table_data(table_descr, order)
+        data_table = qset._data_table(table_descr, data, properties, formatting)
+        return GChartsResult(data_table, order, order_by)
+    
+    @cached_output
+    def to_javascript(self, name, order=None, labels=None, formatting=None, properties=None,
+                      compact=False, order_by=None):
         """
         Does _not_ return a new QuerySet.
         Return QuerySet data as javascript code string.
@@ -229,17 +1207,57 @@ class GChartsQuerySet(QuerySet):
                     and label is the desired label on the chart.
             formatting: string.format() compatible expression.
             properties: Dictionary with custom properties.
+            order_by: Column(s) to sort the rows by, as accepted by
+                    gviz_api, e.g. "field", ("field", "desc") or a
+                    list of such tuples. Sorting is done by the
+                    database, unless the QuerySet is sliced.
+            compact: If True, rows are added in batches with
+                    addRows([[...], ...]), and setCell() is only
+                    used for cells with formatted values, which
+                    gives a far smaller script.
         """
-        table_descr = self.table_description(labels)
-        fields = table_descr.keys()
-        if formatting is not None:
-            data = self.formatting(fields, formatting)
-        else:
-            data = self.values(*fields)
-        data_table = gviz_api.DataTable(table_descr, data, properties)
-        return data_table.ToJSCode(name=name, columns_order=order)
+        qset, order_by = self._sql_ordered(order_by)
+        table_descr = qset.table_description(labels)
+        data = qset._table_data(table_descr, order)
+        data_table = qset._data_table(table_descr, data, properties, formatting)
+        return data_table.ToJSCode(name=name, columns_order=order, order_by=order_by, compact=compact)
     
-    def to_html(self, order=None, labels=None, formatting=None, properties=None):
+    def to_javascript_stream(self, name, order=None, labels=None, formatting=None, properties=None,
+                             order_by=None):
+        """
+        Does _not_ return a new QuerySet.
+        Return QuerySet data as a generator of compact javascript
+        code chunks.
+        
+        Works like to_javascript(compact=True), but rows are read
+        from the database and serialized in batches, and the output
+        is yielded as UTF-8 encoded chunks, one per addRows()
+        statement.
+        
+        kwargs:
+            name:   Name of the variable which the data table
+                    is saved.
+            order:  Iterable with field names in which the
+                    columns should be ordered. If columns order
+                    are specified, any field not specified will be
+                    discarded.
+            labels: Dictionary mapping {'field': 'label'}
+                    where field is the name of the field in model,
+                    and label is the desired label on the chart.
+            formatting: string.format() compatible expression.
+            properties: Dictionary with custom properties.
+            order_by: Column(s) to sort the rows by, as accepted by
+                    gviz_api, e.g. "field", ("field", "desc") or a
+                    list of such tuples. Sorting is done by the
+                    database, unless the QuerySet is sliced.
+        """
+        qset, order_by = self._sql_ordered(order_by)
+        table_descr = qset.table_description(labels)
+        data_table, data = qset._stream_table(table_descr, formatting, properties, order_by, order)
+        return data_table.IterJSCode(name, columns_order=order, order_by=order_by, data=data)
+    
+    @cached_output
+    def to_html(self, order=None, labels=None, formatting=None, properties=None, order_by=None):
         """
         Does _not_ return a new QuerySet.
         Return QuerySet data as a html table code string.
@@ -254,17 +1272,20 @@ class GChartsQuerySet(QuerySet):
                     and label is the desired label on the chart.
             formatting: string.format() compatible expression.
             properties: Dictionary with custom properties.
+            order_by: Column(s) to sort the rows by, as accepted by
+                    gviz_api, e.g. "field", ("field", "desc") or a
+                    list of such tuples. Sorting is done by the
+                    database, unless the QuerySet is sliced.
         """
-        table_descr = self.table_description(labels)
-        fields = table_descr.keys()
-        if formatting is not None:
-            data = self.formatting(fields, formatting)
-        else:
-            data = self.values(*fields)
-        data_table = gviz_api.DataTable(table_descr, data, properties)
-        return data_table.ToHtml(columns_order=order)
+        qset, order_by = self._sql_ordered(order_by)
+        table_descr = qset.table_description(labels)
+        data = qset._table_data(table_descr, order)
+        data_table = qset._data_table(table_descr, data, properties, formatting)
+        return data_table.ToHtml(columns_order=order, order_by=order_by)
     
-    def to_csv(self, order=None, labels=None, formatting=None, properties=None, separator=","):
+    @cached_output
+    def to_csv(self, order=None, labels=None, formatting=None, properties=None, separator=",",
+               order_by=None):
         """
         Does _not_ return a new QuerySet.
         Return QuerySet data as a csv string.
@@ -285,17 +1306,19 @@ class GChartsQuerySet(QuerySet):
                     and label is the desired label on the chart.
             formatting: string.format() compatible expression.
             properties: Dictionary with custom properties.
+            order_by: Column(s) to sort the rows by, as accepted by
+                    gviz_api, e.g. "field", ("field", "desc") or a
+                    list of such tuples. Sorting is done by the
+                    database, unless the QuerySet is sliced.
         """
-        table_descr = self.table_description(labels)
-        fields = table_descr.keys()
-        if formatting is not None:
-            data = self.formatting(fields, formatting)
-        else:
-            data = self.values(*fields)
-        data_table = gviz_api.DataTable(table_descr, data, properties)
-        return data_table.ToCsv(columns_order=order, separator=separator)
+        qset, order_by = self._sql_ordered(order_by)
+        table_descr = qset.table_description(labels)
+        data = qset._table_data(table_descr, order)
+        data_table = qset._data_table(table_descr, data, properties, formatting)
+        return data_table.ToCsv(columns_order=order, order_by=order_by, separator=separator)
     
-    def to_tsv_excel(self, order=None, labels=None, formatting=None, properties=None):
+    @cached_output
+    def to_tsv_excel(self, order=None, labels=None, formatting=None, properties=None, order_by=None):
         """
         Does _not_ return a new QuerySet.
         Returns a file in tab-separated-format readable by MS Excel.
@@ -313,17 +1336,20 @@ class GChartsQuerySet(QuerySet):
                     and label is the desired label on the chart.
             formatting: string.format() compatible expression.
             properties: Dictionary with custom properties.
+            order_by: Column(s) to sort the rows by, as accepted by
+                    gviz_api, e.g. "field", ("field", "desc") or a
+                    list of such tuples. Sorting is done by the
+                    database, unless the QuerySet is sliced.
         """
-        table_descr = self.table_description(labels)
-        fields = table_descr.keys()
-        if formatting is not None:
-            data = self.formatting(fields, formatting)
-        else:
-            data = self.values(*fields)
-        data_table = gviz_api.DataTable(table_descr, data, properties)
-        return data_table.ToTsvExcel(columns_order=order)
+        qset, order_by = self._sql_ordered(order_by)
+        table_descr = qset.table_description(labels)
+        data = qset._table_data(table_descr, order)
+        data_table = qset._data_table(table_descr, data, properties, formatting)
+        return data_table.ToTsvExcel(columns_order=order, order_by=order_by)
     
-    def to_json(self, order=None, labels=None, formatting=None, properties=None):
+    @cached_output
+    def to_json(self, order=None, labels=None, formatting=None, properties=None, order_by=None,
+                format="json"):
         """
         Does _not_ return a new QuerySet.
         Return QuerySet data as json serialized string.
@@ -350,18 +1376,30 @@ class GChartsQuerySet(QuerySet):
                     and label is the desired label on the chart.
             formatting: string.format() compatible expression.
             properties: Dictionary with custom properties.
+            order_by: Column(s) to sort the rows by, as accepted by
+                    gviz_api, e.g. "field", ("field", "desc") or a
+                    list of such tuples. Sorting is done by the
+                    database, unless the QuerySet is sliced.
+            format: "json" for the standard DataTable JSON, or
+                    "columnar" for a compact column oriented format,
+                    which is a lot smaller for charts of numbers and
+                    dates. The {% gcharts %} template tag expands it
+                    into a DataTable in the browser.
         """
-        table_descr = self.table_description(labels)
-        fields = table_descr.keys()
-        if formatting is not None:
-            data = self.formatting(fields, formatting)
-        else:
-            data = self.values(*fields)
-        data_table = gviz_api.DataTable(table_descr, data, properties)
-        return data_table.ToJSon(columns_order=order)
+        if format not in ("json", "columnar"):
+            raise Exception("Invalid format. Valid formats are json, columnar.")
+        qset, order_by = self._sql_ordered(order_by)
+        table_descr = qset.table_description(labels)
+        data = qset._table_data(table_descr, order)
+        data_table = qset._data_table(table_descr, data, properties, formatting)
+        if format == "columnar":
+            return data_table.ToJSonColumnar(columns_order=order, order_by=order_by)
+        return data_table.ToJSon(columns_order=order, order_by=order_by)
     
+    @cached_output
     def to_json_response(self, order=None, labels=None, formatting=None, properties=None,
-                         req_id=0, handler="google.visualization.Query.setResponse"):
+                         req_id=0, handler="google.visualization.Query.setResponse", order_by=None,
+                         sig=None):
         """
         Does _not_ return a new QuerySet.
         Writes a table as a JSON response that can be returned as-is to a client.
@@ -384,15 +1422,186 @@ class GChartsQuerySet(QuerySet):
                     and label is the desired label on the chart.
             formatting: string.format() compatible expression.
             properties: Dictionary with custom properties.
+            order_by: Column(s) to sort the rows by, as accepted by
+                    gviz_api, e.g. "field", ("field", "desc") or a
+                    list of such tuples. Sorting is done by the
+                    database, unless the QuerySet is sliced.
+            sig:    Signature of the data the client already has,
+                    as retrieved by the request. If the data is
+                    unchanged, a tiny not_modified response is
+                    returned instead of the table.
         """
-        table_descr = self.table_description(labels)
-        fields = table_descr.keys()
-        if formatting is not None:
-            data = self.formatting(fields, formatting)
-        else:
-            data = self.values(*fields)
-        data_table = gviz_api.DataTable(table_descr, data, properties)
-        return data_table.ToJSonResponse(columns_order=order, req_id=req_id, response_handler=handler)
+        qset, order_by = self._sql_ordered(order_by)
+        table_descr = qset.table_description(labels)
+        data = qset._table_data(table_descr, order)
+        data_table = qset._data_table(table_descr, data, properties, formatting)
+        return data_table.ToJSonResponse(columns_order=order, order_by=order_by, req_id=req_id,
+                                        response_handler=handler, sig=sig)
+    
+    def to_html_stream(self, order=None, labels=None, formatting=None, properties=None, order_by=None):
+        """
+        Does _not_ return a new QuerySet.
+        Return QuerySet data as a generator of html table chunks.
+        
+        Works like to_html(), but rows are read from the database and
+        written in batches. The table head is yielded first, followed by
+        the table body in chunks of rows, all UTF-8 encoded. Passed to a
+        django.http.StreamingHttpResponse, browsers can start rendering
+        the table before all of it has arrived.
+        
+        kwargs:
+            order:  Iterable with field names in which the
+                    columns should be ordered. If columns order
+                    are specified, any field not specified will be
+                    discarded.
+            labels: Dictionary mapping {'field': 'label'}
+                    where field is the name of the field in model,
+                    and label is the desired label on the chart.
+            formatting: string.format() compatible expression.
+            properties: Dictionary with custom properties.
+            order_by: Column(s) to sort the rows by, as accepted by
+                    gviz_api, e.g. "field", ("field", "desc") or a
+                    list of such tuples. Sorting is done by the
+                    database, unless the QuerySet is sliced.
+        """
+        qset, order_by = self._sql_ordered(order_by)
+        table_descr = qset.table_description(labels)
+        data_table, data = qset._stream_table(table_descr, formatting, properties, order_by, order)
+        return data_table.IterHtml(columns_order=order, order_by=order_by, data=data)
+    
+    def to_csv_stream(self, order=None, labels=None, formatting=None, properties=None, separator=",",
+                      order_by=None):
+        """
+        Does _not_ return a new QuerySet.
+        Return QuerySet data as a generator of csv chunks.
+        
+        Works like to_csv(), but rows are read from the database and
+        written in batches, and the output is yielded as UTF-8
+        encoded chunks which can be passed straight to a
+        django.http.StreamingHttpResponse.
+        
+        kwargs:
+            separator: character to be used as separator. Defaults
+                    to comma(,).
+            order:  Iterable with field names in which the
+                    columns should be ordered. If columns order
+                    are specified, any field not specified will be
+                    discarded.
+            labels: Dictionary mapping {'field': 'label'}
+                    where field is the name of the field in model,
+                    and label is the desired label on the chart.
+            formatting: string.format() compatible expression.
+            properties: Dictionary with custom properties.
+            order_by: Column(s) to sort the rows by, as accepted by
+                    gviz_api, e.g. "field", ("field", "desc") or a
+                    list of such tuples. Sorting is done by the
+                    database, unless the QuerySet is sliced.
+        """
+        qset, order_by = self._sql_ordered(order_by)
+        table_descr = qset.table_description(labels)
+        data_table, data = qset._stream_table(table_descr, formatting, properties, order_by, order)
+        return data_table.IterCsv(columns_order=order, order_by=order_by, separator=separator,
+                                  data=data)
+    
+    def to_tsv_excel_stream(self, order=None, labels=None, formatting=None, properties=None,
+                            order_by=None):
+        """
+        Does _not_ return a new QuerySet.
+        Return QuerySet data as a generator of MS Excel readable
+        tab-separated chunks.
+        
+        Works like to_tsv_excel(), but rows are read from the database
+        and written in batches, and each chunk is encoded straight to
+        UTF-16 little endian.
+        
+        kwargs:
+            order:  Iterable with field names in which the
+                    columns should be ordered. If columns order
+                    are specified, any field not specified will be
+                    discarded.
+            labels: Dictionary mapping {'field': 'label'}
+                    where field is the name of the field in model,
+                    and label is the desired label on the chart.
+            formatting: string.format() compatible expression.
+            properties: Dictionary with custom properties.
+            order_by: Column(s) to sort the rows by, as accepted by
+                    gviz_api, e.g. "field", ("field", "desc") or a
+                    list of such tuples. Sorting is done by the
+                    database, unless the QuerySet is sliced.
+        """
+        qset, order_by = self._sql_ordered(order_by)
+        table_descr = qset.table_description(labels)
+        data_table, data = qset._stream_table(table_descr, formatting, properties, order_by, order)
+        return data_table.IterTsvExcel(columns_order=order, order_by=order_by, data=data)
+    
+    def to_json_stream(self, order=None, labels=None, formatting=None, properties=None, order_by=None):
+        """
+        Does _not_ return a new QuerySet.
+        Return QuerySet data as a generator of json serialized chunks.
+        
+        Works like to_json(), but rows are read from the database and
+        serialized one at a time, and the output is yielded as UTF-8
+        encoded chunks. Memory usage stays flat regardless of the number
+        of rows, and the generator can be passed straight to a
+        django.http.StreamingHttpResponse, e.g:
+            return StreamingHttpResponse(qset.to_json_stream(),
+                                         content_type="application/json")
+        
+        kwargs:
+            order:  Iterable with field names in which the
+                    columns should be ordered. If columns order
+                    are specified, any field not specified will be
+                    discarded.
+            labels: Dictionary mapping {'field': 'label'}
+                    where field is the name of the field in model,
+                    and label is the desired label on the chart.
+            formatting: string.format() compatible expression.
+            properties: Dictionary with custom properties.
+            order_by: Column(s) to sort the rows by, as accepted by
+                    gviz_api, e.g. "field", ("field", "desc") or a
+                    list of such tuples. Sorting is done by the
+                    database, unless the QuerySet is sliced.
+        """
+        qset, order_by = self._sql_ordered(order_by)
+        table_descr = qset.table_description(labels)
+        data_table, data = qset._stream_table(table_descr, formatting, properties, order_by, order)
+        return data_table.IterJSon(columns_order=order, order_by=order_by, data=data)
+    
+    def to_json_response_stream(self, order=None, labels=None, formatting=None, properties=None,
+                                req_id=0, handler="google.visualization.Query.setResponse",
+                                order_by=None):
+        """
+        Does _not_ return a new QuerySet.
+        Return a JSON response as a generator of UTF-8 encoded chunks.
+        
+        Works like to_json_response(), but streams the rows the same
+        way as to_json_stream(). The signature of the data is sent
+        after the table, since it isn't known before all of it has
+        been written.
+        
+        kwargs:
+            req_id: Response id, as retrieved by the request.
+            handler: The response handler, as retrieved by the
+                    request.
+            order:  Iterable with field names in which the
+                    columns should be ordered. If columns order
+                    are specified, any field not specified will be
+                    discarded.
+            labels: Dictionary mapping {'field': 'label'}
+                    where field is the name of the field in model,
+                    and label is the desired label on the chart.
+            formatting: string.format() compatible expression.
+            properties: Dictionary with custom properties.
+            order_by: Column(s) to sort the rows by, as accepted by
+                    gviz_api, e.g. "field", ("field", "desc") or a
+                    list of such tuples. Sorting is done by the
+                    database, unless the QuerySet is sliced.
+        """
+        qset, order_by = self._sql_ordered(order_by)
+        table_descr = qset.table_description(labels)
+        data_table, data = qset._stream_table(table_descr, formatting, properties, order_by, order)
+        return data_table.IterJSonResponse(columns_order=order, order_by=order_by, req_id=req_id,
+                                           response_handler=handler, data=data)
     
 
 class GChartsValuesQuerySet(GChartsQuerySet, ValuesQuerySet):
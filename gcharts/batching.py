@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import Queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.utils import six
+
+logger = logging.getLogger("gcharts")
+
+
+class BatchTimeout(Exception):
+    """
+    The output of a chart in a batch was not ready in time.
+    """
+    pass
+
+
+def _in_memory_databases():
+    # In-memory SQLite databases, like test databases, only exist
+    # for the connection of the thread which created them.
+    return any(conn.vendor == "sqlite" and conn.settings_dict["NAME"] in ("", ":memory:")
+               for conn in connections.all())
+
+
+def _run(name, spec):
+    try:
+        return spec()
+    except Exception as e:
+        logger.exception("Chart %s in batch failed" % name)
+        return e
+
+
+def _worker(tasks, results, cancelled):
+    try:
+        while not cancelled.is_set():
+            try:
+                name, spec = tasks.get_nowait()
+            except Queue.Empty:
+                return
+            results.put((name, _run(name, spec)))
+    finally:
+        # Every thread has its own database connections
+        for conn in connections.all():
+            conn.close()
+
+
+def batch(specs, timeout=None, max_workers=None):
+    """
+    Produce the output of several charts concurrently, so the
+    time it takes approaches that of the slowest chart, instead
+    of the sum of them all.
+
+    The charts are run by a pool of threads, each with its own
+    database connections. A chart which fails doesn't affect the
+    others, its exception is returned as its output instead. If
+    an in-memory SQLite database is configured, which threads
+    can't share, the charts are run one by one, and timeout is
+    ignored.
+
+    Returns a dict mapping the names in specs to the output of
+    the charts, or to the exception a chart raised, or to a
+    BatchTimeout if its output was not ready in time.
+
+    kwargs:
+        specs:  Dictionary mapping {'name': spec}, where spec is
+                a callable returning the output of a chart, e.g.
+                as returned by GChartsQuerySet.spec().
+        timeout: Number of seconds to wait for the output of the
+                charts, counted from the start of the batch.
+                Charts which are still running when it expires
+                are left to finish in the background, charts which
+                have not started yet are never run.
+        max_workers: Maximum number of threads to run the charts
+                in. Defaults to GOOGLECHARTS_BATCH_WORKERS in
+                settings.py, or 4.
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, "GOOGLECHARTS_BATCH_WORKERS", 4)
+    if max_workers < 2 or len(specs) < 2 or _in_memory_databases():
+        return dict((name, _run(name, spec)) for name, spec in six.iteritems(specs))
+
+    tasks = Queue.Queue()
+    for name, spec in six.iteritems(specs):
+        tasks.put((name, spec))
+    results = Queue.Queue()
+    cancelled = threading.Event()
+    for i in range(min(max_workers, len(specs))):
+        thread = threading.Thread(target=_worker, args=(tasks, results, cancelled),
+                                  name="gcharts-batch-%d" % i)
+        thread.daemon = True
+        thread.start()
+
+    deadline = timeout is not None and time.time() + timeout
+    outputs = {}
+    try:
+        while len(outputs) < len(specs):
+            if timeout is None:
+                # Queue.get() without a timeout can't be interrupted
+                name, output = results.get(True, 1e9)
+            else:
+                name, output = results.get(True, max(deadline - time.time(), 0))
+            outputs[name] = output
+    except Queue.Empty:
+        cancelled.set()
+        for name in specs:
+            if name not in outputs:
+                outputs[name] = BatchTimeout("Chart %s was not ready in %s seconds" % (name, timeout))
+    return outputs
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import hashlib
+import io
+import json
+import time
+
+from django.utils import six
+
+
+def compress(content):
+    """
+    Return the payload to cache for content, a tuple (text, data)
+    where data is content gzip compressed. Text content is UTF-8
+    encoded first, and text is True.
+    """
+    text = isinstance(content, six.text_type)
+    if text:
+        content = content.encode("utf-8")
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb", mtime=0) as f:
+        f.write(content)
+    return text, buf.getvalue()
+
+
+def decompress(payload):
+    """
+    Return the content of a payload returned by compress().
+    """
+    text, data = payload
+    content = gzip.GzipFile(fileobj=io.BytesIO(data)).read()
+    if text:
+        content = content.decode("utf-8")
+    return content
+
+
+def _version_key(table):
+    return "gcharts:version:%s" % table
+
+
+def _new_version():
+    # Versions of a table start at the current time, so entries cached
+    # under a version which was evicted from the cache are never used.
+    return int(time.time() * 1000000)
+
+
+def table_versions(cache, tables):
+    """
+    Return the current versions of tables, as a list in the
+    order of tables.
+    """
+    keys = [_version_key(table) for table in tables]
+    versions = cache.get_many(keys)
+    missing = dict((key, _new_version()) for key in keys if key not in versions)
+    if missing:
+        cache.set_many(missing)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def invalidate(cache, table):
+    """
+    Invalidate all output cached from queries on table.
+    """
+    key = _version_key(table)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version())
+
+
+def output_key(cache, query_key, using, method, callargs, tables):
+    """
+    Return the cache key for the output of method called with
+    callargs, on the query identified by query_key which reads
+    from tables.
+    """
+    versions = table_versions(cache, tables)
+    key = json.dumps([query_key, using, method, callargs, sorted(zip(tables, versions))],
+                     sort_keys=True, default=repr)
+    return "gcharts:output:%s" % hashlib.md5(key.encode("utf-8")).hexdigest()
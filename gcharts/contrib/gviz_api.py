@@ -26,14 +26,18 @@ Google Visualization API.
 
 __author__ = "Amit Weinstein, Misha Seltzer, Jacob Baskin"
 
+import array
 import cgi
 import cStringIO
 import csv
 import datetime
+import hashlib
+import itertools
 try:
   import json
 except ImportError:
   import simplejson as json
+import re
 import types
 
 
@@ -69,6 +73,343 @@ class DataTableJSONEncoder(json.JSONEncoder):
       return super(DataTableJSONEncoder, self).default(o)
 
 
+class JSONBackend(object):
+  """Writes JSON with the standard library json module.
+
+  This is the default JSON backend of DataTable, and the base class for the
+  other backends. A backend only has to implement Dumps(). DataTable renders
+  date, datetime and timeofday cell values into their JSON form before
+  handing them to the backend, so backends need not support those types.
+  """
+
+  def __init__(self):
+    self._encoder = DataTableJSONEncoder()
+
+  def Dumps(self, obj):
+    """Returns obj serialized as a UTF-8 encoded JSON string."""
+    return self._encoder.encode(obj).encode("utf-8")
+
+
+class SimpleJSONBackend(JSONBackend):
+  """Writes JSON with simplejson, using its C speedups when available."""
+
+  def __init__(self):
+    import simplejson
+    self._encoder = simplejson.JSONEncoder(
+        separators=(",", ":"), ensure_ascii=False,
+        default=DataTableJSONEncoder().default)
+
+
+class UJSONBackend(JSONBackend):
+  """Writes JSON with ujson, which returns UTF-8 encoded strings directly.
+
+  Strings are written like the json module writes them, but floats are written
+  in their shortest form, e.g. 1e-7 instead of 1e-07, so the output and its
+  signature are not byte for byte the same as with the other backends.
+  """
+
+  def __init__(self):
+    import ujson
+    JSONBackend.__init__(self)
+    self._dumps = ujson.dumps
+
+  def Dumps(self, obj):
+    try:
+      return self._dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+    except OverflowError:
+      # ujson can't write integers beyond 64 bits.
+      return JSONBackend.Dumps(self, obj)
+
+
+# Names of javascript functions which can be given as responseHandler in tqx.
+_RESPONSE_HANDLER = re.compile(r"^[A-Za-z_$][\w$.]*\Z")
+
+DEFAULT_RESPONSE_HANDLER = "google.visualization.Query.setResponse"
+
+
+def _JSonReqId(req_id):
+  """Returns req_id as a JSON string, written the same by every backend."""
+  if not isinstance(req_id, types.StringTypes):
+    req_id = str(req_id)
+  return json.dumps(req_id)
+
+
+# JSON backends by name.
+JSON_BACKENDS = {
+    "json": JSONBackend,
+    "simplejson": SimpleJSONBackend,
+    "ujson": UJSONBackend,
+}
+
+
+def _JSonDate(value):
+  return "Date(%d,%d,%d)" % (value.year, value.month - 1, value.day)
+
+
+def _JSonDateTime(value):
+  if value.microsecond == 0:
+    # If the time doesn't have ms-resolution, leave it out to keep
+    # things smaller.
+    return "Date(%d,%d,%d,%d,%d,%d)" % (
+        value.year, value.month - 1, value.day, value.hour, value.minute,
+        value.second)
+  return "Date(%d,%d,%d,%d,%d,%d,%d)" % (
+      value.year, value.month - 1, value.day, value.hour, value.minute,
+      value.second, value.microsecond / 1000)
+
+
+def _JSonTimeOfDay(value):
+  return [value.hour, value.minute, value.second]
+
+
+# Renders coerced cell values into JSON native values, by column type. Types
+# not in here are JSON native already.
+_JSON_RENDERERS = {
+    "date": _JSonDate,
+    "datetime": _JSonDateTime,
+    "timeofday": _JSonTimeOfDay,
+}
+
+# The ordinal of 1970-01-01, which dates in the columnar JSON are relative to.
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+_FORMATTED_VALUE_TYPES = types.StringTypes + (types.NoneType,)
+
+
+def _CoerceBoolean(value):
+  return bool(value)
+
+
+def _CoerceNumber(value):
+  if isinstance(value, (int, long, float)):
+    return value
+  raise DataTableException("Wrong type %s when expected number" % type(value))
+
+
+def _CoerceString(value):
+  if isinstance(value, unicode):
+    return value
+  return str(value).decode("utf-8")
+
+
+def _CoerceDate(value):
+  if isinstance(value, datetime.datetime):
+    return datetime.date(value.year, value.month, value.day)
+  elif isinstance(value, datetime.date):
+    return value
+  raise DataTableException("Wrong type %s when expected date" % type(value))
+
+
+def _CoerceTimeOfDay(value):
+  if isinstance(value, datetime.datetime):
+    return datetime.time(value.hour, value.minute, value.second)
+  elif isinstance(value, datetime.time):
+    return value
+  raise DataTableException("Wrong type %s when expected time" % type(value))
+
+
+def _CoerceDateTime(value):
+  if isinstance(value, datetime.datetime):
+    return value
+  raise DataTableException("Wrong type %s when expected datetime" %
+                           type(value))
+
+
+def _Identity(value):
+  return value
+
+
+def _FormattingCoercer(formatter, coercer=None):
+  """Returns a function formatting a cell with formatter before coercing it.
+
+  Cells which already are (value, formatted value[, custom properties]) tuples
+  are only coerced.
+  """
+  coercer = coercer or _Identity
+
+  def Coerce(value):
+    if isinstance(value, tuple):
+      return coercer(value)
+    formatted = formatter(value)
+    if not isinstance(formatted, _FORMATTED_VALUE_TYPES):
+      raise DataTableException("Formatted value is not string, given %s." %
+                               type(formatted))
+    return (coercer(value), formatted)
+
+  return Coerce
+
+
+# Coercers for non-null, non-tuple values, by column type.
+_SCALAR_COERCERS = {
+    "boolean": _CoerceBoolean,
+    "number": _CoerceNumber,
+    "string": _CoerceString,
+    "date": _CoerceDate,
+    "timeofday": _CoerceTimeOfDay,
+    "datetime": _CoerceDateTime,
+}
+
+# Classes which need no coercion, by column type.
+_EXACT_CLASSES = {
+    "boolean": (bool,),
+    "number": (int, long, float),
+    "string": (unicode,),
+    "date": (datetime.date,),
+    "timeofday": (datetime.time,),
+    "datetime": (datetime.datetime,),
+}
+
+
+class _ColumnStore(object):
+  """Compact, append-only storage for the values of a single column.
+
+  Internal helper class. Instead of keeping a dictionary of column values per
+  row, DataTable keeps one _ColumnStore per column:
+    - "number" columns are kept in an array.array of C longs or doubles as long
+      as all values are ints or all values are floats.
+    - "string" columns are dictionary-encoded, each row holding a code into a
+      list of the distinct strings, as long as the column is repetitive.
+    - Anything else is kept in a plain list.
+  Null cells are tracked in a bitmap, and the formatted value and custom
+  properties of (value, formatted value[, custom properties]) tuples are kept
+  aside in a sparse dictionary. Values are stored as given; type coercion is
+  still done by the serializers.
+  """
+
+  # A dictionary-encoded column is decoded into a plain list once it holds
+  # more than this many distinct strings, and they make up more than half of
+  # the rows.
+  DICTIONARY_LIMIT = 1024
+
+  def __init__(self, value_type):
+    self.value_type = value_type
+    self.__length = 0
+    self.__nulls = bytearray()
+    self.__has_nulls = False
+    self.__extras = {}
+    self.__dictionary = None
+    if value_type == "number":
+      self.__values = array.array("l")
+    elif value_type == "string":
+      # Code 0 is reserved for null cells.
+      self.__values = array.array("l")
+      self.__dictionary = [None]
+      self.__index = {}
+    else:
+      self.__values = []
+
+  def __len__(self):
+    return self.__length
+
+  def __iter__(self):
+    """Iterates over the values of the column, in row order."""
+    if self.__dictionary is not None:
+      values = itertools.imap(self.__dictionary.__getitem__, self.__values)
+    else:
+      values = iter(self.__values)
+    if not self.__has_nulls and not self.__extras:
+      return values
+    return self.__IterCells(values)
+
+  def __IterCells(self, values):
+    nulls = self.__nulls
+    extras = self.__extras
+    for index, value in enumerate(values):
+      if nulls[index >> 3] & (1 << (index & 7)):
+        value = None
+      if index in extras:
+        yield (value,) + extras[index]
+      else:
+        yield value
+
+  def Get(self, index):
+    """Returns the value of the cell at the given row index."""
+    if self.__nulls[index >> 3] & (1 << (index & 7)):
+      value = None
+    elif self.__dictionary is not None:
+      value = self.__dictionary[self.__values[index]]
+    else:
+      value = self.__values[index]
+    if self.__extras:
+      extras = self.__extras.get(index)
+      if extras is not None:
+        return (value,) + extras
+    return value
+
+  def Append(self, value):
+    """Appends the value of the next row to the column."""
+    index = self.__length
+    if not index & 7:
+      self.__nulls.append(0)
+    if isinstance(value, tuple) and value:
+      self.__extras[index] = value[1:]
+      value = value[0]
+    if value is None:
+      self.__nulls[index >> 3] |= 1 << (index & 7)
+      self.__has_nulls = True
+      if self.__dictionary is not None:
+        self.__values.append(0)
+      elif isinstance(self.__values, array.array):
+        self.__values.append(0)
+      else:
+        self.__values.append(None)
+    elif self.__dictionary is not None:
+      self.__AppendEncoded(value)
+    elif isinstance(self.__values, array.array):
+      self.__AppendNumber(value)
+    else:
+      self.__values.append(value)
+    self.__length += 1
+
+  def __AppendEncoded(self, value):
+    if not isinstance(value, types.StringTypes):
+      self.__Decode()
+      self.__values.append(value)
+      return
+    code = self.__index.get(value)
+    if code is None:
+      code = len(self.__dictionary)
+      if (code > self.DICTIONARY_LIMIT and code > self.__length / 2):
+        self.__Decode()
+        self.__values.append(value)
+        return
+      self.__dictionary.append(value)
+      self.__index[value] = code
+    self.__values.append(code)
+
+  def __Decode(self):
+    self.__values = [self.__dictionary[code] for code in self.__values]
+    self.__dictionary = None
+    self.__index = None
+
+  def __AppendNumber(self, value):
+    values = self.__values
+    if values.typecode == "l":
+      if type(value) in (int, long):
+        try:
+          values.append(value)
+          return
+        except OverflowError:
+          pass
+      elif type(value) is float and len(values) == self.__NullCount():
+        # Only null placeholders so far, switch to an array of doubles.
+        self.__values = array.array("d", values)
+        self.__values.append(value)
+        return
+    elif type(value) is float:
+      values.append(value)
+      return
+    # Mixed or non-numeric values, fall back to a plain list.
+    self.__values = values.tolist()
+    self.__values.append(value)
+
+  def __NullCount(self):
+    if not self.__has_nulls:
+      return 0
+    return sum(bin(byte).count("1") for byte in self.__nulls)
+
+
 class DataTable(object):
   """Wraps the data to convert to a Google Visualization API DataTable.
 
@@ -140,7 +481,11 @@ class DataTable(object):
     3  4  w
   """
 
-  def __init__(self, table_description, data=None, custom_properties=None):
+  # Value coercers by column type, see ValueCoercer().
+  _coercers = {}
+
+  def __init__(self, table_description, data=None, custom_properties=None,
+               trusted=False, json_backend=None, formatters=None):
     """Initialize the data table from a table schema and (optionally) data.
 
     See the class documentation for more information on table schema and data
@@ -158,16 +503,45 @@ class DataTable(object):
       custom_properties: Optional. A dictionary from string to string that
                          goes into the table's custom properties. This can be
                          later changed by changing self.custom_properties.
+      trusted: Optional. Either a boolean, or an iterable of column IDs. Values
+               in trusted columns are known to already be of the Python type
+               of their column (see CoerceValue()), and are serialized without
+               being coerced or validated. Only use this for data which comes
+               from a source that guarantees the types, like a database.
+      json_backend: Optional. The JSONBackend used by the JSON serializers.
+                    Defaults to the standard library backend. This can be later
+                    changed by changing self.json_backend.
+      formatters: Optional. A dictionary from column ID to a function returning
+                  the formatted value of a cell in the column. The cells are
+                  formatted as they are serialized, so only the values are
+                  kept in the table. Cells given as (value, formatted value)
+                  tuples are left as they are.
 
     Raises:
       DataTableException: Raised if the data and the description did not match,
                           or did not use the supported formats.
     """
     self.__columns = self.TableDescriptionParser(table_description)
-    self.__data = []
+    # Tables described by a flat list of columns take their rows as plain
+    # sequences of values, which are used as is instead of parsed into dicts.
+    self.__flat = all(col["container"] == "iter" for col in self.__columns)
+    if trusted is True or trusted is False:
+      trusted = trusted and [col["id"] for col in self.__columns] or ()
+    trusted = frozenset(trusted)
+    self.__coercers = dict(
+        (col["id"], col["id"] not in trusted and
+         self.ValueCoercer(col["type"]) or None)
+        for col in self.__columns)
+    self.__formatters = dict(formatters or {})
+    for col_id in self.__formatters:
+      if col_id not in self.__coercers:
+        raise DataTableException("Formatter given for unknown column %s" %
+                                 col_id)
+    self.__ClearData()
     self.custom_properties = {}
     if custom_properties is not None:
       self.custom_properties = custom_properties
+    self.json_backend = json_backend or JSONBackend()
     if data:
       self.LoadData(data)
 
@@ -210,61 +584,58 @@ class DataTable(object):
       DataTableException: The value and type did not match in a not-recoverable
                           way, for example given value 'abc' for type 'number'.
     """
-    if isinstance(value, tuple):
-      # In case of a tuple, we run the same function on the value itself and
-      # add the formatted value.
-      if (len(value) not in [2, 3] or
-          (len(value) == 3 and not isinstance(value[2], dict))):
-        raise DataTableException("Wrong format for value and formatting - %s." %
-                                 str(value))
-      if not isinstance(value[1], types.StringTypes + (types.NoneType,)):
-        raise DataTableException("Formatted value is not string, given %s." %
-                                 type(value[1]))
-      js_value = DataTable.CoerceValue(value[0], value_type)
-      return (js_value,) + value[1:]
-
-    t_value = type(value)
-    if value is None:
-      return value
-    if value_type == "boolean":
-      return bool(value)
+    return DataTable.ValueCoercer(value_type)(value)
 
-    elif value_type == "number":
-      if isinstance(value, (int, long, float)):
-        return value
-      raise DataTableException("Wrong type %s when expected number" % t_value)
+  @staticmethod
+  def ValueCoercer(value_type):
+    """Returns a function which coerces values into the given column type.
 
-    elif value_type == "string":
-      if isinstance(value, unicode):
-        return value
-      else:
-        return str(value).decode("utf-8")
+    The returned function behaves exactly like CoerceValue() for the given
+    value_type, but the type is resolved only once, instead of once per cell.
+    Coercers are created once per type and shared.
 
-    elif value_type == "date":
-      if isinstance(value, datetime.datetime):
-        return datetime.date(value.year, value.month, value.day)
-      elif isinstance(value, datetime.date):
-        return value
-      else:
-        raise DataTableException("Wrong type %s when expected date" % t_value)
+    Args:
+      value_type: One of "string", "number", "boolean", "date", "datetime" or
+                  "timeofday".
 
-    elif value_type == "timeofday":
-      if isinstance(value, datetime.datetime):
-        return datetime.time(value.hour, value.minute, value.second)
-      elif isinstance(value, datetime.time):
+    Returns:
+      A function taking a single value, and returning the coerced value.
+    """
+    try:
+      return DataTable._coercers[value_type]
+    except KeyError:
+      pass
+    scalar_coercer = _SCALAR_COERCERS.get(value_type)
+    if scalar_coercer is None:
+      def scalar_coercer(unused_value):
+        # The given value_type is not one of the supported types.
+        raise DataTableException("Unsupported type %s" % value_type)
+
+    # Values of exactly these classes are returned as they are, which is the
+    # common case, before doing any further checks.
+    exact_classes = frozenset(_EXACT_CLASSES.get(value_type, ()) +
+                              (types.NoneType,))
+
+    def Coerce(value):
+      if value.__class__ in exact_classes:
         return value
-      else:
-        raise DataTableException("Wrong type %s when expected time" % t_value)
-
-    elif value_type == "datetime":
-      if isinstance(value, datetime.datetime):
+      if isinstance(value, tuple):
+        # In case of a tuple, we run the same function on the value itself and
+        # add the formatted value.
+        if (len(value) not in (2, 3) or
+            (len(value) == 3 and not isinstance(value[2], dict))):
+          raise DataTableException("Wrong format for value and formatting - "
+                                   "%s." % str(value))
+        if not isinstance(value[1], _FORMATTED_VALUE_TYPES):
+          raise DataTableException("Formatted value is not string, given %s." %
+                                   type(value[1]))
+        return (Coerce(value[0]),) + value[1:]
+      if value is None:
         return value
-      else:
-        raise DataTableException("Wrong type %s when expected datetime" %
-                                 t_value)
-    # If we got here, it means the given value_type was not one of the
-    # supported types.
-    raise DataTableException("Unsupported type %s" % value_type)
+      return scalar_coercer(value)
+
+    DataTable._coercers[value_type] = Coerce
+    return Coerce
 
   @staticmethod
   def EscapeForJSCode(encoder, value):
@@ -527,7 +898,14 @@ class DataTable(object):
 
   def NumberOfRows(self):
     """Returns the number of rows in the current data stored in the table."""
-    return len(self.__data)
+    return self.__num_rows
+
+  def __ClearData(self):
+    """Drops all rows, leaving one empty _ColumnStore per column."""
+    self.__stores = dict((col["id"], _ColumnStore(col["type"]))
+                         for col in self.__columns)
+    self.__row_properties = {}
+    self.__num_rows = 0
 
   def SetRowsCustomProperties(self, rows, custom_properties):
     """Sets the custom properties for given row(s).
@@ -543,7 +921,14 @@ class DataTable(object):
     if not hasattr(rows, "__iter__"):
       rows = [rows]
     for row in rows:
-      self.__data[row] = (self.__data[row][0], custom_properties)
+      if row < 0:
+        row += self.__num_rows
+      if not 0 <= row < self.__num_rows:
+        raise IndexError("Row index out of range")
+      if custom_properties:
+        self.__row_properties[row] = custom_properties
+      else:
+        self.__row_properties.pop(row, None)
 
   def LoadData(self, data, custom_properties=None):
     """Loads new rows to the data table, clearing existing rows.
@@ -557,7 +942,7 @@ class DataTable(object):
       custom_properties: A dictionary of string to string to set as the custom
                          properties for all rows.
     """
-    self.__data = []
+    self.__ClearData()
     self.AppendData(data, custom_properties)
 
   def AppendData(self, data, custom_properties=None):
@@ -580,14 +965,90 @@ class DataTable(object):
     # If the maximal depth is 0, we simply iterate over the data table
     # lines and insert them using _InnerAppendData. Otherwise, we simply
     # let the _InnerAppendData handle all the levels.
+    if self.__flat:
+      self.__AppendTuples(self.__IterTuples(data, custom_properties))
+    else:
+      self.__AppendRows(self._IterData(data, custom_properties))
+
+  def __AppendRows(self, rows):
+    """Splits parsed (row, custom_properties) tuples into the column stores."""
+    stores = self.__stores.items()
+    for row, cp in rows:
+      for col_id, store in stores:
+        store.Append(row.get(col_id))
+      if cp:
+        self.__row_properties[self.__num_rows] = cp
+      self.__num_rows += 1
+
+  def __AppendTuples(self, rows):
+    """Like __AppendRows(), for rows of values in column order."""
+    appends = [self.__stores[col["id"]].Append for col in self.__columns]
+    for row, cp in rows:
+      for append, value in itertools.izip(appends, row):
+        append(value)
+      if cp:
+        self.__row_properties[self.__num_rows] = cp
+      self.__num_rows += 1
+
+  def __IterTuples(self, data, custom_properties=None):
+    """Yields the rows of a flat table as tuples of values in column order.
+
+    Rows with less values than there are columns are padded with None.
+
+    Raises:
+      DataTableException: A row is not a sequence, or is too long.
+    """
+    width = len(self.__columns)
+    for row in data:
+      if not isinstance(row, tuple):
+        if not hasattr(row, "__iter__") or isinstance(row, dict):
+          raise DataTableException("Expected iterable object, got %s" %
+                                   type(row))
+        row = tuple(row)
+      if len(row) != width:
+        if len(row) > width:
+          raise DataTableException("Too many elements given in data")
+        row += (None,) * (width - len(row))
+      yield row, custom_properties
+
+  def _IterData(self, data, custom_properties=None):
+    """Parses data into rows lazily, without storing them in the table.
+
+    Internal helper method. Accepts the same data formats as AppendData(), but
+    yields the parsed rows one at a time instead of appending them to the
+    table, so that rows can be serialized straight from a (possibly very long)
+    iterator.
+
+    Args:
+      data: The rows to parse. The data must conform to the table description
+            format.
+      custom_properties: A dictionary of string to string, representing the
+                         custom properties of all the rows.
+
+    Yields:
+      (row, custom_properties) tuples, where row is a dictionary mapping column
+      ids to values.
+
+    Raises:
+      DataTableException: The data structure does not match the description.
+    """
+    # If the maximal depth is 0, we simply iterate over the data table
+    # lines and parse them using _InnerIterData. Otherwise, we simply
+    # let the _InnerIterData handle all the levels.
     if not self.__columns[-1]["depth"]:
       for row in data:
-        self._InnerAppendData(({}, custom_properties), row, 0)
+        for parsed_row in self._InnerIterData(({}, custom_properties), row, 0):
+          yield parsed_row
     else:
-      self._InnerAppendData(({}, custom_properties), data, 0)
+      for parsed_row in self._InnerIterData(({}, custom_properties), data, 0):
+        yield parsed_row
 
   def _InnerAppendData(self, prev_col_values, data, col_index):
     """Inner function to assist LoadData."""
+    self.__AppendRows(self._InnerIterData(prev_col_values, data, col_index))
+
+  def _InnerIterData(self, prev_col_values, data, col_index):
+    """Inner generator to assist _IterData."""
     # We first check that col_index has not exceeded the columns size
     if col_index >= len(self.__columns):
       raise DataTableException("The data does not match description, too deep")
@@ -595,7 +1056,7 @@ class DataTable(object):
     # Dealing with the scalar case, the data is the last value.
     if self.__columns[col_index]["container"] == "scalar":
       prev_col_values[0][self.__columns[col_index]["id"]] = data
-      self.__data.append(prev_col_values)
+      yield prev_col_values
       return
 
     if self.__columns[col_index]["container"] == "iter":
@@ -609,7 +1070,7 @@ class DataTable(object):
           raise DataTableException("Too many elements given in data")
         prev_col_values[0][self.__columns[col_index]["id"]] = value
         col_index += 1
-      self.__data.append(prev_col_values)
+      yield prev_col_values
       return
 
     # We know the current level is a dictionary, we verify the type.
@@ -622,47 +1083,52 @@ class DataTable(object):
       for col in self.__columns[col_index:]:
         if col["id"] in data:
           prev_col_values[0][col["id"]] = data[col["id"]]
-      self.__data.append(prev_col_values)
+      yield prev_col_values
       return
 
     # We have a dictionary in an inner depth level.
     if not data.keys():
       # In case this is an empty dictionary, we add a record with the columns
       # filled only until this point.
-      self.__data.append(prev_col_values)
+      yield prev_col_values
     else:
       for key in sorted(data):
         col_values = dict(prev_col_values[0])
         col_values[self.__columns[col_index]["id"]] = key
-        self._InnerAppendData((col_values, prev_col_values[1]),
-                              data[key], col_index + 1)
+        for parsed_row in self._InnerIterData((col_values, prev_col_values[1]),
+                                              data[key], col_index + 1):
+          yield parsed_row
 
-  def _PreparedData(self, order_by=()):
-    """Prepares the data for enumeration - sorting it by order_by.
+  @staticmethod
+  def OrderByParser(order_by):
+    """Parses the order_by argument of the output methods.
 
     Args:
-      order_by: Optional. Specifies the name of the column(s) to sort by, and
-                (optionally) which direction to sort in. Default sort direction
-                is asc. Following formats are accepted:
+      order_by: The name of the column(s) to sort by, and (optionally) which
+                direction to sort in. Following formats are accepted:
                 "string_col_name"  -- For a single key in default (asc) order.
                 ("string_col_name", "asc|desc") -- For a single key.
                 [("col_1","asc|desc"), ("col_2","asc|desc")] -- For more than
                     one column, an array of tuples of (col_name, "asc|desc").
 
     Returns:
-      The data sorted by the keys given.
+      A list of (col_name, direction) tuples, where direction is 1 for asc
+      and -1 for desc, most significant key first.
 
     Raises:
       DataTableException: Sort direction not in 'asc' or 'desc'
+
+    Examples:
+      OrderByParser("a") ==> [("a", 1)]
+      OrderByParser([("a", "desc"), "b"]) ==> [("a", -1), ("b", 1)]
     """
     if not order_by:
-      return self.__data
-
-    proper_sort_keys = []
+      return []
     if isinstance(order_by, types.StringTypes) or (
         isinstance(order_by, tuple) and len(order_by) == 2 and
         order_by[1].lower() in ["asc", "desc"]):
       order_by = (order_by,)
+    proper_sort_keys = []
     for key in order_by:
       if isinstance(key, types.StringTypes):
         proper_sort_keys.append((key, 1))
@@ -672,18 +1138,56 @@ class DataTable(object):
       else:
         raise DataTableException("Expected tuple with second value: "
                                  "'asc' or 'desc'")
+    return proper_sort_keys
 
-    def SortCmpFunc(row1, row2):
-      """cmp function for sorted. Compares by keys and 'asc'/'desc' keywords."""
-      for key, asc_mult in proper_sort_keys:
-        cmp_result = asc_mult * cmp(row1[0].get(key), row2[0].get(key))
-        if cmp_result:
-          return cmp_result
-      return 0
+  def _PreparedData(self, order_by=(), columns_order=None):
+    """Prepares the data for enumeration - sorting it by order_by.
 
-    return sorted(self.__data, cmp=SortCmpFunc)
+    Args:
+      order_by: Optional. Specifies the name of the column(s) to sort by, and
+                (optionally) which direction to sort in. Default sort direction
+                is asc. Following formats are accepted:
+                "string_col_name"  -- For a single key in default (asc) order.
+                ("string_col_name", "asc|desc") -- For a single key.
+                [("col_1","asc|desc"), ("col_2","asc|desc")] -- For more than
+                    one column, an array of tuples of (col_name, "asc|desc").
+      columns_order: Optional. The column IDs of the cells to return, in order.
+                     Defaults to all columns in the table description order.
+
+    Returns:
+      An iterator over (cells, custom_properties) tuples, sorted by the keys
+      given, where cells is a tuple of the row's values in columns_order.
+
+    Raises:
+      DataTableException: Sort direction not in 'asc' or 'desc'
+    """
+    if columns_order is None:
+      columns_order = [col["id"] for col in self.__columns]
+    stores = [self.__stores[col_id] for col_id in columns_order]
+    row_properties = self.__row_properties
 
-  def ToJSCode(self, name, columns_order=None, order_by=()):
+    if not order_by:
+      # Reading the columns side by side avoids any per-cell lookups.
+      return itertools.izip(itertools.izip(*stores),
+                            itertools.imap(row_properties.get,
+                                           xrange(self.__num_rows)))
+
+    proper_sort_keys = DataTable.OrderByParser(order_by)
+
+    # Sorting keys which are not in the table compare equal for all rows.
+    # Python's sort is stable, also when reversed, so sorting by each key in
+    # turn, starting with the least significant one, sorts by all keys. Each
+    # pass reads the sort column once, instead of comparing cell by cell.
+    indices = range(self.__num_rows)
+    for key, asc_mult in reversed(proper_sort_keys):
+      if key in self.__stores:
+        indices.sort(key=list(self.__stores[key]).__getitem__,
+                     reverse=asc_mult < 0)
+
+    return ((tuple([store.Get(i) for store in stores]), row_properties.get(i))
+            for i in indices)
+
+  def ToJSCode(self, name, columns_order=None, order_by=(), compact=False):
     """Writes the data table as a JS code string.
 
     This method writes a string of JS code that can be run to
@@ -700,6 +1204,10 @@ class DataTable(object):
                      if you use it.
       order_by: Optional. Specifies the name of the column(s) to sort by.
                 Passed as is to _PreparedData.
+      compact: Optional. If True, the rows are added in batches with
+               addRows([[...], ...]) literals, and setCell() is only used for
+               cells which have a formatted value or custom properties. This
+               gives a far smaller script, which is also faster to run.
 
     Returns:
       A string of JS code that, when run, generates a DataTable with the given
@@ -717,11 +1225,51 @@ class DataTable(object):
          tab1.setCell(9, 0, "c");
          tab1.setCell(9, 1, 3, "3$");
          tab1.setCell(9, 2, false);"
+      Example compact result:
+        "var tab1 = new google.visualization.DataTable();
+         tab1.addColumn("string", "a", "a");
+         tab1.addColumn("number", "b", "b");
+         tab1.addColumn("boolean", "c", "c");
+         tab1.addRows([["a",1,true],...,["c",3,false]]);
+         tab1.setCell(0, 1, 1, null, {"foo": "bar"});
+         tab1.setCell(9, 1, 3, "3$");"
+
+    Raises:
+      DataTableException: The data does not match the type.
+    """
+    return u"".join(self._JSCodeChunks(name, columns_order, order_by,
+                                       compact=compact))
+
+  def IterJSCode(self, name, columns_order=None, order_by=(), data=None,
+                 batch_size=1000):
+    """Generator version of ToJSCode(compact=True).
+
+    Args:
+      name: Same as in ToJSCode().
+      columns_order: Optional. Same as in ToJSCode().
+      order_by: Optional. Same as in ToJSCode(). Can not be used together with
+                data.
+      data: Optional. An iterable of rows in the format accepted by
+            AppendData(), see IterJSon().
+      batch_size: Optional. The number of rows in each addRows() statement.
+
+    Yields:
+      UTF-8 encoded chunks of the JS code, one per batch of rows.
 
     Raises:
       DataTableException: The data does not match the type.
     """
+    for chunk in self._JSCodeChunks(name, columns_order, order_by, data,
+                                    compact=True, batch_size=batch_size):
+      yield chunk.encode("utf-8")
 
+  def _JSCodeChunks(self, name, columns_order=None, order_by=(), data=None,
+                    compact=False, batch_size=1000):
+    """Yields the JS code written by ToJSCode() and IterJSCode() in chunks.
+
+    Internal helper method. The table header is yielded first, followed by one
+    chunk per row, or in compact mode one chunk per batch of rows.
+    """
     encoder = DataTableJSONEncoder()
 
     if columns_order is None:
@@ -729,46 +1277,90 @@ class DataTable(object):
     col_dict = dict([(col["id"], col) for col in self.__columns])
 
     # We first create the table with the given name
-    jscode = "var %s = new google.visualization.DataTable();\n" % name
+    jscode = ["var %s = new google.visualization.DataTable();\n" % name]
     if self.custom_properties:
-      jscode += "%s.setTableProperties(%s);\n" % (
-          name, encoder.encode(self.custom_properties))
+      jscode.append("%s.setTableProperties(%s);\n" % (
+          name, encoder.encode(self.custom_properties)))
 
     # We add the columns to the table
     for i, col in enumerate(columns_order):
-      jscode += "%s.addColumn(%s, %s, %s);\n" % (
+      jscode.append("%s.addColumn(%s, %s, %s);\n" % (
           name,
           encoder.encode(col_dict[col]["type"]),
           encoder.encode(col_dict[col]["label"]),
-          encoder.encode(col_dict[col]["id"]))
+          encoder.encode(col_dict[col]["id"])))
       if col_dict[col]["custom_properties"]:
-        jscode += "%s.setColumnProperties(%d, %s);\n" % (
-            name, i, encoder.encode(col_dict[col]["custom_properties"]))
-    jscode += "%s.addRows(%d);\n" % (name, len(self.__data))
+        jscode.append("%s.setColumnProperties(%d, %s);\n" % (
+            name, i, encoder.encode(col_dict[col]["custom_properties"])))
+
+    rows = self._RowSource(order_by, data, columns_order)
+    if compact:
+      yield u"".join(jscode)
+      for chunk in self._CompactJSCodeRows(name, rows, encoder, batch_size):
+        yield chunk
+      return
+
+    if data is not None:
+      raise DataTableException("Rows read from an external data source can "
+                               "only be written as compact JS code")
+    jscode.append("%s.addRows(%d);\n" % (name, self.__num_rows))
+    yield u"".join(jscode)
 
     # We now go over the data and add each row
-    for (i, (row, cp)) in enumerate(self._PreparedData(order_by)):
+    for (i, (cells, cp)) in enumerate(rows):
+      jscode = []
       # We add all the elements of this row by their order
-      for (j, col) in enumerate(columns_order):
-        if col not in row or row[col] is None:
+      for (j, value) in enumerate(cells):
+        if value is None:
           continue
-        value = self.CoerceValue(row[col], col_dict[col]["type"])
         if isinstance(value, tuple):
           cell_cp = ""
           if len(value) == 3:
-            cell_cp = ", %s" % encoder.encode(row[col][2])
+            cell_cp = ", %s" % encoder.encode(value[2])
           # We have a formatted value or custom property as well
-          jscode += ("%s.setCell(%d, %d, %s, %s%s);\n" %
-                     (name, i, j,
-                      self.EscapeForJSCode(encoder, value[0]),
-                      self.EscapeForJSCode(encoder, value[1]), cell_cp))
+          jscode.append("%s.setCell(%d, %d, %s, %s%s);\n" %
+                        (name, i, j,
+                         self.EscapeForJSCode(encoder, value[0]),
+                         self.EscapeForJSCode(encoder, value[1]), cell_cp))
         else:
-          jscode += "%s.setCell(%d, %d, %s);\n" % (
-              name, i, j, self.EscapeForJSCode(encoder, value))
+          jscode.append("%s.setCell(%d, %d, %s);\n" % (
+              name, i, j, self.EscapeForJSCode(encoder, value)))
       if cp:
-        jscode += "%s.setRowProperties(%d, %s);\n" % (
-            name, i, encoder.encode(cp))
-    return jscode
+        jscode.append("%s.setRowProperties(%d, %s);\n" % (
+            name, i, encoder.encode(cp)))
+      yield u"".join(jscode)
+
+  def _CompactJSCodeRows(self, name, rows, encoder, batch_size):
+    """Yields compact JS code adding rows, one chunk per batch of rows.
+
+    Internal helper method. Every batch is added with a single addRows()
+    literal. Formatted values, cell custom properties and row custom properties
+    are set afterwards, as they can not be given in the literal.
+    """
+    escape = self.EscapeForJSCode
+    index = 0
+    for batch in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+      literals = []
+      extras = []
+      for (i, (cells, cp)) in enumerate(batch, index):
+        literal = []
+        for (j, value) in enumerate(cells):
+          if isinstance(value, tuple):
+            cell_cp = ""
+            if len(value) == 3:
+              cell_cp = ", %s" % encoder.encode(value[2])
+            extras.append("%s.setCell(%d, %d, %s, %s%s);\n" %
+                          (name, i, j, escape(encoder, value[0]),
+                           escape(encoder, value[1]), cell_cp))
+            value = value[0]
+          literal.append(escape(encoder, value))
+        literals.append(u"[%s]" % u",".join(literal))
+        if cp:
+          extras.append("%s.setRowProperties(%d, %s);\n" % (
+              name, i, encoder.encode(cp)))
+      index += len(batch)
+      yield u"%s.addRows([%s]);\n%s" % (name, u",".join(literals),
+                                         u"".join(extras))
 
   def ToHtml(self, columns_order=None, order_by=()):
     """Writes the data table as an HTML table code string.
@@ -796,9 +1388,42 @@ class DataTable(object):
     Raises:
       DataTableException: The data does not match the type.
     """
-    table_template = "<html><body><table border=\"1\">%s</table></body></html>"
-    columns_template = "<thead><tr>%s</tr></thead>"
-    rows_template = "<tbody>%s</tbody>"
+    return u"".join(self._HtmlChunks(columns_order, order_by))
+
+  def IterHtml(self, columns_order=None, order_by=(), data=None,
+               batch_size=1000):
+    """Generator version of ToHtml().
+
+    Yields the page and the table head first, and then the table body in
+    chunks of batch_size rows, so that a browser can start rendering a large
+    table before all of it has arrived.
+
+    Args:
+      columns_order: Optional. Same as in ToHtml().
+      order_by: Optional. Same as in ToHtml(). Can not be used together with
+                data.
+      data: Optional. An iterable of rows in the format accepted by
+            AppendData(), see IterJSon().
+      batch_size: Optional. The number of rows in each chunk.
+
+    Yields:
+      UTF-8 encoded chunks of the HTML table code string.
+
+    Raises:
+      DataTableException: The data does not match the type.
+    """
+    for chunk in self._HtmlChunks(columns_order, order_by, data, batch_size):
+      yield chunk.encode("utf-8")
+
+  def _HtmlChunks(self, columns_order=None, order_by=(), data=None,
+                  batch_size=1000):
+    """Yields the HTML written by ToHtml() and IterHtml() in chunks.
+
+    Internal helper method.
+    """
+    table_start = "<html><body><table border=\"1\">"
+    table_end = "</tbody></table></body></html>"
+    columns_template = "<thead><tr>%s</tr></thead><tbody>"
     row_template = "<tr>%s</tr>"
     header_cell_template = "<th>%s</th>"
     cell_template = "<td>%s</td>"
@@ -811,27 +1436,28 @@ class DataTable(object):
     for col in columns_order:
       columns_list.append(header_cell_template %
                           cgi.escape(col_dict[col]["label"]))
-    columns_html = columns_template % "".join(columns_list)
-
-    rows_list = []
-    # We now go over the data and add each row
-    for row, unused_cp in self._PreparedData(order_by):
-      cells_list = []
-      # We add all the elements of this row by their order
-      for col in columns_order:
-        # For empty string we want empty quotes ("").
-        value = ""
-        if col in row and row[col] is not None:
-          value = self.CoerceValue(row[col], col_dict[col]["type"])
-        if isinstance(value, tuple):
-          # We have a formatted value and we're going to use it
-          cells_list.append(cell_template % cgi.escape(self.ToString(value[1])))
-        else:
-          cells_list.append(cell_template % cgi.escape(self.ToString(value)))
-      rows_list.append(row_template % "".join(cells_list))
-    rows_html = rows_template % "".join(rows_list)
-
-    return table_template % (columns_html + rows_html)
+    yield table_start + columns_template % "".join(columns_list)
+
+    rows = self._RowSource(order_by, data, columns_order)
+    # We now go over the data and add each batch of rows
+    for batch in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+      rows_list = []
+      for cells, unused_cp in batch:
+        cells_list = []
+        # We add all the elements of this row by their order
+        for value in cells:
+          # For empty string we want empty quotes ("").
+          if value is None:
+            value = ""
+          if isinstance(value, tuple):
+            # We have a formatted value and we're going to use it
+            cells_list.append(cell_template %
+                              cgi.escape(self.ToString(value[1])))
+          else:
+            cells_list.append(cell_template % cgi.escape(self.ToString(value)))
+        rows_list.append(row_template % "".join(cells_list))
+      yield "".join(rows_list)
+    yield table_end
 
   def ToCsv(self, columns_order=None, order_by=(), separator=","):
     """Writes the data table as a CSV string.
@@ -859,7 +1485,28 @@ class DataTable(object):
     Raises:
       DataTableException: The data does not match the type.
     """
+    return "".join(self.IterCsv(columns_order, order_by, separator))
+
+  def IterCsv(self, columns_order=None, order_by=(), separator=",", data=None,
+              batch_size=1000):
+    """Generator version of ToCsv().
+
+    Args:
+      columns_order: Optional. Same as in ToCsv().
+      order_by: Optional. Same as in ToCsv(). Can not be used together with
+                data.
+      separator: Optional. The separator to use between the values.
+      data: Optional. An iterable of rows in the format accepted by
+            AppendData(), see IterJSon().
+      batch_size: Optional. The number of rows in each chunk.
+
+    Yields:
+      UTF-8 encoded chunks of the CSV string, the header first and then one
+      chunk per batch of rows.
 
+    Raises:
+      DataTableException: The data does not match the type.
+    """
     csv_buffer = cStringIO.StringIO()
     writer = csv.writer(csv_buffer, delimiter=separator)
 
@@ -870,24 +1517,39 @@ class DataTable(object):
     writer.writerow([col_dict[col]["label"].encode("utf-8")
                      for col in columns_order])
 
+    col_types = [col_dict[col]["type"] for col in columns_order]
+    rows = self._RowSource(order_by, data, columns_order)
     # We now go over the data and add each row
-    for row, unused_cp in self._PreparedData(order_by):
-      cells_list = []
-      # We add all the elements of this row by their order
-      for col in columns_order:
+    for batch in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+      for cells, unused_cp in batch:
+        writer.writerow([cell.encode("utf-8") for cell in
+                         self._TextCells(cells, col_types)])
+      yield csv_buffer.getvalue()
+      csv_buffer.seek(0)
+      csv_buffer.truncate()
+    if csv_buffer.tell():
+      # Only the header, no rows.
+      yield csv_buffer.getvalue()
+
+  def _TextCells(self, cells, col_types):
+    """Returns the cells of a row as unicode strings for the CSV outputs.
+
+    Internal helper method. cells must already be coerced.
+    """
+    cells_list = []
+    # We add all the elements of this row by their order
+    for value, col_type in itertools.izip(cells, col_types):
+      if value is None:
         value = ""
-        if col in row and row[col] is not None:
-          value = self.CoerceValue(row[col], col_dict[col]["type"])
-        if isinstance(value, tuple):
-          # We have a formatted value. Using it only for date/time types.
-          if col_dict[col]["type"] in ["date", "datetime", "timeofday"]:
-            cells_list.append(self.ToString(value[1]).encode("utf-8"))
-          else:
-            cells_list.append(self.ToString(value[0]).encode("utf-8"))
+      if isinstance(value, tuple):
+        # We have a formatted value. Using it only for date/time types.
+        if col_type in ["date", "datetime", "timeofday"]:
+          cells_list.append(self.ToString(value[1]))
         else:
-          cells_list.append(self.ToString(value).encode("utf-8"))
-      writer.writerow(cells_list)
-    return csv_buffer.getvalue()
+          cells_list.append(self.ToString(value[0]))
+      else:
+        cells_list.append(self.ToString(value))
+    return cells_list
 
   def ToTsvExcel(self, columns_order=None, order_by=()):
     """Returns a file in tab-separated-format readable by MS Excel.
@@ -896,14 +1558,160 @@ class DataTable(object):
     values.
 
     Args:
-      columns_order: Delegated to ToCsv.
-      order_by: Delegated to ToCsv.
+      columns_order: Optional. Same as in ToCsv().
+      order_by: Optional. Same as in ToCsv().
 
     Returns:
       A tab-separated little endian UTF16 file representing the table.
     """
-    return (self.ToCsv(columns_order, order_by, separator="\t")
-            .decode("utf-8").encode("UTF-16LE"))
+    return "".join(self.IterTsvExcel(columns_order, order_by))
+
+  def IterTsvExcel(self, columns_order=None, order_by=(), data=None,
+                   batch_size=1000):
+    """Generator version of ToTsvExcel().
+
+    The rows are written as unicode and encoded straight to UTF-16 little
+    endian, one chunk at a time, without going through UTF-8. Values are quoted
+    the same way the csv module does.
+
+    Args:
+      columns_order: Optional. Same as in ToCsv().
+      order_by: Optional. Same as in ToCsv(). Can not be used together with
+                data.
+      data: Optional. An iterable of rows in the format accepted by
+            AppendData(), see IterJSon().
+      batch_size: Optional. The number of rows in each chunk.
+
+    Yields:
+      UTF-16LE encoded chunks of the tab-separated file, the header first and
+      then one chunk per batch of rows.
+
+    Raises:
+      DataTableException: The data does not match the type.
+    """
+    if columns_order is None:
+      columns_order = [col["id"] for col in self.__columns]
+    col_dict = dict([(col["id"], col) for col in self.__columns])
+
+    yield self._TsvLine([col_dict[col]["label"]
+                         for col in columns_order]).encode("UTF-16LE")
+
+    col_types = [col_dict[col]["type"] for col in columns_order]
+    rows = self._RowSource(order_by, data, columns_order)
+    for batch in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+      yield u"".join([self._TsvLine(self._TextCells(cells, col_types))
+                      for cells, unused_cp in batch]).encode("UTF-16LE")
+
+  @staticmethod
+  def _TsvLine(cells):
+    """Returns a line of tab-separated values, quoted like the csv module."""
+    if len(cells) == 1 and not cells[0]:
+      # A single empty field is quoted, so it does not read as an empty line.
+      return u'""\r\n'
+    line = []
+    for cell in cells:
+      if (u"\t" in cell or u'"' in cell or u"\r" in cell or u"\n" in cell):
+        cell = u'"%s"' % cell.replace(u'"', u'""')
+      line.append(cell)
+    return u"\t".join(line) + u"\r\n"
+
+  def _ColumnsJSonObj(self, columns_order, col_dict):
+    """Returns the list of column objects for the JSON output.
+
+    Internal helper method.
+    """
+    col_objs = []
+    for col_id in columns_order:
+      col_obj = {"id": col_dict[col_id]["id"],
+                 "label": col_dict[col_id]["label"],
+                 "type": col_dict[col_id]["type"]}
+      if col_dict[col_id]["custom_properties"]:
+        col_obj["p"] = col_dict[col_id]["custom_properties"]
+      col_objs.append(col_obj)
+    return col_objs
+
+  def _JSonRenderers(self, columns_order, col_dict):
+    """Returns the JSON renderer of each column, None when not needed.
+
+    Internal helper method.
+    """
+    return [_JSON_RENDERERS.get(col_dict[col]["type"]) for col in columns_order]
+
+  def _RowJSonObj(self, cells, cp, renderers):
+    """Returns a single row object for the JSON output.
+
+    Internal helper method. cells must already be coerced. Date and time values
+    are rendered here, so the JSON backend only sees JSON native values.
+    """
+    cell_objs = []
+    for value, render in itertools.izip(cells, renderers):
+      if value is None:
+        cell_obj = None
+      elif isinstance(value, tuple):
+        if render is not None and value[0] is not None:
+          cell_obj = {"v": render(value[0])}
+        else:
+          cell_obj = {"v": value[0]}
+        if len(value) > 1 and value[1] is not None:
+          cell_obj["f"] = value[1]
+        if len(value) == 3:
+          cell_obj["p"] = value[2]
+      elif render is not None:
+        cell_obj = {"v": render(value)}
+      else:
+        cell_obj = {"v": value}
+      cell_objs.append(cell_obj)
+    row_obj = {"c": cell_objs}
+    if cp:
+      row_obj["p"] = cp
+    return row_obj
+
+  def _RowSource(self, order_by=(), data=None, columns_order=None):
+    """Returns the rows to serialize.
+
+    Internal helper method. If data is given, the rows are parsed lazily from
+    it (see _IterData()) and are never stored in the table. Otherwise the
+    rows stored in the table are used, sorted by order_by.
+
+    The cells of columns which are not trusted are coerced with the column's
+    coercer (see ValueCoercer()), and the cells of columns with a formatter are
+    formatted.
+
+    Returns:
+      An iterator over (cells, custom_properties) tuples, like _PreparedData().
+
+    Raises:
+      DataTableException: order_by was given together with data, or the data
+                          does not match the type.
+    """
+    if columns_order is None:
+      columns_order = [col["id"] for col in self.__columns]
+    if data is None:
+      rows = self._PreparedData(order_by, columns_order)
+    elif order_by:
+      raise DataTableException("Rows read from an external data source can "
+                               "not be sorted, sort the source instead")
+    elif self.__flat:
+      rows = self.__IterTuples(data)
+      indexes = dict((col["id"], i) for i, col in enumerate(self.__columns))
+      indexes = [indexes[col] for col in columns_order]
+      if indexes != range(len(self.__columns)):
+        rows = ((tuple([cells[i] for i in indexes]), cp) for cells, cp in rows)
+    else:
+      rows = ((tuple([row.get(col) for col in columns_order]), cp)
+              for row, cp in self._IterData(data))
+
+    coercers = [self.__coercers[col] for col in columns_order]
+    if self.__formatters:
+      coercers = [col in self.__formatters and
+                  _FormattingCoercer(self.__formatters[col], coercer) or coercer
+                  for col, coercer in itertools.izip(columns_order, coercers)]
+    if not any(coercers):
+      return rows
+    coercers = [coercer or _Identity for coercer in coercers]
+    return ((tuple([coerce(cell) for coerce, cell in
+                    itertools.izip(coercers, cells)]), cp)
+            for cells, cp in rows)
 
   def _ToJSonObj(self, columns_order=None, order_by=()):
     """Returns an object suitable to be converted to JSON.
@@ -923,36 +1731,13 @@ class DataTable(object):
     col_dict = dict([(col["id"], col) for col in self.__columns])
 
     # Creating the column JSON objects
-    col_objs = []
-    for col_id in columns_order:
-      col_obj = {"id": col_dict[col_id]["id"],
-                 "label": col_dict[col_id]["label"],
-                 "type": col_dict[col_id]["type"]}
-      if col_dict[col_id]["custom_properties"]:
-        col_obj["p"] = col_dict[col_id]["custom_properties"]
-      col_objs.append(col_obj)
+    col_objs = self._ColumnsJSonObj(columns_order, col_dict)
 
     # Creating the rows jsons
+    renderers = self._JSonRenderers(columns_order, col_dict)
     row_objs = []
-    for row, cp in self._PreparedData(order_by):
-      cell_objs = []
-      for col in columns_order:
-        value = self.CoerceValue(row.get(col, None), col_dict[col]["type"])
-        if value is None:
-          cell_obj = None
-        elif isinstance(value, tuple):
-          cell_obj = {"v": value[0]}
-          if len(value) > 1 and value[1] is not None:
-            cell_obj["f"] = value[1]
-          if len(value) == 3:
-            cell_obj["p"] = value[2]
-        else:
-          cell_obj = {"v": value}
-        cell_objs.append(cell_obj)
-      row_obj = {"c": cell_objs}
-      if cp:
-        row_obj["p"] = cp
-      row_objs.append(row_obj)
+    for cells, cp in self._RowSource(order_by, columns_order=columns_order):
+      row_objs.append(self._RowJSonObj(cells, cp, renderers))
 
     json_obj = {"cols": col_objs, "rows": row_objs}
     if self.custom_properties:
@@ -998,12 +1783,20 @@ class DataTable(object):
       DataTableException: The data does not match the type.
     """
 
-    encoder = DataTableJSONEncoder()
-    return encoder.encode(
-        self._ToJSonObj(columns_order, order_by)).encode("utf-8")
+    json_obj = self._ToJSonObj(columns_order, order_by)
+    dumps = self.json_backend.Dumps
+    # The keys are written in a fixed order, the same as IterJSon(), so equal
+    # tables always serialize to the same bytes and signature.
+    json_parts = ["{\"cols\":", dumps(json_obj["cols"]),
+                  ",\"rows\":", dumps(json_obj["rows"])]
+    if "p" in json_obj:
+      json_parts.extend([",\"p\":", dumps(json_obj["p"])])
+    json_parts.append("}")
+    return "".join(json_parts)
 
   def ToJSonResponse(self, columns_order=None, order_by=(), req_id=0,
-                     response_handler="google.visualization.Query.setResponse"):
+                     response_handler="google.visualization.Query.setResponse",
+                     sig=None):
     """Writes a table as a JSON response that can be returned as-is to a client.
 
     This method writes a JSON response to return to a client in response to a
@@ -1017,6 +1810,8 @@ class DataTable(object):
       req_id: Optional. The response id, as retrieved by the request.
       response_handler: Optional. The response handler, as retrieved by the
           request.
+      sig: Optional. The signature of the data the client already has, as
+          retrieved by the request. See JSonResponse().
 
     Returns:
       A JSON response string to be received by JS the visualization Query
@@ -1024,22 +1819,284 @@ class DataTable(object):
       client side.
       Example result (newlines added for readability):
        google.visualization.Query.setResponse({
-          'version':'0.6', 'reqId':'0', 'status':'OK',
+          'version':'0.6', 'reqId':'0', 'status':'OK', 'sig':'5b3f...',
           'table': {cols: [...], rows: [...]}});
 
     Note: The URL returning this string can be used as a data source by Google
           Visualization Gadgets or from JS code.
     """
+    return self.JSonResponse(self.ToJSon(columns_order, order_by), req_id,
+                             response_handler, sig)
+
+  @staticmethod
+  def Signature(table_json):
+    """Returns the signature of a table serialized by ToJSon().
+
+    The signature is sent to the client along with the table in JSON responses.
+    Clients send it back in the "sig" parameter of tqx, to let the data source
+    know which data they already have.
+
+    Args:
+      table_json: A table as serialized by ToJSon() or IterJSon().
+
+    Returns:
+      The signature, a hex string.
+    """
+    return hashlib.md5(table_json).hexdigest()
+
+  @staticmethod
+  def JSonResponse(table_json, req_id=0,
+                   response_handler="google.visualization.Query.setResponse",
+                   sig=None):
+    """Wraps a table serialized by ToJSon() in a JSON response.
+
+    If sig is the signature of table_json, the client already has the data,
+    and a "not_modified" error response is returned without the table.
+
+    Args:
+      table_json: A table as serialized by ToJSon().
+      req_id: Optional. The response id, as retrieved by the request.
+      response_handler: Optional. The response handler, as retrieved by the
+          request.
+      sig: Optional. The signature of the data the client already has, as
+          retrieved by the request.
+
+    Returns:
+      A JSON response string, see ToJSonResponse().
+    """
+    table_sig = DataTable.Signature(table_json)
+    if sig == table_sig:
+      return ("%s({\"version\":\"0.6\",\"reqId\":%s,\"status\":\"error\","
+              "\"errors\":[{\"reason\":\"not_modified\","
+              "\"message\":\"Data not modified\"}]});"
+              % (response_handler.encode("utf-8"), _JSonReqId(req_id)))
+    return "".join([response_handler.encode("utf-8"),
+                    "({\"version\":\"0.6\",\"reqId\":", _JSonReqId(req_id),
+                    ",\"status\":\"ok\",\"sig\":\"", table_sig, "\",\"table\":",
+                    table_json, "});"])
+
+  def IterJSon(self, columns_order=None, order_by=(), data=None):
+    """Generator version of ToJSon().
+
+    Yields the same JSON document as ToJSon(), encoded in UTF-8, one chunk per
+    row. The complete document is never held in memory, which makes the
+    output suitable as the body of a streaming HTTP response.
+
+    Args:
+      columns_order: Optional. Same as in ToJSon().
+      order_by: Optional. Same as in ToJSon(). Can not be used together with
+                data.
+      data: Optional. An iterable of rows in the format accepted by
+            AppendData(). If given, rows are read from it one at a time and
+            serialized right away instead of the rows stored in the table, so
+            memory usage stays flat regardless of the number of rows.
+
+    Yields:
+      UTF-8 encoded chunks of the JSON constructor string.
+
+    Raises:
+      DataTableException: The data does not match the type.
+    """
+    dumps = self.json_backend.Dumps
+
+    if columns_order is None:
+      columns_order = [col["id"] for col in self.__columns]
+    col_dict = dict([(col["id"], col) for col in self.__columns])
+
+    yield "{\"cols\":%s,\"rows\":[" % dumps(
+        self._ColumnsJSonObj(columns_order, col_dict))
+    renderers = self._JSonRenderers(columns_order, col_dict)
+    separator = ""
+    for cells, cp in self._RowSource(order_by, data, columns_order):
+      yield separator + dumps(self._RowJSonObj(cells, cp, renderers))
+      separator = ","
+    if self.custom_properties:
+      yield "],\"p\":%s}" % dumps(self.custom_properties)
+    else:
+      yield "]}"
+
+  def IterJSonResponse(
+      self, columns_order=None, order_by=(), req_id=0,
+      response_handler="google.visualization.Query.setResponse", data=None):
+    """Generator version of ToJSonResponse().
+
+    Args:
+      columns_order: Optional. Passed straight to self.IterJSon().
+      order_by: Optional. Passed straight to self.IterJSon().
+      req_id: Optional. The response id, as retrieved by the request.
+      response_handler: Optional. The response handler, as retrieved by the
+          request.
+      data: Optional. Passed straight to self.IterJSon().
+
+    Yields:
+      UTF-8 encoded chunks of the JSON response string. The signature of the
+      table is computed while it is written, and is sent after it.
+    """
+    yield ("%s({\"version\":\"0.6\",\"reqId\":%s,\"status\":\"ok\","
+           "\"table\":" % (response_handler.encode("utf-8"),
+                           _JSonReqId(req_id)))
+    table_sig = hashlib.md5()
+    for chunk in self.IterJSon(columns_order, order_by, data):
+      table_sig.update(chunk)
+      yield chunk
+    yield ",\"sig\":\"%s\"});" % table_sig.hexdigest()
+
+  def ToJSonColumnar(self, columns_order=None, order_by=()):
+    """Returns the table as JSON in a compact, column oriented format.
+
+    The standard JSON output wraps every cell in an object and every row in a
+    list, which for tables of plain numbers and dates is most of the payload.
+    This format sends each column as an array of values instead:
+      - Null cells are left out of the values, and their positions are sent as
+        run lengths, alternating between runs of values and runs of nulls,
+        starting with a (possibly empty) run of values.
+      - String columns with repeated values are sent as a dictionary of the
+        distinct values, and an index into it per cell.
+      - Dates are sent as the number of days, datetimes as the number of
+        milliseconds, relative to the first value of the column. The first
+        value itself is sent as "base", relative to 1970-01-01.
+      - Times of day are sent as the number of seconds since midnight.
+      - Formatted values are sent in a separate array, and cell properties as
+        an object mapping row indexes to properties.
+
+    The googlecharts_datatable() function in gcharts/gcharts.html expands it
+    into a google.visualization.DataTable.
+
+    Args:
+      columns_order: Optional. Same as in ToJSon().
+      order_by: Optional. Same as in ToJSon().
 
-    response_obj = {
+    Returns:
+      A JSON string, encoded in UTF-8.
+      Example result (newlines added for readability):
+       {"format":"columnar","n":4,
+        "cols":[{"id":"a","label":"a","type":"date"},
+                {"id":"b","label":"b","type":"string"}],
+        "data":[{"base":15706,"v":[0,1,2,3]},
+                {"nulls":[1,1,2],"dict":["x","y"],"v":[0,1,1]}]}
+
+    Raises:
+      DataTableException: The data does not match the type.
+    """
+    if columns_order is None:
+      columns_order = [col["id"] for col in self.__columns]
+    col_dict = dict([(col["id"], col) for col in self.__columns])
+
+    rows = list(self._RowSource(order_by, columns_order=columns_order))
+    if rows:
+      columns = itertools.izip(*[cells for cells, unused_cp in rows])
+    else:
+      columns = [() for unused_col in columns_order]
+    col_objs = [self._ColumnarJSonObj(col_dict[col_id]["type"], cells)
+                for col_id, cells in itertools.izip(columns_order, columns)]
+    row_properties = dict([(str(i), cp)
+                           for i, (unused_cells, cp) in enumerate(rows) if cp])
+
+    dumps = self.json_backend.Dumps
+    json_parts = ["{\"format\":\"columnar\",\"n\":%d,\"cols\":" % len(rows),
+                  dumps(self._ColumnsJSonObj(columns_order, col_dict)),
+                  ",\"data\":", dumps(col_objs)]
+    if row_properties:
+      json_parts.extend([",\"rp\":", dumps(row_properties)])
+    if self.custom_properties:
+      json_parts.extend([",\"p\":", dumps(self.custom_properties)])
+    json_parts.append("}")
+    return "".join(json_parts)
+
+  @staticmethod
+  def _ColumnarJSonObj(col_type, cells):
+    """Returns the object of a single column for ToJSonColumnar().
+
+    Internal helper method. cells must already be coerced.
+    """
+    values = []
+    runs = []
+    formatted = []
+    properties = {}
+    run = 0
+    in_nulls = False
+    for i, cell in enumerate(cells):
+      if isinstance(cell, tuple):
+        if len(cell) > 1 and cell[1] is not None:
+          formatted.append((i, cell[1]))
+        if len(cell) == 3:
+          properties[str(i)] = cell[2]
+        cell = cell[0]
+      if (cell is None) != in_nulls:
+        runs.append(run)
+        run = 0
+        in_nulls = not in_nulls
+      run += 1
+      if cell is not None:
+        values.append(cell)
+    runs.append(run)
+
+    col_obj = {}
+    if len(runs) > 1:
+      col_obj["nulls"] = runs
+    if values and col_type == "date":
+      values = [value.toordinal() - _EPOCH_ORDINAL for value in values]
+      col_obj["base"] = values[0]
+      values = [value - values[0] for value in values]
+    elif values and col_type == "datetime":
+      values = [(value.toordinal() - _EPOCH_ORDINAL) * 86400000 +
+                value.hour * 3600000 + value.minute * 60000 +
+                value.second * 1000 + value.microsecond // 1000
+                for value in values]
+      col_obj["base"] = values[0]
+      values = [value - values[0] for value in values]
+    elif col_type == "timeofday":
+      values = [value.hour * 3600 + value.minute * 60 + value.second
+                for value in values]
+    elif col_type == "string":
+      codes = {}
+      for value in values:
+        codes.setdefault(value, len(codes))
+      if len(codes) < len(values):
+        dictionary = [None] * len(codes)
+        for value, code in codes.iteritems():
+          dictionary[code] = value
+        col_obj["dict"] = dictionary
+        values = [codes[value] for value in values]
+    col_obj["v"] = values
+    if formatted:
+      col_obj["f"] = [None] * len(cells)
+      for i, value in formatted:
+        col_obj["f"][i] = value
+    if properties:
+      col_obj["p"] = properties
+    return col_obj
+
+  @staticmethod
+  def ParseTqx(tqx):
+    """Parses the tqx request parameter of a Google Visualization API query.
+
+    The response handler is written into the response as JavaScript code, so
+    anything but the name of a function is replaced by the default handler.
+
+    Args:
+      tqx: The request string as received by HTTP GET, in the format
+           "key1:value1;key2:value2...". Values may contain colons.
+
+    Returns:
+      A dictionary with the options of the request. The "version", "out",
+      "reqId" and "responseHandler" keys default to their defaults, and "sig"
+      defaults to None.
+    """
+    tqx_dict = {
         "version": "0.6",
-        "reqId": str(req_id),
-        "table": self._ToJSonObj(columns_order, order_by),
-        "status": "ok"
+        "out": "json",
+        "reqId": "0",
+        "responseHandler": DEFAULT_RESPONSE_HANDLER,
+        "sig": None,
     }
-    encoder = DataTableJSONEncoder()
-    return "%s(%s);" % (response_handler,
-                        encoder.encode(response_obj).encode("utf-8"))
+    for opt in (tqx or "").split(";"):
+      if ":" in opt:
+        key, value = opt.split(":", 1)
+        tqx_dict[key] = value
+    if not _RESPONSE_HANDLER.match(tqx_dict["responseHandler"]):
+      tqx_dict["responseHandler"] = DEFAULT_RESPONSE_HANDLER
+    return tqx_dict
 
   def ToResponse(self, columns_order=None, order_by=(), tqx=""):
     """Writes the right response according to the request string passed in tqx.
@@ -1058,7 +2115,8 @@ class DataTable(object):
       tqx: Optional. The request string as received by HTTP GET. Should be in
            the format "key1:value1;key2:value2...". All keys have a default
            value, so an empty string will just do the default (which is calling
-           ToJSonResponse() with no extra parameters).
+           ToJSonResponse() with no extra parameters). The "sig" key is passed
+           to ToJSonResponse(). See ParseTqx().
 
     Returns:
       A response string, as returned by the relevant response function.
@@ -1066,20 +2124,17 @@ class DataTable(object):
     Raises:
       DataTableException: One of the parameters passed in tqx is not supported.
     """
-    tqx_dict = {}
-    if tqx:
-      tqx_dict = dict(opt.split(":") for opt in tqx.split(";"))
-    if tqx_dict.get("version", "0.6") != "0.6":
+    tqx_dict = self.ParseTqx(tqx)
+    if tqx_dict["version"] != "0.6":
       raise DataTableException(
           "Version (%s) passed by request is not supported."
           % tqx_dict["version"])
 
-    if tqx_dict.get("out", "json") == "json":
-      response_handler = tqx_dict.get("responseHandler",
-                                      "google.visualization.Query.setResponse")
+    if tqx_dict["out"] == "json":
       return self.ToJSonResponse(columns_order, order_by,
-                                 req_id=tqx_dict.get("reqId", 0),
-                                 response_handler=response_handler)
+                                 req_id=tqx_dict["reqId"],
+                                 response_handler=tqx_dict["responseHandler"],
+                                 sig=tqx_dict["sig"])
     elif tqx_dict["out"] == "html":
       return self.ToHtml(columns_order, order_by)
     elif tqx_dict["out"] == "csv":
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends import util
+from django.utils.importlib import import_module
+
+GREEN_THREAD_LIBRARIES = ("eventlet", "gevent")
+
+
+def green_switch(library):
+    """
+    Return a function which lets the other green threads of
+    library run, or None if library is None.
+    """
+    if library is None:
+        return None
+    if library not in GREEN_THREAD_LIBRARIES:
+        raise ImproperlyConfigured("%s is not a valid green thread library. Valid libraries are %s"
+                                   % (library, ", ".join(GREEN_THREAD_LIBRARIES)))
+    return functools.partial(import_module(library).sleep, 0)
+
+
+class ChunkedCursor(object):
+    """
+    Wraps a database cursor, so fetchmany() reads chunk_size
+    rows at a time, whatever size the caller asks for.
+
+    If switch is given, it is called after every chunk, to let
+    other green threads run while a long result is serialized.
+    """
+    def __init__(self, cursor, chunk_size, switch=None):
+        self.cursor = cursor
+        self.chunk_size = chunk_size
+        self.switch = switch
+
+    def fetchmany(self, size=None):
+        rows = self.cursor.fetchmany(self.chunk_size)
+        if self.switch is not None:
+            self.switch()
+        return rows
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+class ChunkedConnection(object):
+    """
+    Proxy of a database connection, handing out ChunkedCursors.
+
+    On PostgreSQL the cursors are named server-side cursors, so
+    the rows are kept by the database until they are fetched,
+    instead of being buffered by the driver. Named cursors only
+    live inside a transaction, so they are not used if the
+    connection is in autocommit mode, or if server-side cursors
+    are disabled by GOOGLECHARTS_SERVER_SIDE_CURSORS in settings.py.
+    """
+    def __init__(self, connection, chunk_size, switch=None):
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.switch = switch
+
+    def __getattr__(self, attr):
+        return getattr(self.connection, attr)
+
+    def cursor(self):
+        cursor = self.connection.cursor()
+        if (self.connection.vendor == "postgresql" and not self.connection.features.uses_autocommit and
+                getattr(settings, "GOOGLECHARTS_SERVER_SIDE_CURSORS", True)):
+            # self.connection.cursor() opened the connection, swap
+            # its cursor for a named one on the same connection.
+            cursor.close()
+            cursor = self.connection.connection.cursor(name="gcharts_%s" % uuid.uuid4().hex)
+            cursor.itersize = self.chunk_size
+            if settings.USE_TZ:
+                from django.db.backends.postgresql_psycopg2.base import utc_tzinfo_factory
+                cursor.tzinfo_factory = utc_tzinfo_factory
+            else:
+                cursor.tzinfo_factory = None
+            if (self.connection.use_debug_cursor or
+                    (self.connection.use_debug_cursor is None and settings.DEBUG)):
+                cursor = self.connection.make_debug_cursor(cursor)
+            else:
+                cursor = util.CursorWrapper(cursor, self.connection)
+        return ChunkedCursor(cursor, self.chunk_size, self.switch)
+
+
+def chunked(query, chunk_size, switch=None):
+    """
+    Make query read its rows from the database chunk_size at a
+    time, through a ChunkedConnection, calling switch after
+    every chunk.
+
+    query is changed in place, so only pass a query which is
+    not shared, i.e. the query of a freshly cloned QuerySet.
+    """
+    get_compiler = query.get_compiler
+
+    def chunked_get_compiler(using=None, connection=None):
+        compiler = get_compiler(using, connection)
+        compiler.connection = ChunkedConnection(compiler.connection, chunk_size, switch)
+        return compiler
+
+    query.get_compiler = chunked_get_compiler
+    return query
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import decimal
+import math
+
+_NUMBERS = (int, long, float, decimal.Decimal)
+
+
+def _x_value(value, index):
+    """
+    Return value as a number on the x axis, or index for values
+    which can't be placed on an axis.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.toordinal() + (value.hour * 3600 + value.minute * 60 + value.second +
+                                    value.microsecond / 1e6) / 86400.0
+    if isinstance(value, datetime.date):
+        return float(value.toordinal())
+    if isinstance(value, datetime.time):
+        return value.hour * 3600 + value.minute * 60 + value.second + value.microsecond / 1e6
+    if isinstance(value, _NUMBERS) and not isinstance(value, bool):
+        return float(value)
+    return float(index)
+
+
+def _average(points):
+    """
+    Return the average point of points, ignoring missing values.
+    """
+    x = sum(p[0] for p in points) / len(points)
+    ys = []
+    for j in range(len(points[0][1])):
+        values = [p[1][j] for p in points if p[1][j] is not None]
+        ys.append(sum(values) / len(values) if values else None)
+    return x, ys
+
+
+def _select(bucket, a, c):
+    """
+    Return the (point, row) in bucket making the largest triangle
+    with the points a and c, summed over all series.
+    """
+    best, best_area = bucket[0], -1.0
+    ax, ays = a
+    cx, cys = c
+    for point, row in bucket:
+        bx, bys = point
+        area = 0.0
+        for ay, by, cy in zip(ays, bys, cys):
+            if ay is not None and by is not None and cy is not None:
+                area += abs((ax - cx) * (by - ay) - (ax - bx) * (cy - ay))
+        if area > best_area:
+            best, best_area = (point, row), area
+    return best
+
+
+def lttb(rows, count, max_points, x, ys):
+    """
+    Downsample rows to at most max_points rows with the
+    Largest-Triangle-Three-Buckets algorithm, keeping the rows
+    which best preserve the shape of the series.
+
+    The rows are read in a single pass, and only two buckets of
+    rows are held in memory at a time. The first and the last
+    row are always kept.
+
+    kwargs:
+        rows:   Iterable of row tuples, ordered by column x.
+        count:  Number of rows, which sets the bucket sizes.
+        max_points: Maximum number of rows to return, at least 3.
+        x:      Index of the column of the x axis.
+        ys:     Indexes of the columns of the numeric series.
+    """
+    if count <= max_points:
+        for row in rows:
+            yield row
+        return
+
+    def point(row, index):
+        return _x_value(row[x], index), [None if row[y] is None else float(row[y]) for y in ys]
+
+    rows = iter(rows)
+    try:
+        first = next(rows)
+    except StopIteration:
+        return
+    yield first
+    a = point(first, 0)
+
+    every = (count - 2) / float(max_points - 2)
+    # The bucket to select a row from, and the bucket after it
+    buckets = [[]]
+    bucket_index = 0
+    index = 0
+    last = None
+    for row in rows:
+        if last is not None:
+            # Bucket b holds the rows from floor(b * every) + 1
+            b = min(int(math.ceil(index / every)) - 1, max_points - 3)
+            if b != bucket_index:
+                if len(buckets) == 2:
+                    a, selected = _select(buckets.pop(0), a, _average([p for p, r in buckets[0]]))
+                    yield selected
+                buckets.append([])
+                bucket_index = b
+            buckets[-1].append((point(last, index), last))
+        last = row
+        index += 1
+    if last is None:
+        return
+
+    c = point(last, index)
+    buckets = [bucket for bucket in buckets if bucket]
+    for i, bucket in enumerate(buckets):
+        target = i + 1 < len(buckets) and _average([p for p, r in buckets[i + 1]]) or c
+        a, selected = _select(bucket, a, target)
+        yield selected
+    yield last
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import get_model, get_models
+from django.db.transaction import commit_on_success
+
+from gcharts import invalidate_cache, rollups
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the rollup tables of models from their tables.
+    """
+    args = "[app_label.ModelName ...]"
+    help = "Rebuilds the rollup tables of the given models, or of all models with rollups."
+    option_list = BaseCommand.option_list + (
+        make_option("--database", action="store", dest="database", default=DEFAULT_DB_ALIAS,
+                    help="Nominates a database to rebuild the rollups in. "
+                         "Defaults to the \"default\" database."),
+    )
+
+    def handle(self, *labels, **options):
+        using = options.get("database")
+
+        # Load all models, which prepares their rollups
+        get_models()
+        if labels:
+            models = []
+            for label in labels:
+                try:
+                    app_label, model_name = label.split(".")
+                except ValueError:
+                    raise CommandError("Models must be given as app_label.ModelName, not %s" % label)
+                model = get_model(app_label, model_name)
+                if model is None or not rollups.rollups_for(model):
+                    raise CommandError("%s is not a model with rollups" % label)
+                models.append(model)
+        else:
+            models = list(rollups.all_rollups())
+
+        for model in models:
+            for rollup in rollups.rollups_for(model):
+                with commit_on_success(using=using):
+                    rollup.rebuild(using)
+                self.stdout.write("Rebuilt %s, %d rows\n" %
+                                  (rollup.model._meta.db_table,
+                                   rollup.model._base_manager.using(using).count()))
+            invalidate_cache(model)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+from django.utils import six
+
+
+def column_id(value):
+    """
+    Return the id of the pivoted column of value.
+    """
+    return six.text_type(value)
+
+
+def pivot_rows(rows, positions, width):
+    """
+    Pivot rows into one row per index value, in a single pass
+    over the rows. Cells without a value are None.
+
+    kwargs:
+        rows:   Iterable of (index, column, value) tuples, ordered
+                by index.
+        positions: Dictionary mapping {'column id': position} of
+                the pivoted columns, see column_id(). Values of
+                columns which are not in positions are skipped.
+        width:  Number of columns of the pivoted rows, the index
+                is the first one.
+    """
+    row = None
+    for index, column, value in rows:
+        if row is None or index != row[0]:
+            if row is not None:
+                yield tuple(row)
+            row = [None] * width
+            row[0] = index
+        position = positions.get(column_id(column))
+        if position is not None:
+            row[position] = value
+    if row is not None:
+        yield tuple(row)
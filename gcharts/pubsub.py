@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class Subscription(object):
+    """
+    Subscription to the change notifications of channels,
+    returned by LocalPubSub.subscribe(). Notifications to the
+    same channel are coalesced until they are read.
+    """
+    def __init__(self, pubsub, channels):
+        self.pubsub = pubsub
+        self.channels = frozenset(channels)
+        self._changed = set()
+        self._condition = threading.Condition()
+
+    def notify(self, channel):
+        with self._condition:
+            self._changed.add(channel)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Return the set of channels notified since the last call,
+        waiting up to timeout seconds for a notification if there
+        are none. The set is empty if the wait timed out.
+        """
+        with self._condition:
+            if timeout is not None:
+                deadline = time.time() + timeout
+            while not self._changed:
+                if timeout is None:
+                    self._condition.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            changed, self._changed = self._changed, set()
+        return changed
+
+    def close(self):
+        self.pubsub.unsubscribe(self)
+
+
+class LocalPubSub(object):
+    """
+    Publish/subscribe of change notifications between the threads
+    of a single process, the default backend of GOOGLECHARTS_PUBSUB.
+
+    Other backends, e.g. publishing between processes, only need
+    publish(channel) and subscribe(channels) methods, returning
+    objects with the get(timeout) and close() methods of
+    Subscription.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def publish(self, channel):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.notify(channel)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscriptions = self._subscriptions.get(channel)
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del self._subscriptions[channel]
@@ -0,0 +1,644 @@
+# -*- coding: utf-8 -*-
+#
+# Parser for the Google Visualization API query language, the "tq" request
+# parameter sent by google.visualization.Query. The query is compiled into
+# the Django ORM, so filtering, grouping, sorting and paging are done by
+# the database.
+#
+# https://developers.google.com/chart/interactive/docs/querylanguage
+#
+
+import re
+import sre_parse
+import string
+from datetime import date, datetime, time
+
+from django.core.exceptions import FieldError
+from django.db.models import Q, F, Avg, Count, Max, Min, Sum
+from django.utils import six
+
+
+class InvalidQuery(Exception):
+    """
+    Raised if a query can't be parsed, or refers to columns
+    which are not available in the data source.
+    """
+    pass
+
+
+AGGREGATES = {
+    "avg": Avg,
+    "count": Count,
+    "max": Max,
+    "min": Min,
+    "sum": Sum,
+}
+
+# Comparison operators, and the lookups they compile to.
+# None is a negated exact lookup.
+COMPARISONS = {
+    "=": "exact",
+    "!=": None,
+    "<>": None,
+    "<": "lt",
+    "<=": "lte",
+    ">": "gt",
+    ">=": "gte",
+    "contains": "contains",
+    "starts with": "startswith",
+    "ends with": "endswith",
+    "matches": "regex",
+    "like": "regex",
+}
+
+# Operators which only compare strings
+_STRING_OPERATORS = ("contains", "starts with", "ends with", "matches", "like")
+
+# Longest regular expression accepted by matches
+MAX_REGEX_LENGTH = 100
+
+# Values formatting patterns are tried on, by column type
+_SAMPLE_VALUES = {
+    "boolean": True,
+    "number": 0,
+    "string": u"",
+    "date": date(2000, 1, 1),
+    "datetime": datetime(2000, 1, 1),
+    "timeofday": time(0, 0),
+}
+
+# Widest and most precise formatting accepted in the format clause
+MAX_FORMAT_WIDTH = 100
+
+# Standard format specifications, [[fill]align][sign][#][0][width][,][.precision][type]
+_FORMAT_SPEC = re.compile(r"^(?:[^{}]?[<>=^])?[-+ ]?#?0?(?P<width>\d*),?(?:\.(?P<precision>\d+))?[bcdeEfFgGnosxX%]?\Z")
+
+# strftime() format specifications of dates
+_DATE_FORMAT_SPEC = re.compile(r"^[^{}%]*(?:%[A-Za-z%][^{}%]*)+\Z")
+
+# Operators to use when the column is on the right hand side.
+_FLIPPED = {"<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+_CLAUSES = ("select", "where", "group by", "pivot", "order by",
+            "limit", "offset", "label", "format", "options")
+
+_TOKENS = re.compile(r"""
+    \s*(?:
+        (?P<number>-?(?:\d+(?:\.\d*)?|\.\d+))
+      | (?P<string>'[^']*'|"[^"]*")
+      | (?P<quoted>`[^`]*`)
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op><=|>=|!=|<>|[=<>(),*])
+    )""", re.VERBOSE)
+
+
+def _tokenize(tq):
+    tokens = []
+    pos = 0
+    tq = tq.rstrip()
+    while pos < len(tq):
+        match = _TOKENS.match(tq, pos)
+        if match is None:
+            raise InvalidQuery("Unexpected character at position %d: %s" % (pos, tq[pos:pos + 10]))
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind in ("string", "quoted"):
+            value = value[1:-1]
+        elif kind == "name":
+            # identifiers are case sensitive, keywords are not
+            tokens.append(("name", value, value.lower()))
+            pos = match.end()
+            continue
+        tokens.append((kind, value, value))
+        pos = match.end()
+    return tokens
+
+
+def _literal_type(value):
+    """
+    Return the column type of a literal in a query.
+    """
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, six.string_types):
+        return "string"
+    if isinstance(value, datetime):
+        return "datetime"
+    if isinstance(value, date):
+        return "date"
+    if isinstance(value, time):
+        return "timeofday"
+    return "number"
+
+
+def _like_lookup(pattern):
+    """
+    Return the lookup and value matching the SQL LIKE pattern.
+    Patterns with wildcards only at their ends are matched with
+    the startswith, endswith or contains lookups, anything else
+    with a regular expression.
+    """
+    core = pattern.strip("%")
+    if "_" in core or "%" in core:
+        return "regex", _like_to_regex(pattern)
+    if pattern.startswith("%") and pattern.endswith("%"):
+        return "contains", core
+    if pattern.startswith("%"):
+        return "endswith", core
+    if pattern.endswith("%"):
+        return "startswith", core
+    return "exact", core
+
+
+def _backtracks(subpattern, repeated=False):
+    """
+    Return whether the parsed regular expression subpattern has
+    backreferences or repetitions of repetitions, which may take
+    exponential time to match.
+    """
+    for op, av in subpattern:
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            return True
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            low, high, item = av
+            if high > 1 and repeated:
+                return True
+            if _backtracks(item, repeated or high > 1):
+                return True
+        elif op == sre_parse.SUBPATTERN:
+            if _backtracks(av[-1], repeated):
+                return True
+        elif op == sre_parse.BRANCH:
+            if any(_backtracks(item, repeated) for item in av[1]):
+                return True
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            if _backtracks(av[1], repeated):
+                return True
+    return False
+
+
+def _check_regex(regex):
+    """
+    Raise InvalidQuery unless regex is a valid regular expression
+    of at most MAX_REGEX_LENGTH characters, without backreferences
+    or repetitions of repetitions. Databases like SQLite match
+    regular expressions by backtracking, so a pattern like (a+)+
+    sent by a client could keep them busy for ages.
+    """
+    if len(regex) > MAX_REGEX_LENGTH:
+        raise InvalidQuery("Regular expressions can be at most %d characters long" % MAX_REGEX_LENGTH)
+    try:
+        re.compile(regex)
+        parsed = sre_parse.parse(regex)
+    except re.error as e:
+        raise InvalidQuery("Invalid regular expression '%s': %s" % (regex, e))
+    if _backtracks(parsed):
+        raise InvalidQuery("Regular expression '%s' is too complex" % regex)
+
+
+def _like_to_regex(pattern):
+    """
+    Translate a SQL LIKE pattern into a regular expression.
+    """
+    regex = []
+    for char in pattern:
+        if char == "%":
+            regex.append(".*")
+        elif char == "_":
+            regex.append(".")
+        else:
+            regex.append(re.escape(char))
+    return "^%s$" % "".join(regex)
+
+
+class Column(object):
+    """
+    A column reference in a query, optionally wrapped
+    in an aggregation function.
+    """
+    def __init__(self, name, aggregate=None):
+        self.name = name
+        self.aggregate = aggregate
+
+    @property
+    def id(self):
+        """
+        The column id in the output, which is the name
+        Django gives the aggregate by default.
+        """
+        if self.aggregate is None:
+            return self.name
+        return "%s__%s" % (self.name, self.aggregate)
+
+    def __eq__(self, other):
+        return isinstance(other, Column) and (self.name, self.aggregate) == (other.name, other.aggregate)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.name, self.aggregate))
+
+    def __repr__(self):
+        return "<Column: %s>" % self.id
+
+
+class Query(object):
+    """
+    A parsed query.
+
+    attributes:
+        select: List of Column instances, or None to select all columns.
+        where:  Q object filtering the rows, or None.
+        group_by: List of column names to group by.
+        order_by: List of (Column, "asc|desc") tuples.
+        limit:  Maximum number of rows, or None.
+        offset: Number of rows to skip.
+        labels: Dictionary mapping {Column: 'label'}.
+        formatting: Dictionary mapping {Column: 'expression'}, where
+                expression is a string.format() compatible expression.
+    """
+    def __init__(self, tq):
+        self.select = None
+        self.where = None
+        self.group_by = []
+        self.order_by = []
+        self.limit = None
+        self.offset = 0
+        self.labels = {}
+        self.formatting = {}
+        self._names = set()
+        self._comparisons = []
+
+        self._tokens = _tokenize(tq or "")
+        self._pos = 0
+        self._parse()
+
+    #
+    # Parsing
+    #
+    def _peek(self, offset=0):
+        if self._pos + offset < len(self._tokens):
+            return self._tokens[self._pos + offset]
+        return (None, None, None)
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise InvalidQuery("Unexpected end of query")
+        self._pos += 1
+        return token
+
+    def _accept(self, *keywords):
+        """
+        Consume the keywords if they are next in the query.
+        """
+        for i, keyword in enumerate(keywords):
+            kind, value, lower = self._peek(i)
+            if kind not in ("name", "op") or lower != keyword:
+                return False
+        self._pos += len(keywords)
+        return True
+
+    def _expect(self, *keywords):
+        if not self._accept(*keywords):
+            raise InvalidQuery("Expected '%s' but found '%s'" % (" ".join(keywords),
+                                                                 self._peek()[1] or "end of query"))
+
+    def _parse(self):
+        clause_index = 0
+        while self._peek()[0] is not None:
+            for i, clause in enumerate(_CLAUSES):
+                if self._accept(*clause.split()):
+                    break
+            else:
+                raise InvalidQuery("Expected a clause but found '%s'" % self._peek()[1])
+            if i < clause_index:
+                raise InvalidQuery("Clause '%s' is out of order" % clause)
+            clause_index = i + 1
+            getattr(self, "_parse_%s" % clause.replace(" ", "_"))()
+
+    def _parse_name(self):
+        kind, value, lower = self._next()
+        if kind not in ("name", "quoted"):
+            raise InvalidQuery("Expected a column name but found '%s'" % value)
+        self._names.add(value)
+        return value
+
+    def _parse_column(self):
+        kind, value, lower = self._peek()
+        if kind == "name" and lower in AGGREGATES and self._peek(1)[1] == "(":
+            self._pos += 2
+            column = Column(self._parse_name(), lower)
+            self._expect(")")
+            return column
+        return Column(self._parse_name())
+
+    def _parse_list(self, parse_item):
+        items = [parse_item()]
+        while self._accept(","):
+            items.append(parse_item())
+        return items
+
+    def _parse_string(self):
+        kind, value, lower = self._next()
+        if kind != "string":
+            raise InvalidQuery("Expected a string but found '%s'" % value)
+        return value
+
+    def _parse_integer(self):
+        kind, value, lower = self._next()
+        if kind != "number" or not value.isdigit():
+            raise InvalidQuery("Expected a positive integer but found '%s'" % value)
+        return int(value)
+
+    def _parse_select(self):
+        if self._accept("*"):
+            return
+        self.select = self._parse_list(self._parse_column)
+
+    def _parse_where(self):
+        self.where = self._parse_or()
+
+    def _parse_or(self):
+        q = self._parse_and()
+        while self._accept("or"):
+            q = q | self._parse_and()
+        return q
+
+    def _parse_and(self):
+        q = self._parse_not()
+        while self._accept("and"):
+            q = q & self._parse_not()
+        return q
+
+    def _parse_not(self):
+        if self._accept("not"):
+            return ~self._parse_not()
+        if self._accept("("):
+            q = self._parse_or()
+            self._expect(")")
+            return q
+        return self._parse_condition()
+
+    def _parse_operand(self):
+        """
+        Return a tuple (is_column, value).
+        """
+        kind, value, lower = self._peek()
+        if kind == "number":
+            self._pos += 1
+            return False, float(value) if "." in value else int(value)
+        if kind == "string":
+            self._pos += 1
+            return False, value
+        if kind == "name" and lower in ("true", "false"):
+            self._pos += 1
+            return False, lower == "true"
+        if kind == "name" and lower in ("date", "datetime", "timestamp", "timeofday") \
+                and self._peek(1)[0] == "string":
+            self._pos += 1
+            return False, self._parse_date(lower, self._parse_string())
+        return True, self._parse_name()
+
+    def _parse_date(self, kind, value):
+        formats = {
+            "date": ("%Y-%m-%d",),
+            "datetime": ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"),
+            "timestamp": ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"),
+            "timeofday": ("%H:%M:%S.%f", "%H:%M:%S"),
+        }
+        for frmt in formats[kind]:
+            try:
+                value_dt = datetime.strptime(value, frmt)
+            except ValueError:
+                continue
+            if kind == "date":
+                return value_dt.date()
+            elif kind == "timeofday":
+                return value_dt.time()
+            return value_dt
+        raise InvalidQuery("Invalid %s literal '%s'" % (kind, value))
+
+    def _parse_operator(self):
+        for operator in ("<=", ">=", "!=", "<>", "=", "<", ">", "contains", "matches", "like"):
+            if self._accept(operator):
+                return operator
+        for operator in ("starts with", "ends with"):
+            if self._accept(*operator.split()):
+                return operator
+        raise InvalidQuery("Expected an operator but found '%s'" % (self._peek()[1] or "end of query"))
+
+    def _parse_condition(self):
+        left_is_column, left = self._parse_operand()
+        if self._accept("is"):
+            negate = self._accept("not")
+            self._expect("null")
+            if not left_is_column:
+                raise InvalidQuery("Expected a column name before 'is null'")
+            return Q(**{"%s__isnull" % left: not negate})
+
+        operator = self._parse_operator()
+        right_is_column, right = self._parse_operand()
+        if not left_is_column:
+            if not right_is_column or operator not in COMPARISONS or \
+                    (COMPARISONS[operator] not in (None, "exact") and operator not in _FLIPPED):
+                raise InvalidQuery("Conditions must compare a column")
+            left, right = right, left
+            left_is_column, right_is_column = True, False
+            operator = _FLIPPED.get(operator, operator)
+
+        self._comparisons.append((left, operator, right, right_is_column))
+        lookup = COMPARISONS[operator]
+        if right_is_column:
+            right = F(right)
+        elif operator == "like" and isinstance(right, six.string_types):
+            lookup, right = _like_lookup(right)
+        elif operator == "matches" and isinstance(right, six.string_types):
+            _check_regex(right)
+            right = "^(?:%s)$" % right
+        if lookup is None:
+            return ~Q(**{"%s__exact" % left: right})
+        return Q(**{"%s__%s" % (left, lookup): right})
+
+    def _parse_group_by(self):
+        self.group_by = self._parse_list(self._parse_name)
+
+    def _parse_pivot(self):
+        raise InvalidQuery("The pivot clause is not supported")
+
+    def _parse_order_by(self):
+        def parse_sort_key():
+            column = self._parse_column()
+            if self._accept("desc"):
+                return column, "desc"
+            self._accept("asc")
+            return column, "asc"
+        self.order_by = self._parse_list(parse_sort_key)
+
+    def _parse_limit(self):
+        self.limit = self._parse_integer()
+
+    def _parse_offset(self):
+        self.offset = self._parse_integer()
+
+    def _parse_label(self):
+        def parse_label():
+            column = self._parse_column()
+            self.labels[column] = self._parse_string()
+        self._parse_list(parse_label)
+
+    def _parse_format(self):
+        def parse_format():
+            column = self._parse_column()
+            self.formatting[column] = self._parse_pattern()
+        self._parse_list(parse_format)
+
+    def _parse_pattern(self):
+        """
+        Parse a string.format() expression formatting a single
+        value, with a standard or a strftime() format specification.
+        Attribute and index lookups, nested fields and widths or
+        precisions above MAX_FORMAT_WIDTH are rejected, since the
+        expression comes from the client.
+        """
+        pattern = self._parse_string()
+        try:
+            fields = list(string.Formatter().parse(pattern))
+        except ValueError as e:
+            raise InvalidQuery("Invalid format pattern '%s': %s" % (pattern, e))
+        for literal, name, spec, conversion in fields:
+            if name is None:
+                continue
+            if _DATE_FORMAT_SPEC.match(spec or ""):
+                width = precision = None
+            else:
+                match = _FORMAT_SPEC.match(spec or "")
+                if match is None:
+                    raise InvalidQuery("Invalid format pattern '%s'" % pattern)
+                width, precision = match.group("width", "precision")
+            if name not in ("", "0") or conversion not in (None, "r", "s") or \
+                    int(width or 0) > MAX_FORMAT_WIDTH or int(precision or 0) > MAX_FORMAT_WIDTH:
+                raise InvalidQuery("Invalid format pattern '%s'" % pattern)
+        return pattern
+
+    def _parse_options(self):
+        # options only affects the metadata of the response, which
+        # is never sent by the data source anyway.
+        self._parse_list(lambda: self._next())
+
+    #
+    # Compiling
+    #
+    def _check_types(self, available):
+        """
+        Raise InvalidQuery if a condition compares a column with a
+        value or column of another type, or a format pattern can't
+        format a value of the type of its column.
+        """
+        for name, operator, value, is_column in self._comparisons:
+            column_type = available[name][0]
+            if is_column:
+                value_type = available[value][0]
+                other = "the %s column '%s'" % (value_type, value)
+            else:
+                value_type = _literal_type(value)
+                other = "a %s" % value_type
+            if operator in _STRING_OPERATORS and column_type != "string":
+                raise InvalidQuery("'%s' can only be applied to string columns, '%s' is a %s" % (
+                    operator, name, column_type))
+            if value_type != column_type:
+                raise InvalidQuery("Can't compare the %s column '%s' with %s" % (column_type, name, other))
+        for column, frmt in six.iteritems(self.formatting):
+            if column.aggregate in ("avg", "count"):
+                column_type = "number"
+            else:
+                column_type = available[column.name][0]
+            # averages are floats, which can't be formatted as integers
+            sample = 0.0 if column.aggregate == "avg" else _SAMPLE_VALUES[column_type]
+            try:
+                frmt.format(sample)
+            except (ValueError, TypeError, OverflowError):
+                raise InvalidQuery("Format pattern '%s' can't format the %s column '%s'" % (
+                    frmt, column_type, column.id))
+
+    def compile(self, qset, labels=None, formatting=None):
+        """
+        Apply the query to qset.
+
+        Return a tuple (qset, order, labels, formatting), where order,
+        labels and formatting should be passed on to the to_* methods
+        of the returned QuerySet. labels and formatting are merged with
+        the ones given, and the ones in the query take precedence.
+
+        Only columns which are in the table description of qset can be
+        referred to in the query, and conditions and format patterns
+        must fit the types of the columns they apply to.
+        """
+        labels = dict(labels or {})
+        formatting = dict(formatting or {})
+        available = qset.table_description(dict(labels))
+        unknown = [name for name in self._names if name not in available]
+        if unknown:
+            raise InvalidQuery("Unknown column(s): %s" % ", ".join(sorted(unknown)))
+        self._check_types(available)
+
+        columns = list(self.select or [])
+        columns.extend(column for column, direction in self.order_by)
+        columns.extend(self.labels)
+        columns.extend(self.formatting)
+        aggregates = dict((column.id, AGGREGATES[column.aggregate](column.name))
+                          for column in columns if column.aggregate is not None)
+
+        if not qset.query.can_filter() and (self.where is not None or self.group_by or aggregates or
+                                            self.order_by):
+            raise InvalidQuery("The data source is sliced, so it can't be filtered, grouped or sorted")
+
+        if self.where is not None:
+            try:
+                qset = qset.filter(self.where)
+            except FieldError as e:
+                raise InvalidQuery(str(e))
+
+        order = None
+        if self.group_by or aggregates:
+            if not self.group_by:
+                raise InvalidQuery("Aggregation functions require a group by clause")
+            if self.select is None:
+                raise InvalidQuery("A group by clause requires a select clause")
+            for column in self.select:
+                if column.aggregate is None and column.name not in self.group_by:
+                    raise InvalidQuery("Column '%s' must be aggregated or grouped by" % column.name)
+            qset = qset.values(*self.group_by).annotate(**aggregates).order_by()
+        elif self.select is not None:
+            qset = qset.values(*set(column.name for column in self.select))
+        if self.select is not None:
+            order = [column.id for column in self.select]
+
+        if self.order_by:
+            qset = qset.order_by(*[(direction == "desc" and "-" or "") + column.id
+                                   for column, direction in self.order_by])
+        if self.limit is not None:
+            qset = qset[self.offset:self.offset + self.limit]
+        elif self.offset:
+            qset = qset[self.offset:]
+
+        for column, label in six.iteritems(self.labels):
+            if isinstance(labels.get(column.id), dict):
+                # extra fields are labeled as {'javascript type': 'label'}
+                labels[column.id] = {list(labels[column.id])[0]: label}
+            else:
+                labels[column.id] = label
+        for column, frmt in six.iteritems(self.formatting):
+            formatting[column.id] = frmt
+        if order is not None:
+            formatting = dict((k, v) for k, v in six.iteritems(formatting) if k in order)
+        return qset, order, labels, formatting
+
+
+def parse(tq):
+    """
+    Parse the query string tq, and return a Query.
+    Raises InvalidQuery if tq is not a valid query.
+    """
+    return Query(tq)
@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import operator
+from functools import reduce
+
+from django.core.exceptions import FieldError, ImproperlyConfigured
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import F, Q, signals
+from django.db.models.expressions import ExpressionNode
+from django.db.models.query import QuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils import six
+
+from gcharts import timeseries
+
+# Aggregates which can be kept up to date incrementally
+AGGREGATES = ("Count", "Sum")
+
+# Rollups by source model, the coarsest first
+_rollups = {}
+
+# Rollups of models which are not prepared yet
+_pending = {}
+
+# Number of groups to recompute or insert per query
+BATCH_SIZE = 500
+
+
+def register(model, rollups):
+    """
+    Register rollups for model, which are set up as soon as
+    the model class is prepared.
+    """
+    if model._meta.abstract or model._meta.proxy or not rollups:
+        return
+    # Managers are copied to subclasses, and so are their rollups
+    _pending[model] = [copy.copy(rollup) for rollup in rollups]
+
+
+def rollups_for(model):
+    """
+    Return the rollups of model, the coarsest first.
+    """
+    return _rollups.get(model, ())
+
+
+def all_rollups():
+    """
+    Return a dict mapping all models with rollups to their
+    rollups.
+    """
+    return dict(_rollups)
+
+
+def _prepare(sender, **kwargs):
+    rollups = _pending.pop(sender, None)
+    if rollups is None:
+        return
+    for rollup in rollups:
+        rollup.prepare(sender)
+    _rollups[sender] = sorted(rollups, key=lambda rollup: len(rollup.grain))
+    uid = "gcharts.rollups.%s.%s" % (sender._meta.app_label, sender.__name__)
+    signals.pre_save.connect(_pre_save, sender=sender, dispatch_uid=uid)
+    signals.post_save.connect(_post_save, sender=sender, dispatch_uid=uid)
+    signals.post_delete.connect(_post_delete, sender=sender, dispatch_uid=uid)
+
+signals.class_prepared.connect(_prepare)
+
+
+def _pre_save(sender, instance, using=None, **kwargs):
+    # Remember the stored values, to take them out of the rollups
+    stored = None
+    if instance.pk is not None:
+        names = set()
+        for rollup in rollups_for(sender):
+            names.update(rollup.fields)
+        rows = list(sender._base_manager.using(using).filter(pk=instance.pk).values(*names))
+        stored = rows and rows[0] or None
+    instance._gcharts_stored_values = stored
+
+
+def _post_save(sender, instance, using=None, **kwargs):
+    stored = instance.__dict__.pop("_gcharts_stored_values", None)
+    for rollup in rollups_for(sender):
+        rollup.apply(using, [(stored, -1), (rollup.values(instance), 1)])
+
+
+def _post_delete(sender, instance, using=None, **kwargs):
+    for rollup in rollups_for(sender):
+        rollup.apply(using, [(rollup.values(instance), -1)])
+
+
+def _filter_lookups(args, kwargs):
+    # Yield the (lookup, value) pairs of the arguments of filter()
+    children = list(args) + list(six.iteritems(kwargs))
+    while children:
+        child = children.pop()
+        if isinstance(child, Q):
+            children.extend(child.children)
+        elif isinstance(child, tuple) and len(child) == 2:
+            yield child
+        else:
+            yield None, child
+
+
+def _where_sql(qset):
+    compiler = qset.query.get_compiler(qset.db)
+    try:
+        return qset.query.where.as_sql(compiler.quote_name_unless_alias, compiler.connection)
+    except EmptyResultSet:
+        return EmptyResultSet
+
+
+class Rollup(object):
+    """
+    A summary table of a model, holding the aggregates of its
+    rows by the values of the grain fields, e.g. the sums of a
+    field per date and name:
+        Rollup(("date", "name"), {"number1_sum": Sum("number1")})
+
+    Rollups are declared by the rollups argument of the
+    GChartsManager of the model. The summary table is a model
+    named after the model and the grain, e.g. OtherData_date_name,
+    created by syncdb like any other model. It is kept up to date
+    as rows are saved and deleted, and by the bulk_create() and
+    update() methods of GChartsQuerySet. rebuild_rollups rebuilds
+    it from the model's table.
+
+    Only sums and counts can be kept up to date incrementally.
+    Sums of groups where all values are NULL are 0.
+
+    kwargs:
+        grain:  Iterable of the names of the fields to group by.
+        aggregates: Dictionary mapping {'alias': aggregate}, where
+                aggregate is Sum() or Count() of a field. The alias
+                names the field of the summary table, and can't
+                contain '__'.
+    """
+    def __init__(self, grain, aggregates):
+        self.grain = tuple(grain)
+        self.aggregates = dict(aggregates)
+        self.source = self.model = None
+
+    def prepare(self, source):
+        """
+        Create the model of the summary table of source.
+        """
+        opts = source._meta
+        attrs = {"__module__": source.__module__}
+        for name in self.grain:
+            try:
+                field = opts.get_field(name)
+            except models.FieldDoesNotExist:
+                raise ImproperlyConfigured("%s has no field named %s to roll up by" % (source.__name__, name))
+            attrs[name] = self._grain_field(field)
+
+        # Source fields of the aggregates, by alias
+        self.sources = {}
+        for alias, aggregate in six.iteritems(self.aggregates):
+            if aggregate.name not in AGGREGATES or aggregate.extra.get("distinct"):
+                raise ImproperlyConfigured("Only %s aggregates can be rolled up"
+                                           % ", ".join(AGGREGATES))
+            if alias in attrs or alias == "row_count" or "__" in alias:
+                raise ImproperlyConfigured("The alias %s of a rolled up aggregate is already in use, "
+                                           "or contains '__'" % alias)
+            try:
+                field = aggregate.lookup == "pk" and opts.pk or opts.get_field(aggregate.lookup)
+            except models.FieldDoesNotExist:
+                raise ImproperlyConfigured("%s has no field named %s to roll up" % (source.__name__,
+                                                                                    aggregate.lookup))
+            self.sources[alias] = field
+            attrs[alias] = self._aggregate_field(aggregate, field)
+        attrs["row_count"] = models.BigIntegerField(default=0)
+
+        class Meta:
+            app_label = opts.app_label
+            unique_together = (self.grain,)
+        attrs["Meta"] = Meta
+
+        name = "%s_%s" % (source.__name__, "_".join(self.grain))
+        self.source = source
+        self.model = type(str(name), (models.Model,), attrs)
+        self.fields = set(self.grain) | set(field.name for field in six.itervalues(self.sources))
+
+    @staticmethod
+    def _grain_field(field):
+        field = copy.deepcopy(field)
+        field.primary_key = False
+        field._unique = False
+        field.unique_for_date = field.unique_for_month = field.unique_for_year = None
+        if hasattr(field, "auto_now"):
+            field.auto_now = field.auto_now_add = False
+        if field.rel is not None:
+            field.rel.related_name = "+"
+        return field
+
+    @staticmethod
+    def _aggregate_field(aggregate, field):
+        internal_type = field.get_internal_type()
+        if aggregate.name == "Sum" and internal_type == "DecimalField":
+            return models.DecimalField(max_digits=field.max_digits + 10,
+                                       decimal_places=field.decimal_places, default=0)
+        if aggregate.name == "Sum" and internal_type == "FloatField":
+            return models.FloatField(default=0)
+        return models.BigIntegerField(default=0)
+
+    def _attnames(self, row):
+        # Foreign keys are given by their ids
+        opts = self.model._meta
+        return dict((opts.get_field(name).attname, value) for name, value in six.iteritems(row))
+
+    def values(self, instance):
+        """
+        Return a dict of the values of the fields of instance
+        which are rolled up.
+        """
+        return dict((name, getattr(instance, self.source._meta.get_field(name).attname))
+                    for name in self.fields)
+
+    #
+    # Incremental updates
+    #
+    def apply(self, using, changes):
+        """
+        Add rows to, or take rows out of, the summary table.
+
+        kwargs:
+            using:  Alias of the database.
+            changes: Iterable of (values, sign) tuples, where values
+                    is a dict as returned by values(), and sign is
+                    1 to add the row, or -1 to take it out. values
+                    of None are skipped.
+        """
+        groups = {}
+        for values, sign in changes:
+            if values is None:
+                continue
+            key = tuple(values[name] for name in self.grain)
+            deltas = groups.setdefault(key, dict.fromkeys(list(self.aggregates) + ["row_count"], 0))
+            for alias, aggregate in six.iteritems(self.aggregates):
+                field = self.sources[alias]
+                value = values[field.name]
+                if aggregate.name == "Count":
+                    value = int(field.primary_key or value is not None)
+                deltas[alias] += sign * (value or 0)
+            deltas["row_count"] += sign
+
+        manager = self.model._base_manager.db_manager(using)
+        for key, deltas in six.iteritems(groups):
+            if not any(six.itervalues(deltas)):
+                continue
+            lookup = dict(zip(self.grain, key))
+            updates = dict((alias, F(alias) + delta) for alias, delta in six.iteritems(deltas) if delta)
+            if manager.filter(**lookup).update(**updates):
+                pass
+            elif deltas["row_count"] > 0:
+                # Insert the group, or update it if it was inserted since
+                sid = transaction.savepoint(using=using)
+                try:
+                    manager.create(**self._attnames(dict(lookup, **deltas)))
+                    transaction.savepoint_commit(sid, using=using)
+                except IntegrityError:
+                    transaction.savepoint_rollback(sid, using=using)
+                    manager.filter(**lookup).update(**updates)
+            if deltas["row_count"] < 0:
+                manager.filter(row_count__lte=0, **lookup).delete()
+
+    def keys(self, qset):
+        """
+        Return the set of the groups of the rows of qset.
+        """
+        return set(qset.order_by().values_list(*self.grain).distinct())
+
+    def updated(self, using, keys, kwargs):
+        """
+        Bring the summary table up to date after the rows of the
+        groups keys were updated with kwargs by
+        GChartsQuerySet.update().
+        """
+        if not any(name in kwargs for name in self.fields):
+            return
+        changed = dict((i, kwargs[name]) for i, name in enumerate(self.grain) if name in kwargs)
+        if any(isinstance(value, ExpressionNode) for value in six.itervalues(changed)):
+            # The rows can have moved to any group
+            return self.rebuild(using)
+        moved = set(tuple(changed.get(i, value) for i, value in enumerate(key)) for key in keys)
+        self.refresh(using, keys | moved)
+
+    #
+    # Recomputing from the source table
+    #
+    def _grouped(self, qset):
+        aggregates = dict(self.aggregates, row_count=models.Count(self.source._meta.pk.name))
+        return qset.values(*self.grain).annotate(**aggregates).order_by()
+
+    def _insert(self, using, rows):
+        batch = []
+        for row in rows:
+            batch.append(self.model(**self._attnames(row)))
+            if len(batch) >= BATCH_SIZE:
+                self.model._base_manager.db_manager(using).bulk_create(batch)
+                batch = []
+        if batch:
+            self.model._base_manager.db_manager(using).bulk_create(batch)
+
+    def refresh(self, using, keys):
+        """
+        Recompute the groups keys of the summary table from the
+        source table.
+        """
+        keys = list(keys)
+        source = self.source._base_manager.using(using)
+        for i in range(0, len(keys), BATCH_SIZE):
+            groups = reduce(operator.or_, [Q(**dict(zip(self.grain, key)))
+                                           for key in keys[i:i + BATCH_SIZE]])
+            self.model._base_manager.using(using).filter(groups).delete()
+            self._insert(using, self._grouped(source.filter(groups)).iterator())
+
+    def rebuild(self, using):
+        """
+        Rebuild the summary table from the source table.
+        """
+        self.model._base_manager.using(using).all().delete()
+        self._insert(using, self._grouped(self.source._base_manager.using(using)).iterator())
+
+    #
+    # Routing
+    #
+    def route(self, qset, base):
+        """
+        Return a QuerySet reading the same data as qset from the
+        summary table, or None if it can't be read from it.
+
+        qset can be routed if it is a values() QuerySet, grouped
+        by grain fields and annotated with rolled up aggregates,
+        as well as filtered and ordered by grain fields only.
+
+        kwargs:
+            qset:   A GChartsQuerySet of the source model.
+            base:   A GChartsQuerySet of the summary table model,
+                    to build the QuerySet on.
+        """
+        query = qset.query
+        field_names = getattr(qset, "field_names", None)
+        if (field_names is None or not query.aggregates or query.having.children or query.distinct or
+                query.select_related or query.extra_tables or query.extra_order_by or
+                not set(field_names) <= set(self.grain)):
+            return None
+        table = self.source._meta.db_table
+        opts = self.source._meta
+        if sorted(query.group_by or []) != sorted((table, opts.get_field(name).column) for name in field_names):
+            return None
+
+        extra = {}
+        series = qset._timeseries
+        if series is not None:
+            if set(query.extra) != set([series["alias"]]) or series["field"] not in self.grain:
+                return None
+            connection = connections[qset.db]
+            column = "%s.%s" % (connection.ops.quote_name(self.model._meta.db_table),
+                                connection.ops.quote_name(self.model._meta.get_field(series["field"]).column))
+            extra[series["alias"]] = timeseries.truncate_sql(connection, series["interval"], column)
+        elif query.extra:
+            return None
+
+        aggregates = {}
+        for alias, aggregate in six.iteritems(query.aggregates):
+            for rolled_up, source in six.iteritems(self.aggregates):
+                if (type(aggregate).__name__ == source.name and not aggregate.extra.get("distinct") and
+                        aggregate.col == (table, self.sources[rolled_up].column)):
+                    aggregates[alias] = models.Sum(rolled_up)
+                    break
+            else:
+                return None
+
+        ordering = list(query.order_by)
+        if not ordering and query.default_ordering and opts.ordering:
+            return None
+        columns = set(self.grain) | set(aggregates) | set(extra)
+        if any(name.lstrip("-") not in columns for name in ordering):
+            return None
+
+        # Replay the filters on the summary table, and make sure
+        # they are all the filters of qset
+        replayed = QuerySet(self.source, using=qset.db)
+        for negate, args, kwargs in qset._filters:
+            for lookup, value in _filter_lookups(args, kwargs):
+                if (lookup is None or lookup.split("__")[0] not in self.grain or
+                        isinstance(value, ExpressionNode)):
+                    return None
+            replayed = replayed._filter_or_exclude(negate, *args, **kwargs)
+            try:
+                base = base._filter_or_exclude(negate, *args, **kwargs)
+            except FieldError:
+                return None
+        if _where_sql(replayed) != _where_sql(qset):
+            return None
+
+        if extra:
+            base = base.extra(select=extra)
+        routed = base.values(*(list(field_names) + list(extra))).annotate(**aggregates).order_by(*ordering)
+        routed.query.standard_ordering = query.standard_ordering
+        routed.query.set_limits(query.low_mark, query.high_mark)
+        return routed
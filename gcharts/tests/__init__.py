@@ -0,0 +1,12 @@
+from gcharts.tests.test_datatable import *
+from gcharts.tests.test_output import *
+from gcharts.tests.test_query import *
+from gcharts.tests.test_views import *
+from gcharts.tests.test_cache import *
+from gcharts.tests.test_downsampling import *
+from gcharts.tests.test_timeseries import *
+from gcharts.tests.test_pivot import *
+from gcharts.tests.test_rollups import *
+from gcharts.tests.test_since import *
+from gcharts.tests.test_batch import *
+from gcharts.tests.test_stream import *
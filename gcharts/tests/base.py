@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from django.test import TestCase
+
+from gcharts import rollups
+
+FIXTURES = [os.path.join(os.path.dirname(__file__), name)
+            for name in ("geo_test_data.json", "other_test_data.json")]
+
+
+class GChartsTestCase(TestCase):
+    """
+    Test case with the demo site data loaded, and the rollups
+    of the models built from it.
+    """
+    fixtures = FIXTURES
+    
+    def setUp(self):
+        for model_rollups in rollups.all_rollups().values():
+            for rollup in model_rollups:
+                rollup.rebuild("default")
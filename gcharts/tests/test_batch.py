@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from django.db import DatabaseError
+from django.db.models import Sum
+from django.test import TransactionTestCase
+
+from demosite.models import OtherData
+from gcharts import BatchTimeout, batch
+from gcharts.tests.base import FIXTURES
+
+
+class BatchTest(TransactionTestCase):
+    """
+    Runs in a TransactionTestCase, so the fixtures are committed
+    and can be read by the threads of the batch, which have their
+    own database connections.
+    """
+    fixtures = FIXTURES
+    
+    def setUp(self):
+        self.qsets = {
+            "names": OtherData.objects.values("name").annotate(Sum("number1")).order_by("name"),
+            "dates": OtherData.objects.values("date", "number1").order_by("date", "pk"),
+        }
+        self.threads = set()
+    
+    def spec(self, qset):
+        """
+        Return a spec of qset which notes the thread it runs in.
+        """
+        spec = qset.spec("to_json")
+        
+        def run():
+            self.threads.add(threading.current_thread().name)
+            return spec()
+        return run
+    
+    def test_concurrent(self):
+        outputs = batch(dict((name, self.spec(qset)) for name, qset in self.qsets.items()))
+        self.assertEqual(outputs, dict((name, qset.to_json()) for name, qset in self.qsets.items()))
+        self.assertTrue(all(name.startswith("gcharts-batch-") for name in self.threads), self.threads)
+    
+    def test_exception(self):
+        """
+        A chart which fails is returned as its exception, without
+        affecting the other charts.
+        """
+        def fail():
+            raise ValueError("spam")
+        outputs = batch({"names": self.spec(self.qsets["names"]), "failed": fail,
+                         "bogus": OtherData.objects.extra(where=["bogus = 1"]).spec("to_json")})
+        self.assertEqual(outputs["names"], self.qsets["names"].to_json())
+        self.assertIsInstance(outputs["failed"], ValueError)
+        self.assertIsInstance(outputs["bogus"], DatabaseError)
+    
+    def test_timeout(self):
+        """
+        Charts which are not ready in time are returned as a
+        BatchTimeout, without waiting for them.
+        """
+        release, finished = threading.Event(), threading.Event()
+        spec = self.qsets["dates"].spec("to_json")
+        
+        def slow():
+            release.wait(5)
+            try:
+                return spec()
+            finally:
+                finished.set()
+        start = time.time()
+        outputs = batch({"names": self.spec(self.qsets["names"]), "slow": slow}, timeout=0.2)
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(outputs["names"], self.qsets["names"].to_json())
+        self.assertIsInstance(outputs["slow"], BatchTimeout)
+        # let the chart finish before the test database goes away
+        release.set()
+        finished.wait(5)
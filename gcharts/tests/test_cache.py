@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+
+from django.db.models import Sum
+
+from demosite.models import OtherData
+from gcharts.tests.base import GChartsTestCase
+
+
+class CacheTest(GChartsTestCase):
+    
+    def test_invalidated_on_changes(self):
+        qset = OtherData.objects.values("name").annotate(Sum("number1")).order_by("name").cache()
+        cached = qset.to_json()
+        self.assertEqual(qset.to_json(), cached)
+        
+        obj = OtherData.objects.create(name="Zed", number1=5, number2=7, date=datetime.date(2010, 10, 9))
+        changed = qset.to_json()
+        self.assertNotEqual(changed, cached)
+        self.assertIn("Zed", changed)
+        
+        OtherData.objects.filter(pk=obj.pk).update(number1=6)
+        self.assertNotEqual(qset.to_json(), changed)
+        obj.delete()
+        self.assertEqual(qset.to_json(), cached)
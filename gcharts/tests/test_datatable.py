@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+import array
+import datetime
+import json
+import re
+
+from django.test import TestCase
+
+from gcharts.contrib.gviz_api import JSON_BACKENDS, DataTable, DataTableException, UJSONBackend, _ColumnStore
+
+
+def _store(value_type, values):
+    store = _ColumnStore(value_type)
+    for value in values:
+        store.Append(value)
+    return store
+
+
+def _storage(store):
+    """
+    Return the values and dictionary a _ColumnStore keeps.
+    """
+    return store._ColumnStore__values, store._ColumnStore__dictionary
+
+
+def _req_id(response):
+    """
+    Return the reqId of a JSON response, as written.
+    """
+    return re.search(r'"reqId":("[^"]*")', response).group(1)
+
+
+class ColumnStoreTest(TestCase):
+    
+    def assertStored(self, store, values):
+        self.assertEqual(len(store), len(values))
+        self.assertEqual(list(store), values)
+        self.assertEqual([store.Get(i) for i in range(len(values))], values)
+    
+    def test_numbers(self):
+        store = _store("number", [1, 2, 3L])
+        self.assertEqual(_storage(store)[0].typecode, "l")
+        self.assertStored(store, [1, 2, 3])
+        
+        store = _store("number", [None, 1.5, 2.5])
+        self.assertEqual(_storage(store)[0].typecode, "d")
+        self.assertStored(store, [None, 1.5, 2.5])
+    
+    def test_number_fallbacks(self):
+        """
+        Mixed, overflowing and non-numeric values are kept in a
+        plain list.
+        """
+        for values in ([1, 2.5], [2.5, 1], [1, 2 ** 100], [1, "2"], [1, None, True]):
+            store = _store("number", values)
+            self.assertIsInstance(_storage(store)[0], list, values)
+            self.assertStored(store, values)
+            self.assertEqual([type(value) for value in store], [type(value) for value in values])
+    
+    def test_dictionary_encoding(self):
+        values = [u"a", u"b", u"a", None, u"b", u"a"]
+        store = _store("string", values)
+        codes, dictionary = _storage(store)
+        self.assertIsInstance(codes, array.array)
+        self.assertEqual(dictionary, [None, u"a", u"b"])
+        self.assertStored(store, values)
+    
+    def test_dictionary_decoded(self):
+        """
+        Columns with too many distinct strings, or other values,
+        are decoded into a plain list.
+        """
+        values = [unicode(i) for i in range(_ColumnStore.DICTIONARY_LIMIT + 10)]
+        store = _store("string", values)
+        self.assertEqual(_storage(store), (values, None))
+        self.assertStored(store, values)
+        
+        values = [u"a", u"a"] * (_ColumnStore.DICTIONARY_LIMIT + 10) + values
+        store = _store("string", values)
+        self.assertEqual(_storage(store)[1][1], u"a")
+        self.assertStored(store, values)
+        
+        values = [u"a", 1, u"a"]
+        store = _store("string", values)
+        self.assertEqual(_storage(store), (values, None))
+        self.assertStored(store, values)
+    
+    def test_nulls(self):
+        """
+        The null bitmap spans several bytes, and nulls don't turn
+        into the placeholder values they are stored as.
+        """
+        for value_type, value in (("number", 7), ("number", 7.5), ("string", u"x"),
+                                  ("date", datetime.date(2010, 10, 9))):
+            values = [value if i % 3 else None for i in range(20)]
+            self.assertStored(_store(value_type, values), values)
+        self.assertStored(_store("number", [None] * 9), [None] * 9)
+    
+    def test_extras(self):
+        values = [(1, "one"), 2, (None, "none", {"style": "x"}), (4, None, {})]
+        self.assertStored(_store("number", values), values)
+
+
+class DataTableTest(TestCase):
+    
+    def test_rows(self):
+        table = DataTable([("name", "string"), ("n", "number")],
+                          [[u"a", 1], [u"b", None], [None, (2.5, "2.5")]])
+        self.assertEqual(table.NumberOfRows(), 3)
+        self.assertEqual(json.loads(table.ToJSon())["rows"],
+                         [{"c": [{"v": "a"}, {"v": 1}]}, {"c": [{"v": "b"}, None]},
+                          {"c": [None, {"v": 2.5, "f": "2.5"}]}])
+    
+    def test_parse_tqx(self):
+        tqx = DataTable.ParseTqx("reqId:a:b;out:csv;sig:5;bogus")
+        self.assertEqual(tqx, {"version": "0.6", "out": "csv", "reqId": "a:b", "sig": "5",
+                               "responseHandler": "google.visualization.Query.setResponse"})
+        self.assertEqual(DataTable.ParseTqx("responseHandler:my.handler")["responseHandler"], "my.handler")
+        for handler in ("alert(1);//", "x\n", "1x", ""):
+            self.assertEqual(DataTable.ParseTqx("responseHandler:" + handler)["responseHandler"],
+                             "google.visualization.Query.setResponse", handler)
+    
+    def test_responses(self):
+        """
+        ToResponse() parses tqx like the data source view, and the
+        request id is written the same by every response.
+        """
+        table = DataTable([("name", "string")], [[u"a/b"]], json_backend=UJSONBackend())
+        response = table.ToResponse(tqx="reqId:a/b:1;responseHandler:alert(1)//")
+        self.assertTrue(response.startswith('google.visualization.Query.setResponse({"version":"0.6",'
+                                            '"reqId":"a/b:1",'), response)
+        self.assertEqual(response, table.ToJSonResponse(req_id=u"a/b:1"))
+        for req_id in (u"a/b:1", u"\xe9", 7):
+            self.assertEqual(_req_id("".join(table.IterJSonResponse(req_id=req_id))),
+                             _req_id(table.ToJSonResponse(req_id=req_id)))
+        self.assertEqual(_req_id(table.ToJSonResponse(req_id=u"\xe9")), '"\\u00e9"')
+        self.assertEqual(table.ToResponse(tqx="out:csv"), table.ToCsv())
+        self.assertRaises(DataTableException, table.ToResponse, tqx="out:xml")
+
+
+class JSONBackendTest(TestCase):
+    
+    def table(self, backend, rows):
+        try:
+            json_backend = JSON_BACKENDS[backend]()
+        except ImportError:
+            self.skipTest("%s is not installed" % backend)
+        return DataTable([("name", "string"), ("n", "number"), ("date", "date")], rows,
+                         custom_properties={"url": u"http://x/\u2028"}, json_backend=json_backend)
+    
+    def test_same_output(self):
+        """
+        Every backend writes the same bytes, apart from the floats
+        written by ujson.
+        """
+        rows = [[u"a/b", 1, datetime.date(2010, 10, 9)], [u"<\xe9\"\\\n\x00>", 2 ** 80, None],
+                [(u"x", u"</script>", {"p": u"\u2028"}), -(2 ** 63), datetime.date(1970, 1, 1)]]
+        expected = self.table("json", rows).ToJSon()
+        for backend in ("simplejson", "ujson"):
+            self.assertEqual(self.table(backend, rows).ToJSon(), expected, backend)
+            self.assertEqual("".join(self.table(backend, rows).IterJSon()), expected, backend)
+    
+    def test_floats(self):
+        rows = [[None, value, None] for value in (0.1, 1e-07, 2.5e-05, 1e+22, 1.2345678901234568e+17, -0.0)]
+        expected = self.table("json", rows).ToJSon()
+        self.assertEqual(self.table("simplejson", rows).ToJSon(), expected)
+        self.assertEqual(json.loads(self.table("ujson", rows).ToJSon()), json.loads(expected))
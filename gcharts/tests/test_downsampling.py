@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+
+from django.test import TestCase
+
+from demosite.models import OtherData
+from gcharts import downsampling
+from gcharts.tests.base import GChartsTestCase
+
+
+class LTTBTest(TestCase):
+    
+    def test_keeps_small_series(self):
+        rows = [(i, i * 2) for i in range(10)]
+        self.assertEqual(list(downsampling.lttb(rows, len(rows), 10, 0, [1])), rows)
+    
+    def test_selects_extremes(self):
+        """
+        The first and last rows are kept, and so are the peaks of
+        a flat series.
+        """
+        rows = [(i, 0) for i in range(1000)]
+        rows[333] = (333, 100)
+        rows[666] = (666, -100)
+        points = list(downsampling.lttb(rows, len(rows), 20, 0, [1]))
+        self.assertEqual(len(points), 20)
+        self.assertEqual((points[0], points[-1]), (rows[0], rows[-1]))
+        self.assertIn((333, 100), points)
+        self.assertIn((666, -100), points)
+        self.assertEqual(points, sorted(points))
+    
+    def test_dates_and_nulls(self):
+        start = datetime.date(2010, 1, 1)
+        rows = [(start + datetime.timedelta(days=i), i % 7 or None) for i in range(100)]
+        points = list(downsampling.lttb(rows, len(rows), 10, 0, [1]))
+        self.assertEqual(len(points), 10)
+        self.assertTrue(all(point in rows for point in points))
+
+
+class DownsampleTest(GChartsTestCase):
+    
+    def test_downsample(self):
+        qset = OtherData.objects.values("id", "number1")
+        rows = json.loads(qset.order_by("id").downsample(20).to_json(order=("id", "number1")))["rows"]
+        self.assertEqual(len(rows), 20)
+        ids = [row["c"][0]["v"] for row in rows]
+        self.assertEqual(ids[0], OtherData.objects.order_by("id")[0].id)
+        self.assertEqual(ids, sorted(ids))
+    
+    def test_read_in_order_of_x(self):
+        """
+        The points are picked from the rows in the order of the x
+        axis, whatever the QuerySet is ordered by.
+        """
+        qset = OtherData.objects.values("id", "number1")
+        expected = qset.order_by("id").downsample(20).to_json(order=("id", "number1"))
+        self.assertEqual(qset.order_by("-number1").downsample(20).to_json(order=("id", "number1")), expected)
+        self.assertRaises(Exception, qset.order_by("number1")[:50].downsample(10).to_json, order=("id", "number1"))
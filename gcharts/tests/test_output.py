@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import re
+
+from django.db.models import Sum
+
+from demosite.models import OtherData
+from gcharts.contrib.gviz_api import DataTable
+from gcharts.tests.base import GChartsTestCase
+
+_DATE = re.compile(r"^Date\((\d+),(\d+),(\d+)\)$")
+
+
+def _json_rows(table_json):
+    """
+    Return the rows of a table serialized by ToJSon() as lists
+    of (value, formatted value) tuples, with dates as dates.
+    """
+    rows = []
+    for row in json.loads(table_json)["rows"]:
+        cells = []
+        for cell in row["c"]:
+            if cell is None:
+                cells.append((None, None))
+                continue
+            value = cell.get("v")
+            match = _DATE.match(value) if isinstance(value, basestring) else None
+            if match:
+                year, month, day = [int(g) for g in match.groups()]
+                value = datetime.date(year, month + 1, day)
+            cells.append((value, cell.get("f")))
+        rows.append(cells)
+    return rows
+
+
+def _columnar_rows(table_json):
+    """
+    Return the rows of a table serialized by ToJSonColumnar() in
+    the format of _json_rows(), decoded like gcharts.html does.
+    """
+    table = json.loads(table_json)
+    n = table["n"]
+    rows = [[None] * len(table["cols"]) for r in range(n)]
+    for c, (col, data) in enumerate(zip(table["cols"], table["data"])):
+        values = iter(data["v"])
+        r = 0
+        for i, run in enumerate(data.get("nulls", [n])):
+            for k in range(run):
+                value = None
+                if not i % 2:
+                    value = next(values)
+                    if "dict" in data:
+                        value = data["dict"][value]
+                    elif col["type"] == "date":
+                        value = datetime.date(1970, 1, 1) + datetime.timedelta(days=data["base"] + value)
+                rows[r][c] = value
+                r += 1
+        formatted = data.get("f") or [None] * n
+        for r in range(n):
+            rows[r][c] = (rows[r][c], formatted[r])
+    return rows
+
+
+class StreamingOutputTest(GChartsTestCase):
+    
+    def setUp(self):
+        super(StreamingOutputTest, self).setUp()
+        self.qset = OtherData.objects.values("name", "date", "number1").order_by("date", "name")
+    
+    def assertStreamEqual(self, method):
+        """
+        Assert that the streaming variant of an output method writes
+        the same output as the one returning it at once.
+        """
+        output = getattr(self.qset, method)(formatting={"number1": "{0:d} units"})
+        stream = "".join(getattr(self.qset, method + "_stream")(formatting={"number1": "{0:d} units"}))
+        if isinstance(output, unicode):
+            output = output.encode("utf-8")
+        self.assertEqual(output, stream, method)
+    
+    def test_json(self):
+        self.assertStreamEqual("to_json")
+    
+    def test_csv(self):
+        self.assertStreamEqual("to_csv")
+        self.assertStreamEqual("to_tsv_excel")
+    
+    def test_html(self):
+        self.assertStreamEqual("to_html")
+    
+    def test_stream_sorted(self):
+        output = self.qset.to_json(order_by=("number1", "desc"))
+        self.assertEqual(output, "".join(self.qset.to_json_stream(order_by=("number1", "desc"))))
+    
+    def test_columnar_round_trip(self):
+        """
+        The columnar JSON format decodes to the same rows as the
+        standard JSON format.
+        """
+        formatting = {"number1": "{0:d} units"}
+        columnar = self.qset.to_json(formatting=formatting, format="columnar")
+        self.assertEqual(_json_rows(self.qset.to_json(formatting=formatting)), _columnar_rows(columnar))
+        
+        # repeated strings
+        qset = OtherData.objects.values("name", "number2")
+        columnar = qset.to_json(format="columnar")
+        self.assertIn("dict", columnar)
+        self.assertEqual(_json_rows(qset.to_json()), _columnar_rows(columnar))
+    
+    def test_columnar_nulls(self):
+        table = DataTable([("date", "date"), ("name", "string"), ("n", "number")],
+                          [[datetime.date(2010, 10, 9), None, 1], [None, u"a", None],
+                           [None, None, (2, "two")], [datetime.date(2010, 10, 12), u"b", 3]])
+        columnar = table.ToJSonColumnar()
+        self.assertIn("nulls", columnar)
+        self.assertEqual(_json_rows(table.ToJSon()), _columnar_rows(columnar))
+
+
+
+class ResultTest(GChartsTestCase):
+    
+    def test_outputs(self):
+        """
+        Every output of the result of a single query is the same as
+        the output of the QuerySet method for it.
+        """
+        qset = OtherData.objects.values("name", "date", "number1").order_by("date", "name")
+        kwargs = {"order": ("date", "name", "number1"), "formatting": {"number1": "{0:d} units"}}
+        with self.assertNumQueries(1):
+            result = qset.to_datatable(**kwargs)
+            outputs = [result.json, result.columnar_json, result.html, result.csv, result.tsv_excel,
+                       result.javascript("data"), result.response("reqId:3")]
+        self.assertEqual(outputs, [qset.to_json(**kwargs), qset.to_json(format="columnar", **kwargs),
+                                   qset.to_html(**kwargs), qset.to_csv(**kwargs), qset.to_tsv_excel(**kwargs),
+                                   qset.to_javascript("data", **kwargs), qset.to_json_response(req_id=3, **kwargs)])
+        self.assertEqual(result.response("out:csv"), result.csv)
+
+
+class OrderByTest(GChartsTestCase):
+    
+    def setUp(self):
+        super(OrderByTest, self).setUp()
+        self.qset = OtherData.objects.values("name").annotate(Sum("number1"))
+    
+    def test_order_by_column(self):
+        rows = json.loads(self.qset.to_json(order_by=("number1__sum", "desc")))["rows"]
+        sums = [row["c"][1]["v"] for row in rows]
+        self.assertEqual(sums, sorted(sums, reverse=True))
+    
+    def test_order_by_other_field(self):
+        """
+        Keys which are not columns don't change the grouping, and
+        unknown keys are ignored.
+        """
+        expected = len(json.loads(self.qset.to_json())["rows"])
+        for order_by in ("number2", "bogus"):
+            self.assertEqual(len(json.loads(self.qset.to_json(order_by=order_by))["rows"]), expected)
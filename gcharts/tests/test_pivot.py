@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+
+from django.db.models import Count, Sum
+
+from demosite.models import OtherData
+from gcharts.tests.base import GChartsTestCase
+
+
+class PivotTest(GChartsTestCase):
+    
+    def test_columns(self):
+        qset = OtherData.objects.pivot("date", "name", Sum("number1"))
+        names = sorted(set(OtherData.objects.values_list("name", flat=True)))
+        self.assertEqual(list(qset.table_description()), ["date"] + names)
+        
+        table = json.loads(qset.to_json())
+        self.assertEqual([col["id"] for col in table["cols"]], ["date"] + names)
+        first = OtherData.objects.order_by("date")[0].date
+        self.assertEqual(len(table["rows"]), OtherData.objects.dates("date", "day").count())
+        column = names.index("Jene") + 1
+        self.assertEqual(table["rows"][0]["c"][column]["v"],
+                         sum(OtherData.objects.filter(date=first, name="Jene").values_list("number1", flat=True)))
+    
+    def test_missing_cells(self):
+        OtherData.objects.filter(name="Jene", date=datetime.date(2010, 10, 9)).delete()
+        table = json.loads(OtherData.objects.pivot("date", "name", Sum("number1")).to_json(order=("date", "Jene")))
+        self.assertEqual(table["rows"][0]["c"][1], None)
+    
+    def test_max_columns(self):
+        qset = OtherData.objects.pivot("date", "name", Count("id"), max_columns=3)
+        self.assertRaises(Exception, qset.to_json)
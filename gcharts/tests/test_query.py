@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+
+from django.test import TestCase
+
+from demosite.models import OtherData
+from gcharts.query import InvalidQuery, parse
+from gcharts.tests.base import GChartsTestCase
+
+
+class ParseTest(TestCase):
+    
+    def test_clauses(self):
+        query = parse("select name, sum(number1) where date >= date '2010-10-20' and not name = 'Jene' "
+                      "group by name order by sum(number1) desc limit 5 offset 2 "
+                      "label sum(number1) 'Total' format sum(number1) '{0:d} units'")
+        self.assertEqual([column.id for column in query.select], ["name", "number1__sum"])
+        self.assertEqual(query.group_by, ["name"])
+        self.assertEqual([(column.id, direction) for column, direction in query.order_by],
+                         [("number1__sum", "desc")])
+        self.assertEqual((query.limit, query.offset), (5, 2))
+        self.assertEqual(dict((column.id, label) for column, label in query.labels.items()),
+                         {"number1__sum": "Total"})
+        self.assertEqual(dict((column.id, frmt) for column, frmt in query.formatting.items()),
+                         {"number1__sum": "{0:d} units"})
+    
+    def test_invalid_queries(self):
+        for tq in ("select", "select name where", "where number1 >", "order by name select name",
+                   "select name limit -1", "pivot name", "select name ; drop table"):
+            self.assertRaises(InvalidQuery, parse, tq)
+    
+    def test_format_patterns(self):
+        for pattern in ("{0:d} units", "{:,.2f}", "{0:*^20}", "{0:%Y-%m-%d}", "{0!r}"):
+            parse("format number1 '%s'" % pattern)
+        for pattern in ("{0.__class__}", "{0[0]}", "{1}", "{0:>999999999}", "{0:.500f}", "{0:{1}}",
+                        "{0", "{0!a}", "{0:%Y%999d}"):
+            self.assertRaises(InvalidQuery, parse, "format number1 '%s'" % pattern)
+
+
+class CompileTest(GChartsTestCase):
+    
+    def compile(self, tq, qset=None):
+        if qset is None:
+            qset = OtherData.objects.all()
+        return parse(tq).compile(qset)
+    
+    def test_filter_and_select(self):
+        qset, order, labels, formatting = self.compile(
+            "select date, number1 where name = 'Jene' and number1 > 50 order by number1 desc limit 3")
+        self.assertEqual(order, ["date", "number1"])
+        expected = list(OtherData.objects.filter(name="Jene", number1__gt=50)
+                        .order_by("-number1").values_list("date", "number1")[:3])
+        self.assertEqual(list(qset.values_list("date", "number1")), expected)
+    
+    def test_group_by(self):
+        qset, order, labels, formatting = self.compile(
+            "select name, sum(number1) group by name label sum(number1) 'Total'")
+        self.assertEqual(labels, {"number1__sum": "Total"})
+        sums = dict((row["name"], row["number1__sum"]) for row in qset)
+        self.assertEqual(sums["Jene"], sum(OtherData.objects.filter(name="Jene").values_list("number1", flat=True)))
+    
+    def test_dates(self):
+        qset = self.compile("where date = date '2010-10-20'")[0]
+        self.assertEqual(set(qset.values_list("date", flat=True)), set([datetime.date(2010, 10, 20)]))
+    
+    def test_rejected(self):
+        for tq in ("select bogus", "select name, sum(number1)", "select number1 group by name",
+                   "where name = 'x' order by bogus"):
+            self.assertRaises(InvalidQuery, self.compile, tq)
+    
+    def test_types(self):
+        """
+        Conditions must compare columns with values and columns of
+        their own type, and format patterns fit their column.
+        """
+        for tq in ("where number1 = 'abc'", "where date > 5", "where name contains 5", "where number1 > name",
+                   "where number1 contains '1'", "where true = name", "where date = datetime '2010-10-20 00:00:00'",
+                   "format name '{0:d}'", "format number1 '{0:%Y}'",
+                   "select name, avg(number1) group by name format avg(number1) '{0:d}'"):
+            self.assertRaises(InvalidQuery, self.compile, tq)
+        self.compile("where number1 > number2 and number1 = 1.5 format number1 '{0:d}', date '{0:%Y}'")
+    
+    def test_like(self):
+        """
+        like patterns with wildcards only at their ends are compiled
+        to the string lookups instead of regular expressions.
+        """
+        for pattern, lookup in (("J%", "name__startswith"), ("%e", "name__endswith"),
+                                ("%en%", "name__contains"), ("Jene", "name__exact")):
+            qset = self.compile("where name like '%s'" % pattern)[0]
+            self.assertNotIn("REGEXP", str(qset.query))
+            self.assertEqual(set(qset), set(OtherData.objects.filter(**{lookup: pattern.strip("%")})))
+        qset = self.compile("where name like 'J_n%'")[0]
+        self.assertEqual(set(qset), set(OtherData.objects.filter(name__regex="^J.n")))
+    
+    def test_matches(self):
+        qset = self.compile("where name matches 'J.*|Ma+x'")[0]
+        self.assertEqual(set(qset), set(OtherData.objects.filter(name__regex="^(?:J.*|Ma+x)$")))
+        for regex in ("(", "a)", "(a+)+", "(a*)*b", "(a|b+)*", r"(a)\1", "(?P<x>a)(?P=x)", "a" * 101):
+            self.assertRaises(InvalidQuery, parse, "where name matches '%s'" % regex)
+    
+    def test_sliced(self):
+        sliced = OtherData.objects.order_by("pk")[:5]
+        for tq in ("where number1 > 1", "order by number1", "select name, sum(number1) group by name"):
+            self.assertRaises(InvalidQuery, self.compile, tq, sliced)
+        qset = self.compile("select name limit 2", sliced)[0]
+        self.assertEqual(len(json.loads(qset.to_json())["rows"]), 2)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+
+from django.db.models import F, Sum
+
+from demosite.models import OtherData
+from gcharts import rollups
+from gcharts.tests.base import GChartsTestCase
+
+
+class RollupTest(GChartsTestCase):
+    
+    def assertRolledUp(self):
+        """
+        Assert that charts read from the rollup give the same data
+        as summing the rows of the model.
+        """
+        expected = {}
+        for date, name, number1, number2 in OtherData.objects.values_list("date", "name", "number1", "number2"):
+            sums = expected.setdefault(date, [0, 0])
+            sums[0] += number1
+            sums[1] += number2
+        qset = OtherData.objects.values("date").annotate(a=Sum("number1"), b=Sum("number2"))
+        self.assertIsNot(qset._rolled_up().model, OtherData)
+        rows = [[cell["v"] for cell in row["c"]] for row in json.loads(qset.to_json(order=("date", "a", "b")))["rows"]]
+        self.assertEqual(dict((date, [a, b]) for date, a, b in rows),
+                         dict((date.strftime("Date(%Y,") + "%d,%d)" % (date.month - 1, date.day), sums)
+                              for date, sums in expected.items()))
+    
+    def test_routing(self):
+        self.assertRolledUp()
+        qset = OtherData.objects.filter(number1__gt=50).values("date").annotate(Sum("number1"))
+        self.assertIs(qset._rolled_up().model, OtherData)
+    
+    def test_save_and_delete(self):
+        obj = OtherData.objects.create(name="Zed", number1=5, number2=7, date=datetime.date(2010, 10, 9))
+        self.assertRolledUp()
+        obj.date = datetime.date(2011, 1, 1)
+        obj.number1 = 10
+        obj.save()
+        self.assertRolledUp()
+        obj.delete()
+        self.assertRolledUp()
+        rollup = rollups.rollups_for(OtherData)[0]
+        self.assertFalse(rollup.model.objects.filter(name="Zed").exists())
+    
+    def test_update(self):
+        OtherData.objects.filter(name="Jene").update(number1=F("number1") + 3)
+        self.assertRolledUp()
+        OtherData.objects.filter(name="Jene").update(date=datetime.date(2011, 1, 1))
+        self.assertRolledUp()
+    
+    def test_bulk_create_and_delete(self):
+        OtherData.objects.bulk_create([OtherData(name="Yan", number1=i, number2=1, date=datetime.date(2010, 10, 9))
+                                       for i in range(5)])
+        self.assertRolledUp()
+        OtherData.objects.filter(name__in=["Yan", "Jene"]).delete()
+        self.assertRolledUp()
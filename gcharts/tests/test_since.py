@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+
+from demosite.models import OtherData
+from gcharts.tests.base import GChartsTestCase
+
+
+class SinceTest(GChartsTestCase):
+    
+    def test_watermarks(self):
+        qset = OtherData.objects.values("date", "number1")
+        rows, watermark = qset.since("date")
+        self.assertEqual(rows.count(), OtherData.objects.count())
+        rows, same = qset.since("date", watermark)
+        self.assertEqual((rows.count(), same), (0, watermark))
+        
+        obj = OtherData.objects.create(name="Zed", number1=5, number2=7, date=datetime.date(2099, 1, 1))
+        rows, watermark = qset.since("date", watermark)
+        self.assertEqual(list(rows), [{"date": obj.date, "number1": 5}])
+        self.assertTrue(watermark.startswith("2099-01-01,"))
+    
+    def test_same_value(self):
+        """
+        Rows added later with the same value as the watermark are
+        returned by the next call.
+        """
+        rows, watermark = OtherData.objects.since("date")
+        last = OtherData.objects.order_by("-date")[0].date
+        obj = OtherData.objects.create(name="Zed", number1=5, number2=7, date=last)
+        rows, watermark = OtherData.objects.since("date", watermark)
+        self.assertEqual([row.pk for row in rows], [obj.pk])
+        self.assertEqual(OtherData.objects.since("date", watermark)[0].count(), 0)
+    
+    def test_primary_key(self):
+        rows, watermark = OtherData.objects.since("pk")
+        self.assertEqual(watermark, str(OtherData.objects.order_by("-pk")[0].pk))
+        obj = OtherData.objects.create(name="Zed", number1=5, number2=7, date=datetime.date(2010, 10, 9))
+        rows, watermark = OtherData.objects.since("pk", watermark)
+        self.assertEqual([row.pk for row in rows], [obj.pk])
+        self.assertEqual(watermark, str(obj.pk))
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import threading
+import time
+
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase
+from django.test.client import RequestFactory
+
+from demosite.models import OtherData
+from gcharts.pubsub import LocalPubSub
+from gcharts.tests.base import FIXTURES
+from gcharts.views import stream
+
+
+def _parse_event(chunk):
+    """
+    Return the fields of a Server-Sent Event as a dict.
+    """
+    fields = {}
+    for line in chunk.splitlines():
+        if not line:
+            continue
+        key, value = line.split(": ", 1)
+        fields[key] = fields[key] + "\n" + value if key in fields else value
+    return fields
+
+
+class PubSubTest(TestCase):
+    
+    def setUp(self):
+        self.pubsub = LocalPubSub()
+        self.subscription = self.pubsub.subscribe(["a", "b"])
+    
+    def test_coalesced(self):
+        for channel in ("a", "c", "a", "b"):
+            self.pubsub.publish(channel)
+        self.assertEqual(self.subscription.get(0), set(["a", "b"]))
+        self.assertEqual(self.subscription.get(0), set())
+    
+    def test_wait(self):
+        start = time.time()
+        self.assertEqual(self.subscription.get(0.1), set())
+        self.assertGreaterEqual(time.time() - start, 0.1)
+        
+        timer = threading.Timer(0.1, self.pubsub.publish, ["b"])
+        timer.start()
+        self.assertEqual(self.subscription.get(5), set(["b"]))
+        timer.join()
+    
+    def test_close(self):
+        self.subscription.close()
+        self.pubsub.publish("a")
+        self.assertEqual(self.subscription.get(0), set())
+        self.assertEqual(self.pubsub._subscriptions, {})
+
+
+class StreamTest(TransactionTestCase):
+    """
+    Runs in a TransactionTestCase, since the stream closes its
+    database connection while it waits for changes.
+    """
+    fixtures = FIXTURES
+    
+    def setUp(self):
+        self.sources = {"data": {"queryset": OtherData.objects.values("name", "number1").order_by("pk"),
+                                 "watermark": "pk"}}
+        self.responses = []
+    
+    def tearDown(self):
+        # closes the subscriptions of the streams
+        for response in self.responses:
+            response.close()
+    
+    def open(self, headers=None, **kwargs):
+        request = RequestFactory().get("/stream/", kwargs.pop("params", {}), **(headers or {}))
+        response = stream(request, self.sources, **dict({"window": 0.05, "heartbeat": 0.05}, **kwargs))
+        self.assertEqual(response["Content-Type"], "text/event-stream; charset=utf-8")
+        self.responses.append(response)
+        return iter(response.streaming_content)
+    
+    def create(self, name, number1=1):
+        return OtherData.objects.create(name=name, number1=number1, number2=1, date=datetime.date(2010, 10, 9))
+    
+    def assertRows(self, chunk, names):
+        event = _parse_event(chunk)
+        self.assertEqual(event["event"], "data")
+        rows = json.loads(event["data"])["rows"]
+        self.assertEqual([row["c"][0]["v"] for row in rows], names)
+        return event
+    
+    def test_push_after_save(self):
+        events = self.open()
+        self.assertEqual(next(events), ": heartbeat\n\n")
+        obj = self.create("Zed")
+        event = self.assertRows(next(events), ["Zed"])
+        self.assertEqual(QueryDict(event["id"])["data"], str(obj.pk))
+        self.assertEqual(json.loads(event["data"])["p"], {"watermark": str(obj.pk)})
+    
+    def test_coalesced(self):
+        """
+        Changes made within the window are pushed as one event,
+        and only heartbeats are sent while nothing changes.
+        """
+        events = self.open()
+        next(events)
+        for name in ("Yan", "Zed"):
+            self.create(name)
+        threading.Timer(0.02, self.create, ["Xi"]).start()
+        self.assertRows(next(events), ["Yan", "Zed", "Xi"])
+        self.assertEqual(next(events), ": heartbeat\n\n")
+        self.assertEqual(next(events), ": heartbeat\n\n")
+    
+    def test_resume(self):
+        """
+        Browsers passing watermarks, in request parameters or in
+        Last-Event-ID, get the rows added since right away.
+        """
+        last = OtherData.objects.order_by("-pk")[0]
+        self.create("Zed")
+        self.assertRows(next(self.open(params={"data": last.pk})), ["Zed"])
+        self.assertRows(next(self.open(headers={"HTTP_LAST_EVENT_ID": "data=%d" % last.pk})), ["Zed"])
+    
+    def test_lifetime(self):
+        """
+        The stream ends after its lifetime, with the watermarks the
+        browser reconnects with.
+        """
+        start = time.time()
+        chunks = list(self.open(lifetime=0.2))
+        self.assertLess(time.time() - start, 1)
+        self.assertIn(": heartbeat\n\n", chunks)
+        last = OtherData.objects.order_by("-pk")[0]
+        self.assertEqual(_parse_event(chunks[-1]), {"id": "data=%d" % last.pk})
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+
+from django.db.models import Count, Sum
+
+from demosite.models import OtherData
+from gcharts import timeseries
+from gcharts.tests.base import GChartsTestCase
+
+
+class TimeseriesTest(GChartsTestCase):
+    
+    def test_fill_gaps(self):
+        day = datetime.date(2010, 10, 9)
+        rows = [(day, 1), (day + datetime.timedelta(days=3), 2)]
+        self.assertEqual(list(timeseries.fill_gaps(rows, 0, "day", fill=0)),
+                         [(day, 1), (day + datetime.timedelta(days=1), 0),
+                          (day + datetime.timedelta(days=2), 0), (day + datetime.timedelta(days=3), 2)])
+        months = [(datetime.date(2010, 11, 1), 1), (datetime.date(2011, 2, 1), 2)]
+        self.assertEqual([row[0].month for row in timeseries.fill_gaps(months, 0, "month")], [11, 12, 1, 2])
+        self.assertEqual(list(timeseries.fill_gaps(reversed(rows), 0, "day", descending=True))[1],
+                         (day + datetime.timedelta(days=2), None))
+    
+    def test_timeseries(self):
+        OtherData.objects.filter(date__in=[datetime.date(2010, 10, 12), datetime.date(2010, 10, 13)]).delete()
+        qset = OtherData.objects.timeseries("date", "day", {"total": Sum("number1"), "n": Count("id")}, fill=0)
+        rows = [[cell["v"] for cell in row["c"]]
+                for row in json.loads(qset.to_json(order=("date__day", "total", "n")))["rows"]]
+        days = [row[0] for row in rows]
+        self.assertEqual(days[:5], ["Date(2010,9,9)", "Date(2010,9,10)", "Date(2010,9,11)",
+                                    "Date(2010,9,12)", "Date(2010,9,13)"])
+        self.assertEqual(rows[3][1:], [0, 0])
+        self.assertEqual(rows[0][1], sum(OtherData.objects.filter(date=datetime.date(2010, 10, 9))
+                                         .values_list("number1", flat=True)))
+    
+    def test_weeks(self):
+        qset = OtherData.objects.timeseries("date", "week", {"n": Count("id")})
+        rows = json.loads(qset.to_json(order=("date__week", "n")))["rows"]
+        self.assertEqual(rows[0]["c"][0]["v"], "Date(2010,9,4)")
+        self.assertEqual(sum(row["c"][1]["v"] for row in rows), OtherData.objects.count())
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+
+from django.db.models import Avg
+from django.test.client import RequestFactory
+
+from demosite.models import OtherData
+from gcharts.tests.base import GChartsTestCase
+from gcharts.views import datasource
+
+
+def _response_json(content):
+    """
+    Return the object passed to the response handler.
+    """
+    return json.loads(content[content.index("(") + 1:content.rindex(")")])
+
+
+class DatasourceTest(GChartsTestCase):
+    
+    def setUp(self):
+        super(DatasourceTest, self).setUp()
+        self.factory = RequestFactory()
+    
+    def get(self, queryset=None, headers=None, **params):
+        if queryset is None:
+            queryset = OtherData.objects.values("date", "name", "number1").order_by("date", "name")
+        request = self.factory.get("/data/", params, **(headers or {}))
+        return datasource(request, queryset)
+    
+    def test_query(self):
+        response = self.get(tq="select name, sum(number1) group by name order by name limit 3",
+                            tqx="reqId:7")
+        self.assertEqual(response["Content-Type"], "text/javascript; charset=utf-8")
+        data = _response_json(response.content)
+        self.assertEqual((data["status"], data["reqId"]), ("ok", "7"))
+        self.assertEqual([col["id"] for col in data["table"]["cols"]], ["name", "number1__sum"])
+        self.assertEqual(len(data["table"]["rows"]), 3)
+    
+    def test_invalid_query(self):
+        data = _response_json(self.get(tq="select bogus").content)
+        self.assertEqual((data["status"], data["errors"][0]["reason"]), ("error", "invalid_query"))
+        data = _response_json(self.get(OtherData.objects.all()[:5], tq="where number1 > 1").content)
+        self.assertEqual(data["errors"][0]["reason"], "invalid_query")
+        for tq in ("where number1 = 'abc'", "where date > 5", "format name '{0:d}'", "where name matches '('"):
+            data = _response_json(self.get(tq=tq).content)
+            self.assertEqual(data["errors"][0]["reason"], "invalid_query", tq)
+    
+    def test_failed_query(self):
+        """
+        Queries which fail when they are run are invalid too, but
+        a data source failing on its own is not.
+        """
+        queryset = OtherData.objects.values("name").annotate(avg=Avg("number1")).order_by("name")
+        data = _response_json(self.get(queryset, tq="format avg '{0:d}'").content)
+        self.assertEqual(data["errors"][0]["reason"], "invalid_query")
+        request = self.factory.get("/data/")
+        self.assertRaises(ValueError, datasource, request, queryset, formatting={"avg": "{0:d}"})
+    
+    def test_output_formats(self):
+        self.assertEqual(self.get(tqx="out:csv").content.splitlines()[0], "date,name,number1")
+        self.assertEqual(self.get(tqx="out:html")["Content-Type"], "text/html; charset=utf-8")
+        # errors can only be reported in json
+        self.assertEqual(self.get(tqx="out:xml").status_code, 400)
+        data = _response_json(self.get(tqx="version:0.5").content)
+        self.assertEqual(data["errors"][0]["reason"], "not_supported")
+    
+    def test_response_handler(self):
+        self.assertTrue(self.get(tqx="responseHandler:my.handler").content.startswith("my.handler({"))
+        for handler in ("alert(document.cookie);//", "x\n", "1x"):
+            content = self.get(tqx="responseHandler:" + handler).content
+            self.assertTrue(content.startswith("google.visualization.Query.setResponse({"), handler)
+    
+    def test_signature(self):
+        """
+        Clients sending the signature of the data they have get a
+        not_modified response, and conditional requests a 304.
+        """
+        response = self.get()
+        sig = _response_json(response.content)["sig"]
+        self.assertEqual(response["ETag"], '"%s"' % sig)
+        
+        data = _response_json(self.get(tqx="sig:%s" % sig).content)
+        self.assertEqual(data["errors"][0]["reason"], "not_modified")
+        self.assertNotIn("table", data)
+        self.assertEqual(self.get(headers={"HTTP_IF_NONE_MATCH": response["ETag"]}).status_code, 304)
+        
+        OtherData.objects.create(name="Zed", number1=1, number2=1, date=datetime.date(2010, 10, 9))
+        self.assertEqual(_response_json(self.get(tqx="sig:%s" % sig).content)["status"], "ok")
+        self.assertEqual(self.get(headers={"HTTP_IF_NONE_MATCH": response["ETag"]}).status_code, 200)
+    
+    def test_since(self):
+        queryset = OtherData.objects.values("date", "number1").order_by("date")
+        request = lambda **params: _response_json(
+            datasource(self.factory.get("/data/", params), queryset, watermark="date").content)
+        data = request()
+        watermark = data["table"]["p"]["watermark"]
+        self.assertEqual(len(data["table"]["rows"]), OtherData.objects.count())
+        self.assertEqual(request(since=watermark)["table"]["rows"], [])
+        
+        OtherData.objects.create(name="Zed", number1=1, number2=1, date=datetime.date(2010, 10, 28))
+        data = request(since=watermark)
+        self.assertEqual(data["table"]["rows"], [{"c": [{"v": "Date(2010,9,28)"}, {"v": 1}]}])
+        self.assertNotEqual(data["table"]["p"]["watermark"], watermark)
+        
+        self.assertEqual(request(since="garbage")["errors"][0]["reason"], "invalid_request")
+        self.assertEqual(self.get(since=watermark).content.count("invalid_request"), 1)
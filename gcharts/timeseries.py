@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+
+from django.utils import six
+from django.utils.dateparse import parse_date, parse_datetime
+
+INTERVALS = ("hour", "day", "week", "month", "year")
+
+# Length of the intervals of fixed length, in seconds
+_SECONDS = {"hour": 3600, "day": 86400, "week": 604800}
+
+
+def truncate_sql(connection, interval, column):
+    """
+    Return SQL truncating the dates in column to the start of
+    their interval on connection. Weeks start on Mondays.
+    """
+    # date_trunc_sql() of the backends doesn't handle weeks, nor
+    # hours on SQLite and Oracle.
+    vendor = connection.vendor
+    if interval == "week":
+        if vendor == "sqlite":
+            return "date(%s, 'weekday 0', '-6 days')" % column
+        if vendor == "mysql":
+            return "DATE_SUB(DATE(%s), INTERVAL WEEKDAY(%s) DAY)" % (column, column)
+        if vendor == "oracle":
+            return "TRUNC(%s, 'IW')" % column
+    elif interval == "hour":
+        if vendor == "sqlite":
+            # Use double percents to escape.
+            return "strftime('%s', %s)" % ("%%Y-%%m-%%d %%H:00:00", column)
+        if vendor == "oracle":
+            return "TRUNC(%s, 'HH24')" % column
+    return connection.ops.date_trunc_sql(interval, column)
+
+
+def javascript_type(interval):
+    """
+    Return the javascript data type of the dates truncated to
+    interval.
+    """
+    return interval == "hour" and "datetime" or "date"
+
+
+def bucket_value(value, interval):
+    """
+    Return a date truncated by truncate_sql() as a datetime for
+    hours, and as a date for the other intervals, whatever type
+    the database driver returned it as.
+    """
+    if isinstance(value, six.string_types):
+        value = parse_datetime(value) or parse_date(value)
+    if interval == "hour":
+        if value is not None and not isinstance(value, datetime.datetime):
+            value = datetime.datetime.combine(value, datetime.time())
+    elif isinstance(value, datetime.datetime):
+        value = value.date()
+    return value
+
+
+def _step(bucket, interval, steps):
+    if interval == "month":
+        month = bucket.month - 1 + steps
+        return bucket.replace(year=bucket.year + month // 12, month=month % 12 + 1)
+    if interval == "year":
+        return bucket.replace(year=bucket.year + steps)
+    return bucket + datetime.timedelta(**{interval + "s": steps})
+
+
+def bucket_count(first, last, interval):
+    """
+    Return the number of intervals from first to last, both
+    included.
+    """
+    first, last = min(first, last), max(first, last)
+    if interval == "month":
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    if interval == "year":
+        return last.year - first.year + 1
+    return int((last - first).total_seconds()) // _SECONDS[interval] + 1
+
+
+def fill_gaps(rows, x, interval, fill=None, descending=False):
+    """
+    Fill in a row for every interval missing between the rows,
+    in a single pass over the rows.
+
+    kwargs:
+        rows:   Iterable of row tuples, ordered by column x.
+        x:      Index of the column of the dates truncated by
+                truncate_sql(), which are returned by
+                bucket_value().
+        interval: Interval the dates are truncated to.
+        fill:   Value of the other columns of the rows filled in.
+        descending: True if the rows are in descending order.
+    """
+    steps = descending and -1 or 1
+    previous = None
+    for row in rows:
+        bucket = bucket_value(row[x], interval)
+        if bucket is not None:
+            if previous is not None:
+                missing = _step(previous, interval, steps)
+                while (missing > bucket) if descending else (missing < bucket):
+                    filler = [fill] * len(row)
+                    filler[x] = missing
+                    yield tuple(filler)
+                    missing = _step(missing, interval, steps)
+            previous = bucket
+        yield row[:x] + (bucket,) + row[x + 1:]
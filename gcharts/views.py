@@ -1 +1,268 @@
-# Create your views here.
+# -*- coding: utf-8 -*-
+
+import hashlib
+import time
+
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import DatabaseError, connections
+from django.http import HttpResponse, HttpResponseNotModified, QueryDict, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag, urlencode
+from django.views.decorators.http import require_GET
+
+from gcharts import _GChartsConfig
+from gcharts.contrib import gviz_api
+from gcharts.query import InvalidQuery, parse
+
+CONTENT_TYPES = {
+    "json": "text/javascript; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "html": "text/html; charset=utf-8",
+    "tsv-excel": "text/tab-separated-values; charset=utf-16le",
+}
+
+
+def _error_response(tqx_dict, reason, message):
+    """
+    Return an error response for the Google Visualization API.
+    Errors can only be reported to the client in json, for other
+    output formats a plain text message is returned.
+    """
+    if tqx_dict["out"] != "json":
+        return HttpResponse(message, status=400, content_type="text/plain; charset=utf-8")
+    response = {
+        "version": "0.6",
+        "reqId": tqx_dict["reqId"],
+        "status": "error",
+        "errors": [{"reason": reason, "message": message}],
+    }
+    content = "".join([tqx_dict["responseHandler"].encode("utf-8"), "(",
+                       _GChartsConfig.get_json_backend().Dumps(response), ");"])
+    return HttpResponse(content, content_type=CONTENT_TYPES["json"])
+
+
+@require_GET
+def datasource(request, queryset, order=None, labels=None, formatting=None, properties=None,
+               watermark=None):
+    """
+    A Google Visualization API data source serving queryset.
+
+    The query in the tq request parameter is compiled into
+    queryset, so only the rows and columns asked for are read
+    from the database. The output format is chosen by the tqx
+    request parameter.
+
+    Clients which send the signature of the data they already
+    have in tqx (sig:<signature>) get a not_modified response
+    if the data is unchanged. The signature is also sent as the
+    ETag of the response, so conditional requests by browsers
+    and proxies are answered with 304 Not Modified.
+
+    If watermark is given, the greatest value of the watermark
+    field in the rows is returned in the watermark property of
+    the table, and clients which send it back in the since
+    request parameter get only the rows added since, see
+    GChartsQuerySet.since().
+
+    Hook it up in urls.py, passing the queryset and any of the
+    kwargs below in the extra options dict, e.g:
+        url(r"^spam/data/$", "gcharts.views.datasource",
+            {"queryset": Spam.objects.all(), "labels": {"name": "Name"}})
+
+    kwargs:
+        queryset: The GChartsQuerySet to serve. Only its columns
+                can be referred to in the query.
+        order:  Default column order, used if the query has no
+                select clause.
+        labels: Dictionary mapping {'field': 'label'}
+                where field is the name of the field in model,
+                and label is the desired label on the chart.
+        formatting: string.format() compatible expression.
+        properties: Dictionary with custom properties.
+        watermark: Name of a field which never decreases as rows
+                are added, e.g. "pk" or a creation date.
+    """
+    tqx_dict = gviz_api.DataTable.ParseTqx(request.GET.get("tqx", ""))
+    out = tqx_dict["out"]
+    if tqx_dict["version"] != "0.6":
+        return _error_response(tqx_dict, "not_supported",
+                               "Version (%s) passed by request is not supported." % tqx_dict["version"])
+    if out not in CONTENT_TYPES:
+        return _error_response(tqx_dict, "not_supported", "'out' parameter: '%s' is not supported" % out)
+
+    since = request.GET.get("since") or None
+    if since is not None and watermark is None:
+        return _error_response(tqx_dict, "invalid_request", "This data source doesn't support 'since'")
+
+    qset = queryset.all()
+    if watermark is not None:
+        try:
+            qset, since = qset.since(watermark, since)
+        except (ValidationError, ValueError):
+            return _error_response(tqx_dict, "invalid_request", "Invalid 'since' parameter: '%s'" % since)
+        properties = dict(properties or {}, watermark=since)
+
+    tq = request.GET.get("tq", "")
+    try:
+        query = parse(tq)
+        qset, query_order, labels, formatting = query.compile(qset, labels, formatting)
+    except InvalidQuery as e:
+        return _error_response(tqx_dict, "invalid_query", str(e))
+
+    order = query_order or order
+    formatting = formatting or None
+    try:
+        if out == "json":
+            table_json = qset.to_json(order, labels, formatting, properties)
+            etag = gviz_api.DataTable.Signature(table_json)
+            content = gviz_api.DataTable.JSonResponse(table_json, tqx_dict["reqId"],
+                                                      tqx_dict["responseHandler"], tqx_dict["sig"])
+        else:
+            if out == "html":
+                content = qset.to_html(order, labels, formatting, properties)
+            elif out == "csv":
+                content = qset.to_csv(order, labels, formatting, properties)
+            else:
+                content = qset.to_tsv_excel(order, labels, formatting, properties)
+            etag = hashlib.md5(content).hexdigest()
+    except (DatabaseError, gviz_api.DataTableException, OverflowError, TypeError, ValueError) as e:
+        # Errors running or serializing the query the client sent,
+        # e.g. formatting a float as an integer. Without one, the
+        # data source itself is broken.
+        if not tq:
+            raise
+        return _error_response(tqx_dict, "invalid_query", "Can't run the query: %s" % e)
+
+    if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type=CONTENT_TYPES[out])
+    response["ETag"] = quote_etag(etag)
+    return response
+
+
+def _event(name, data, watermarks):
+    """
+    Return a Server-Sent Event named name with data, whose id
+    holds the watermarks of all the sources of the stream.
+    Without a name, only the id is sent, which browsers keep
+    for Last-Event-ID without dispatching an event.
+    """
+    watermarks = sorted((key, value) for key, value in watermarks.items() if value is not None)
+    lines = ["id: %s" % urlencode(watermarks)]
+    if name is not None:
+        lines.append("event: %s" % name)
+        lines.extend("data: %s" % line for line in data.splitlines())
+    return "\n".join(lines) + "\n\n"
+
+
+def _release_connections(sources):
+    # Don't keep a database connection, nor the snapshot of an open
+    # transaction, while waiting for changes. In-memory SQLite
+    # databases only live as long as their connection.
+    for alias in set(source["queryset"].db for source in sources.values()):
+        conn = connections[alias]
+        if not (conn.vendor == "sqlite" and conn.settings_dict["NAME"] in ("", ":memory:")):
+            conn.close()
+
+
+@require_GET
+def stream(request, sources, window=1.0, heartbeat=15.0, lifetime=300.0):
+    """
+    A Server-Sent Events stream pushing the rows added to the
+    querysets of sources to the browser, over a single long-lived
+    connection, so charts are updated without polling.
+
+    Rows are read past a watermark, see GChartsQuerySet.since().
+    The browser passes the watermarks of the data of its charts
+    in request parameters named after the sources. Sources
+    without one only get the rows added after connecting.
+
+    Whenever the tables of a queryset are changed, see
+    gcharts.notify_changes(), its rows past the watermark are
+    pushed as an event named after the source, with the rows in
+    the same JSON format as to_json(). Changes are coalesced over
+    window seconds, so a burst of writes is pushed as one batch.
+    The id of the events holds the watermarks, so a browser
+    reconnecting with Last-Event-ID resumes where it left off.
+    
+    Each open stream holds a worker of the web server, and the
+    stream ends after lifetime seconds, so workers are freed
+    from clients which went away without the server noticing.
+    Browsers reconnect by themselves.
+
+    Hook it up in urls.py, passing the sources in the extra
+    options dict, e.g:
+        url(r"^spam/stream/$", "gcharts.views.stream",
+            {"sources": {"spam": {"queryset": Spam.objects.values("cdt", "price"),
+                                  "watermark": "cdt"}}})
+
+    kwargs:
+        sources: Dictionary mapping {'name': source}, where source
+                is a dictionary with the queryset and watermark
+                of the rows, and optionally the order, labels,
+                formatting and properties, like the kwargs of
+                datasource().
+        window: Seconds to coalesce changes over.
+        heartbeat: Seconds between comments sent while there are
+                no changes, which keep the connection open.
+        lifetime: Seconds after which the stream ends, or None
+                to keep it open as long as the client does.
+    """
+    for name, source in sources.items():
+        if "queryset" not in source or "watermark" not in source:
+            raise ImproperlyConfigured("Source %s of stream needs a queryset and a watermark" % name)
+
+    last = request.META.get("HTTP_LAST_EVENT_ID")
+    params = QueryDict(last, encoding="utf-8") if last else request.GET
+    watermarks = dict((name, params.get(name) or None) for name in sources)
+    tables = {}
+    for name, source in sources.items():
+        model = source["queryset"].model
+        tables[name] = set(m._meta.db_table for m in [model] + list(model._meta.get_parent_list()))
+
+    def events():
+        subscription = _GChartsConfig.get_pubsub().subscribe(set.union(*tables.values()))
+        deadline = None if lifetime is None else time.time() + lifetime
+        try:
+            changed = set(name for name in sources if watermarks[name] is not None)
+            for name in sources:
+                if watermarks[name] is None:
+                    watermarks[name] = sources[name]["queryset"].all().since(sources[name]["watermark"])[1]
+            while True:
+                for name in sorted(changed):
+                    source = sources[name]
+                    qset, watermark = source["queryset"].all().since(source["watermark"], watermarks[name])
+                    if watermark == watermarks[name]:
+                        continue
+                    properties = dict(source.get("properties") or {}, watermark=watermark)
+                    data = qset.to_json(source.get("order"), source.get("labels"), source.get("formatting"),
+                                        properties)
+                    watermarks[name] = watermark
+                    yield _event(name, data, watermarks)
+                changed = set()
+                _release_connections(sources)
+
+                timeout = heartbeat
+                if deadline is not None:
+                    if time.time() >= deadline:
+                        # Send the watermarks of the sources which had no
+                        # events, so the browser reconnects with all of them
+                        yield _event(None, None, watermarks)
+                        return
+                    timeout = min(heartbeat, deadline - time.time())
+                tables_changed = subscription.get(timeout)
+                if not tables_changed:
+                    yield ": heartbeat\n\n"
+                    continue
+                time.sleep(window)
+                tables_changed |= subscription.get(0)
+                changed = set(name for name in sources if tables[name] & tables_changed)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream; charset=utf-8")
+    response["Cache-Control"] = "no-cache"
+    # Don't let nginx buffer the events
+    response["X-Accel-Buffering"] = "no"
+    return response
+
@@ -17,6 +17,8 @@ setup(
         "gcharts",
         "gcharts.tests",
         "gcharts.contrib",
+        "gcharts.management",
+        "gcharts.management.commands",
         "gcharts.templatetags",
     ],
     package_data = {